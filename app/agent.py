@@ -1,75 +1,82 @@
+import asyncio
 import json
 import os
+import time
+from dataclasses import dataclass, field
 from datetime import datetime
-import tiktoken
+from typing import AsyncIterator, Dict, List, Optional
 import openai
 import logging
-from app.security.data_anonymizer import get_anonymizer
+from app.security.data_anonymizer import get_anonymizer, AnonymizationStats
+from app.llm_client import get_llm_client
+from app.chunking import FusionResultados, fusionar_resultados
+from app.json_stream import JSONArrayStreamParser
+from app.token_budget import TokenBudget
+from app.prompts import get_prompt_registry
+from app.normalizer import NORMALIZE_TEXT, NormalizationStats, normalizar_texto
+from app.telemetry import etapa, registrar_tokens, traza_actual
+from app.audit import AUDIT_MAX_CONTENT_CHARS, get_audit_sink
 
 logger = logging.getLogger(__name__)
 
 # Clau d'API d'OpenAI carregada des del fitxer .env
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-with open(os.path.join(os.path.dirname(__file__), "prompt.txt"), encoding="utf-8") as f:
-    PROMPT_BASE = f.read()
-
-with open(os.path.join(os.path.dirname(__file__), "prompt_dades_venda.txt"), encoding="utf-8") as f:
-    PROMPT_DADES_VENDA = f.read()
-
 MODEL_NAME = "gpt-4o"
+
 MAX_TOTAL_TOKENS = 128000
 MAX_OUTPUT_TOKENS = 4096
 TOKEN_SAFETY_MARGIN = 1000
 
-def contar_tokens(modelo, texto):
-    try:
-        encoding = tiktoken.encoding_for_model(modelo)
-    except Exception:
-        encoding = tiktoken.get_encoding("cl100k_base")
-    
-    return len(encoding.encode(texto))
+# Tokens de documento por trozo en cada endpoint (0 = trocear solo si no cabe en el contexto)
+CHUNK_TOKENS = {
+    "documento": int(os.getenv("CHUNK_TOKENS_DOCUMENTO", "0")),
+    "dades_venda": int(os.getenv("CHUNK_TOKENS_DADES_VENDA", "0")),
+}
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", "4"))
 
-async def procesar_documento(texto_extraido: str, proveedor: str = None, anonymize: bool = True) -> list:
-    logger.info(f"Procesando documento para proveedor: {proveedor or 'No especificado'}")
-    
-    if anonymize:
-        anonymizer = get_anonymizer()
-        texto_seguro, stats = anonymizer.anonymize(texto_extraido, proveedor)
-        logger.info(f"Datos anonimizados: {stats.total_replacements} elementos")
-    else:
-        texto_seguro = texto_extraido
-        logger.warning("Anonimización DESACTIVADA: se enviarán datos sensibles a OpenAI")
-    
-    prompt = PROMPT_BASE.replace("{documento_extraido}", texto_seguro)
-    
-    prompt_tokens = contar_tokens(MODEL_NAME, prompt)
-    logger.info(f"Tokens en prompt: {prompt_tokens}")
-
-    if prompt_tokens + MAX_OUTPUT_TOKENS > (MAX_TOTAL_TOKENS - TOKEN_SAFETY_MARGIN):
-        exceso = prompt_tokens + MAX_OUTPUT_TOKENS - (MAX_TOTAL_TOKENS - TOKEN_SAFETY_MARGIN)
-        logger.warning(f"El prompt excede el límite de tokens. Recortando {exceso} tokens...")
-        texto_seguro = texto_seguro[:-exceso*4]
-        prompt = PROMPT_BASE.replace("{documento_extraido}", texto_seguro)
+LOG_PATHS = {
+    "documento": "logs/openai_requests.jsonl",
+    "dades_venda": "logs/openai_requests_dades_venda.jsonl",
+}
 
-    try:
-        os.makedirs("logs", exist_ok=True)
-        with open("logs/openai_requests.txt", "a", encoding="utf-8") as f:
-            f.write(f"\n{'='*80}\n{datetime.now():%Y-%m-%d %H:%M:%S}\n")
-            f.write(f"Proveedor: {proveedor or 'No especificado'} | Anonimizado: {anonymize}\n")
-            f.write(f"{'-'*80}\n{prompt[:3000]}...\n")
-    except Exception as e:
-        logger.warning(f"No se pudo guardar el log: {e}")
+_token_budget = None
 
-    response = openai.ChatCompletion.create(
-        model=MODEL_NAME,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0,
-        max_tokens=MAX_OUTPUT_TOKENS
-    )
+def get_token_budget() -> TokenBudget:
+    global _token_budget
+    if _token_budget is None:
+        _token_budget = TokenBudget(MODEL_NAME, MAX_TOTAL_TOKENS, MAX_OUTPUT_TOKENS, TOKEN_SAFETY_MARGIN)
+    return _token_budget
+
+
+def precalentar_tokenizador():
+    # Carga el encoding y precalcula los tokens de las plantillas antes de la primera petición
+    budget = get_token_budget()
+    for plantilla in get_prompt_registry().plantillas():
+        budget.tokens_plantilla(plantilla.fijo)
+    logger.info(f"Tokenizador {budget.encoding.name} listo para {MODEL_NAME}")
 
-    resultado = response.choices[0].message.content.strip()
 
+@dataclass
+class ExtractionResult:
+    items: List = field(default_factory=list)
+    anonymization: Optional[AnonymizationStats] = None
+    normalization: Optional[NormalizationStats] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    chunks: int = 1
+    document_tokens: int = 0
+    prompt_version: str = ""
+    # Tokens de entrada estimados de cada llamada, para los límites por minuto del LLM
+    tokens_peticiones: List[int] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def tokens_dict(self) -> Dict:
+        return {"prompt": self.prompt_tokens, "completion": self.completion_tokens, "trozos": self.chunks}
+
+
+def parsear_respuesta(resultado: str) -> list:
+    resultado = resultado.strip()
     for marker in ("```json", "```"):
         if resultado.startswith(marker):
             resultado = resultado[len(marker):].strip()
@@ -89,60 +96,228 @@ async def procesar_documento(texto_extraido: str, proveedor: str = None, anonymi
         return []
 
 
-async def procesar_dades_venda(texto_extraido: str, proveedor: str = None, anonymize: bool = True) -> list:
-    logger.info(f"Procesando dades venda para proveedor: {proveedor or 'No especificado'}")
-    
+async def _llamar_llm(mensajes: List[Dict[str, str]], prompt_tokens: int, semaforo: asyncio.Semaphore):
+    async with semaforo:
+        with etapa("llm", "chat"):
+            response = await get_llm_client().chat(
+                messages=mensajes,
+                model=MODEL_NAME,
+                max_tokens=MAX_OUTPUT_TOKENS,
+                temperature=0,
+                prompt_tokens=prompt_tokens
+            )
+    usage = response.get("usage") or {}
+    return (
+        parsear_respuesta(response.choices[0].message.content),
+        usage.get("prompt_tokens", 0),
+        usage.get("completion_tokens", 0),
+    )
+
+
+def _normalizar(texto: str):
+    budget = get_token_budget()
+    stats = NormalizationStats()
+    normalizado = normalizar_texto(texto, stats)
+    stats.tokens_antes = budget.contar(texto)
+    stats.tokens_despues = budget.contar(normalizado)
+    return normalizado, stats
+
+
+async def _preparar_peticiones(texto_extraido: str, proveedor: Optional[str], anonymize: bool,
+                               tipo: str, chunk_tokens: int, result: ExtractionResult,
+                               normalize: Optional[bool] = None) -> List[List[Dict[str, str]]]:
+    if normalize is None:
+        normalize = NORMALIZE_TEXT
+    if normalize:
+        # Antes de anonimizar: menos texto que recorrer y menos tokens que enviar
+        t = time.perf_counter()
+        with etapa("normalizacion"):
+            texto_extraido, stats = await asyncio.to_thread(_normalizar, texto_extraido)
+        result.normalization = stats
+        result.timings["normalizacion"] = time.perf_counter() - t
+        logger.info(f"Texto normalizado: {stats.tokens_antes} -> {stats.tokens_despues} tokens")
+
+    inicio = time.perf_counter()
     if anonymize:
         anonymizer = get_anonymizer()
-        texto_seguro, stats = anonymizer.anonymize(texto_extraido, proveedor)
+        texto_seguro, stats = await asyncio.to_thread(anonymizer.anonymize, texto_extraido, proveedor)
+        result.anonymization = stats
         logger.info(f"Datos anonimizados: {stats.total_replacements} elementos")
     else:
         texto_seguro = texto_extraido
         logger.warning("Anonimización DESACTIVADA: se enviarán datos sensibles a OpenAI")
-    
-    prompt = PROMPT_DADES_VENDA.replace("{documento_extraido}", texto_seguro)
-    
-    prompt_tokens = contar_tokens(MODEL_NAME, prompt)
-    logger.info(f"Tokens en prompt: {prompt_tokens}")
-
-    if prompt_tokens + MAX_OUTPUT_TOKENS > (MAX_TOTAL_TOKENS - TOKEN_SAFETY_MARGIN):
-        exceso = prompt_tokens + MAX_OUTPUT_TOKENS - (MAX_TOTAL_TOKENS - TOKEN_SAFETY_MARGIN)
-        logger.warning(f"El prompt excede el límite de tokens. Recortando {exceso} tokens...")
-        texto_seguro = texto_seguro[:-exceso*4]
-        prompt = PROMPT_DADES_VENDA.replace("{documento_extraido}", texto_seguro)
+    result.timings["anonimizacion"] = time.perf_counter() - inicio
+
+    # Los documentos largos se trocean por líneas en vez de recortarse, y los trozos
+    # se extraen en paralelo
+    t = time.perf_counter()
+    plantilla = get_prompt_registry().get(tipo, proveedor)
+    with etapa("tokens"):
+        chunks, tokens_documento = await asyncio.to_thread(get_token_budget().trocear, texto_seguro, plantilla.fijo, chunk_tokens)
+    result.document_tokens = tokens_documento
+    logger.info(f"Tokens en documento: {tokens_documento}")
+    peticiones = [plantilla.mensajes(chunk) for chunk in chunks]
+    # Con varios trozos el recuento del documento se reparte por caracteres
+    tokens_plantilla = get_token_budget().tokens_plantilla(plantilla.fijo)
+    caracteres = sum(len(chunk) for chunk in chunks) or 1
+    result.tokens_peticiones = [tokens_plantilla + -(-tokens_documento * len(chunk) // caracteres) for chunk in chunks]
+    result.chunks = len(peticiones)
+    result.timings["tokens"] = time.perf_counter() - t
+    result.prompt_version = plantilla.version
+    if len(peticiones) > 1:
+        logger.info(f"Documento dividido en {len(peticiones)} trozos")
+
+    return peticiones
+
+
+def _auditar(tipo: str, proveedor: Optional[str], anonymize: bool, peticiones: List[List[Dict[str, str]]],
+             result: ExtractionResult, error: Optional[str] = None):
+    # Se encola y vuelve; la escritura y la rotación las hace el hilo de auditoría
+    actual = traza_actual()
+    get_audit_sink().registrar(LOG_PATHS[tipo], {
+        "fecha": datetime.now().isoformat(timespec="milliseconds"),
+        "trace_id": actual.id if actual is not None else None,
+        "tipo": tipo,
+        "proveedor": proveedor,
+        "anonimizado": anonymize,
+        "normalizado": result.normalization is not None,
+        "version_plantilla": result.prompt_version,
+        "trozos": len(peticiones),
+        "peticion": peticiones[0][-1]["content"][:AUDIT_MAX_CONTENT_CHARS] if peticiones else "",
+        "respuesta": result.items,
+        "tokens": result.tokens_dict(),
+        "tiempos": dict(result.timings),
+        "error": error,
+    })
+
 
+async def _ejecutar_extraccion(texto_extraido: str, proveedor: Optional[str], anonymize: bool,
+                               tipo: str, chunk_tokens: int, paralelismo: Optional[int] = None,
+                               normalize: Optional[bool] = None) -> ExtractionResult:
+    result = ExtractionResult()
+    inicio = time.perf_counter()
+    peticiones = await _preparar_peticiones(texto_extraido, proveedor, anonymize, tipo, chunk_tokens, result, normalize)
+
+    t = time.perf_counter()
+    semaforo = asyncio.Semaphore(paralelismo or CHUNK_CONCURRENCY)
     try:
-        os.makedirs("logs", exist_ok=True)
-        with open("logs/openai_requests_dades_venda.txt", "a", encoding="utf-8") as f:
-            f.write(f"\n{'='*80}\n{datetime.now():%Y-%m-%d %H:%M:%S}\n")
-            f.write(f"Proveedor: {proveedor or 'No especificado'} | Anonimizado: {anonymize}\n")
-            f.write(f"{'-'*80}\n{prompt[:3000]}...\n")
+        respuestas = await asyncio.gather(*(
+            _llamar_llm(mensajes, tokens, semaforo) for mensajes, tokens in zip(peticiones, result.tokens_peticiones)
+        ))
     except Exception as e:
-        logger.warning(f"No se pudo guardar el log: {e}")
+        result.timings["llm"] = time.perf_counter() - t
+        _auditar(tipo, proveedor, anonymize, peticiones, result, str(e) or type(e).__name__)
+        raise
+    result.timings["llm"] = time.perf_counter() - t
 
-    response = openai.ChatCompletion.create(
-        model=MODEL_NAME,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0,
-        max_tokens=MAX_OUTPUT_TOKENS
-    )
+    result.items = fusionar_resultados(items for items, _, _ in respuestas)
+    result.prompt_tokens = sum(prompt_tokens for _, prompt_tokens, _ in respuestas)
+    result.completion_tokens = sum(completion_tokens for _, _, completion_tokens in respuestas)
+    result.timings["total"] = time.perf_counter() - inicio
+    registrar_tokens(tipo, result.prompt_tokens, result.completion_tokens, result.document_tokens)
+    _auditar(tipo, proveedor, anonymize, peticiones, result)
+    return result
 
-    resultado = response.choices[0].message.content.strip()
 
-    for marker in ("```json", "```"):
-        if resultado.startswith(marker):
-            resultado = resultado[len(marker):].strip()
-        if resultado.endswith("```"):
-            resultado = resultado[:-3].strip()
+async def _stream_trozo(trozo: int, mensajes: List[Dict[str, str]], semaforo: asyncio.Semaphore,
+                        cola: asyncio.Queue, result: ExtractionResult):
+    budget = get_token_budget()
+    parser = JSONArrayStreamParser()
+    respuesta = []
+    async with semaforo:
+        with etapa("llm", "stream"):
+            async for texto in get_llm_client().chat_stream(
+                messages=mensajes,
+                model=MODEL_NAME,
+                max_tokens=MAX_OUTPUT_TOKENS,
+                temperature=0,
+                prompt_tokens=result.tokens_peticiones[trozo]
+            ):
+                respuesta.append(texto)
+                for item in parser.feed(texto):
+                    await cola.put((trozo, item))
+
+    # La API en streaming no devuelve usage: se estima con el tokenizador local
+    result.prompt_tokens += sum(budget.contar(m["content"]) for m in mensajes)
+    result.completion_tokens += budget.contar("".join(respuesta))
+    if not parser.completo:
+        logger.warning(f"Respuesta en streaming incompleta en el trozo {trozo}")
 
+
+async def extraer_en_streaming(texto_extraido: str, tipo: str = "documento", proveedor: Optional[str] = None,
+                               anonymize: bool = True, chunk_tokens: Optional[int] = None,
+                               paralelismo: Optional[int] = None,
+                               result: Optional[ExtractionResult] = None,
+                               normalize: Optional[bool] = None) -> AsyncIterator[dict]:
+    # Emite cada item en cuanto el modelo cierra su objeto JSON. Al terminar, `result`
+    # queda con los items fusionados, los tokens y los tiempos como en la versión sin streaming
+    result = result if result is not None else ExtractionResult()
+    inicio = time.perf_counter()
+    if chunk_tokens is None:
+        chunk_tokens = CHUNK_TOKENS[tipo]
+    peticiones = await _preparar_peticiones(texto_extraido, proveedor, anonymize, tipo, chunk_tokens, result, normalize)
+
+    t = time.perf_counter()
+    semaforo = asyncio.Semaphore(paralelismo or CHUNK_CONCURRENCY)
+    cola: asyncio.Queue = asyncio.Queue()
+    fusion = FusionResultados()
+    tareas = [
+        asyncio.create_task(_stream_trozo(trozo, mensajes, semaforo, cola, result))
+        for trozo, mensajes in enumerate(peticiones)
+    ]
+    pendientes = set(tareas)
+    espera: Optional[asyncio.Task] = None
     try:
-        data = json.loads(resultado)
-        if isinstance(data, list):
-            return data
-        else:
-            logger.warning("La respuesta no es un array JSON, devolviendo []")
-            return []
-    except json.JSONDecodeError as e:
-        logger.error(f"Error al parsear JSON: {e}")
-        logger.debug(f"Respuesta bruta: {resultado[:1000]}")
-        return []
\ No newline at end of file
+        while pendientes or not cola.empty():
+            if cola.empty():
+                espera = asyncio.create_task(cola.get())
+                hechas, _ = await asyncio.wait(pendientes | {espera}, return_when=asyncio.FIRST_COMPLETED)
+                for tarea in hechas - {espera}:
+                    pendientes.discard(tarea)
+                    tarea.result()  # propaga el error del trozo
+                if espera not in hechas:
+                    espera.cancel()
+                    continue
+                trozo, item = espera.result()
+            else:
+                trozo, item = cola.get_nowait()
+
+            if fusion.add(trozo, item):
+                if "primer_item" not in result.timings:
+                    result.timings["primer_item"] = time.perf_counter() - inicio
+                yield item
+    except Exception as e:
+        result.items = fusion.items
+        result.timings["llm"] = time.perf_counter() - t
+        _auditar(tipo, proveedor, anonymize, peticiones, result, str(e) or type(e).__name__)
+        raise
+    finally:
+        # También la espera en la cola: el cliente puede desconectarse mientras el generador espera
+        for tarea in tareas + ([espera] if espera is not None else []):
+            tarea.cancel()
+
+    result.items = fusion.items
+    result.timings["llm"] = time.perf_counter() - t
+    result.timings["total"] = time.perf_counter() - inicio
+    registrar_tokens(tipo, result.prompt_tokens, result.completion_tokens, result.document_tokens)
+    _auditar(tipo, proveedor, anonymize, peticiones, result)
+
+
+async def procesar_documento(texto_extraido: str, proveedor: str = None, anonymize: bool = True,
+                             chunk_tokens: Optional[int] = None, paralelismo: Optional[int] = None,
+                             normalize: Optional[bool] = None) -> ExtractionResult:
+    logger.info(f"Procesando documento para proveedor: {proveedor or 'No especificado'}")
+    return await _ejecutar_extraccion(
+        texto_extraido, proveedor, anonymize, "documento",
+        CHUNK_TOKENS["documento"] if chunk_tokens is None else chunk_tokens, paralelismo, normalize
+    )
+
+
+async def procesar_dades_venda(texto_extraido: str, proveedor: str = None, anonymize: bool = True,
+                              chunk_tokens: Optional[int] = None, paralelismo: Optional[int] = None,
+                              normalize: Optional[bool] = None) -> ExtractionResult:
+    logger.info(f"Procesando dades venda para proveedor: {proveedor or 'No especificado'}")
+    return await _ejecutar_extraccion(
+        texto_extraido, proveedor, anonymize, "dades_venda",
+        CHUNK_TOKENS["dades_venda"] if chunk_tokens is None else chunk_tokens, paralelismo, normalize
+    )
@@ -0,0 +1,254 @@
+import fcntl
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Auditoría de las peticiones al LLM en JSONL. Las peticiones solo encolan el registro;
+# un hilo lo escribe por lotes y rota los ficheros por tamaño y antigüedad
+AUDIT_ENABLED = os.getenv("AUDIT_ENABLED", "true").lower() in ("1", "true", "yes")
+AUDIT_MAX_BYTES = int(os.getenv("AUDIT_MAX_BYTES", str(50 * 1024 * 1024)))
+AUDIT_ROTATE_SECONDS = float(os.getenv("AUDIT_ROTATE_SECONDS", str(24 * 3600)))
+# Ficheros rotados (comprimidos) que se conservan por cada log
+AUDIT_BACKUPS = int(os.getenv("AUDIT_BACKUPS", "10"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+# Si el disco no da abasto se descartan registros antes que bloquear las peticiones
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+# Caracteres del prompt que se guardan en cada registro
+AUDIT_MAX_CONTENT_CHARS = int(os.getenv("AUDIT_MAX_CONTENT_CHARS", "3000"))
+
+_FIN = object()
+
+
+class _FicheroRotativo:
+    # Con varios workers de uvicorn todos escriben el mismo fichero: escritura y rotación van
+    # bajo un flock sobre "<log>.lock" y, antes de escribir, se comprueba por inodo que el
+    # fichero abierto sigue siendo el del path (si otro proceso lo rotó, se reabre). El
+    # .lock guarda además cuándo se creó el fichero actual, para rotar por su antigüedad
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = None
+        self._lock_fd: Optional[int] = None
+
+    def _abrir(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if self._lock_fd is None:
+            self._lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        self._f = open(self.path, "a", encoding="utf-8")
+
+    def _vigente(self) -> bool:
+        try:
+            actual = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        propio = os.fstat(self._f.fileno())
+        return (actual.st_dev, actual.st_ino) == (propio.st_dev, propio.st_ino)
+
+    def _creado(self) -> float:
+        try:
+            return float(os.pread(self._lock_fd, 32, 0))
+        except ValueError:
+            # Primer uso del .lock: la antigüedad se cuenta desde ahora
+            creado = time.time()
+            self._marcar_creado(creado)
+            return creado
+
+    def _marcar_creado(self, creado: float):
+        os.ftruncate(self._lock_fd, 0)
+        os.pwrite(self._lock_fd, repr(creado).encode(), 0)
+
+    def escribir(self, lineas: List[str]) -> bool:
+        if self._f is None:
+            self._abrir()
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            if not self._vigente():
+                self._f.close()
+                self._abrir()
+            self._f.write("".join(lineas))
+            self._f.flush()
+            if self._f.tell() < AUDIT_MAX_BYTES and time.time() - self._creado() < AUDIT_ROTATE_SECONDS:
+                return False
+            destino = self._renombrar()
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        # Nadie escribe ya en el renombrado (todos comprueban el inodo bajo el lock): se
+        # comprime fuera para no frenar a los demás workers
+        self._comprimir(destino)
+        return destino is not None
+
+    def rotar(self):
+        if self._f is None:
+            return
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            destino = self._renombrar() if self._vigente() else None
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        self._comprimir(destino)
+
+    def _renombrar(self) -> Optional[str]:
+        # Con el lock tomado y el fichero abierto vigente
+        self._f.close()
+        self._f = None
+        if not os.path.getsize(self.path):
+            return None
+        base, ext = os.path.splitext(self.path)
+        destino = f"{base}.{datetime.now():%Y%m%d-%H%M%S-%f}{ext}"
+        os.replace(self.path, destino)
+        self._marcar_creado(time.time())
+        return destino
+
+    def _comprimir(self, destino: Optional[str]):
+        if destino is None:
+            return
+        with open(destino, "rb") as origen, gzip.open(destino + ".gz", "wb") as comprimido:
+            shutil.copyfileobj(origen, comprimido)
+        os.remove(destino)
+        base, ext = os.path.splitext(self.path)
+        self._purgar(base, ext)
+
+    def _purgar(self, base: str, ext: str):
+        directorio, nombre = os.path.split(base)
+        rotados = sorted(
+            f for f in os.listdir(directorio or ".")
+            if f.startswith(nombre + ".") and f.endswith(ext + ".gz")
+        )
+        for f in rotados[:max(len(rotados) - AUDIT_BACKUPS, 0)]:
+            try:
+                os.remove(os.path.join(directorio, f))
+            except OSError:
+                pass
+
+    def cerrar(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+class AuditSink:
+
+    def __init__(self, max_queue: int = AUDIT_QUEUE_SIZE):
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._ficheros: Dict[str, _FicheroRotativo] = {}
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.escritos = 0
+        self.descartados = 0
+        self.rotaciones = 0
+        self.errores = 0
+
+    def _arrancar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._escritor, name="audit-sink", daemon=True)
+                self._hilo.start()
+
+    def registrar(self, path: str, registro: Dict):
+        # Coste en el camino de la petición: un put_nowait. La serialización es del hilo
+        if not AUDIT_ENABLED:
+            return
+        if self._hilo is None:
+            self._arrancar()
+        try:
+            self._queue.put_nowait((path, registro))
+        except queue.Full:
+            self.descartados += 1
+            if self.descartados % 1000 == 1:
+                logger.warning(f"Cola de auditoría llena: {self.descartados} registros descartados")
+
+    def _escritor(self):
+        terminar = False
+        while not terminar:
+            lote = []
+            try:
+                elemento = self._queue.get(timeout=AUDIT_FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+            limite = time.monotonic() + AUDIT_FLUSH_INTERVAL
+            while True:
+                if elemento is _FIN:
+                    terminar = True
+                    break
+                lote.append(elemento)
+                if len(lote) >= AUDIT_BATCH_SIZE:
+                    break
+                try:
+                    elemento = self._queue.get(timeout=max(limite - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            self._escribir(lote)
+
+        for fichero in self._ficheros.values():
+            fichero.cerrar()
+
+    def _escribir(self, lote: List):
+        por_fichero: Dict[str, List[str]] = {}
+        for path, registro in lote:
+            try:
+                linea = json.dumps(registro, ensure_ascii=False, default=str) + "\n"
+            except Exception as e:
+                self.errores += 1
+                logger.warning(f"Registro de auditoría no serializable: {e}")
+                continue
+            por_fichero.setdefault(path, []).append(linea)
+
+        for path, lineas in por_fichero.items():
+            fichero = self._ficheros.setdefault(path, _FicheroRotativo(path))
+            try:
+                if fichero.escribir(lineas):
+                    self.rotaciones += 1
+                self.escritos += len(lineas)
+            except Exception as e:
+                self.errores += 1
+                fichero.cerrar()
+                logger.warning(f"No se pudo escribir el log de auditoría {path}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "pendientes": self._queue.qsize(),
+            "escritos": self.escritos,
+            "descartados": self.descartados,
+            "rotaciones": self.rotaciones,
+            "errores": self.errores,
+        }
+
+    def close(self, timeout: float = 5.0):
+        if self._hilo is None:
+            return
+        try:
+            self._queue.put(_FIN, timeout=timeout)
+        except queue.Full:
+            logger.warning("Cola de auditoría llena al cerrar: se pierden los registros pendientes")
+            return
+        self._hilo.join(timeout)
+        self._hilo = None
+
+
+_sink_instance = None
+
+def get_audit_sink() -> AuditSink:
+    global _sink_instance
+    if _sink_instance is None:
+        _sink_instance = AuditSink()
+    return _sink_instance
+
+
+def close_audit_sink():
+    global _sink_instance
+    if _sink_instance is not None:
+        _sink_instance.close()
+        _sink_instance = None
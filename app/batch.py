@@ -0,0 +1,463 @@
+import asyncio
+import ipaddress
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import zipfile
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+
+from app.extraction_executor import ExtractionQueueFull
+from app.llm_scheduler import LLMSaturado, PRIORIDAD_LOTE, prioridad_llm
+from app.pipeline import procesar_archivo, TIPOS_EXTRACCION
+from app.uploads import documento_desde_fichero, UPLOAD_CHUNK_SIZE, UPLOAD_MAX_BYTES
+from app.telemetry import traza
+
+logger = logging.getLogger(__name__)
+
+# Configuración de la cola de lotes
+BATCH_DB_PATH = os.getenv("BATCH_DB_PATH", "batch/jobs.sqlite")
+BATCH_DATA_DIR = os.getenv("BATCH_DATA_DIR", "batch/files")
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "1000"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(500 * 1024 * 1024)))
+BATCH_WEBHOOK_RETRIES = int(os.getenv("BATCH_WEBHOOK_RETRIES", "3"))
+# Hosts de webhook admitidos ("a.example.com,b.example.com"). Vacío: cualquier host público;
+# las direcciones privadas, de loopback o reservadas solo se aceptan si están en la lista
+BATCH_WEBHOOK_ALLOWED_HOSTS = {h.strip().lower() for h in os.getenv("BATCH_WEBHOOK_ALLOWED_HOSTS", "").split(",") if h.strip()}
+BATCH_QUEUE_FULL_RETRY_SECONDS = 2.0
+
+router = APIRouter(prefix="/batch", tags=["batch"])
+
+
+class JobStore:
+
+    def __init__(self, path: str = BATCH_DB_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                tipo TEXT NOT NULL,
+                proveedor TEXT,
+                anonymize INTEGER NOT NULL,
+                webhook_url TEXT,
+                estado TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                completados INTEGER NOT NULL DEFAULT 0,
+                fallidos INTEGER NOT NULL DEFAULT 0,
+                creado REAL NOT NULL,
+                actualizado REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS items (
+                job_id TEXT NOT NULL,
+                indice INTEGER NOT NULL,
+                archivo TEXT NOT NULL,
+                path TEXT NOT NULL,
+                estado TEXT NOT NULL,
+                resultado TEXT,
+                error TEXT,
+                PRIMARY KEY (job_id, indice)
+            );
+        """)
+
+    def create_job(self, job_id: str, tipo: str, proveedor: Optional[str], anonymize: bool,
+                   webhook_url: Optional[str], archivos: List[Tuple[str, str]]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT INTO jobs (id, tipo, proveedor, anonymize, webhook_url, estado, total, creado, actualizado) "
+                "VALUES (?, ?, ?, ?, ?, 'pendiente', ?, ?, ?)",
+                (job_id, tipo, proveedor, int(anonymize), webhook_url, len(archivos), now, now),
+            )
+            self._conn.executemany(
+                "INSERT INTO items (job_id, indice, archivo, path, estado) VALUES (?, ?, ?, ?, 'pendiente')",
+                [(job_id, i, archivo, path) for i, (archivo, path) in enumerate(archivos)],
+            )
+            self._conn.execute("COMMIT")
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_item(self, job_id: str, indice: int) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM items WHERE job_id = ? AND indice = ?", (job_id, indice)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_items(self, job_id: str) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT indice, archivo, estado, resultado, error FROM items WHERE job_id = ? ORDER BY indice",
+                (job_id,),
+            ).fetchall()
+        return [
+            {
+                "indice": row["indice"],
+                "archivo": row["archivo"],
+                "estado": row["estado"],
+                "resultado": json.loads(row["resultado"]) if row["resultado"] else None,
+                "error": row["error"],
+            }
+            for row in rows
+        ]
+
+    def mark_processing(self, job_id: str, indice: int):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE items SET estado = 'procesando' WHERE job_id = ? AND indice = ?", (job_id, indice)
+            )
+            self._conn.execute(
+                "UPDATE jobs SET estado = 'en_proceso', actualizado = ? WHERE id = ? AND estado = 'pendiente'",
+                (time.time(), job_id),
+            )
+
+    def finish_item(self, job_id: str, indice: int, resultado=None, error: Optional[str] = None) -> Optional[Dict]:
+        # Devuelve el job si con este item queda terminado
+        contador = "fallidos" if error else "completados"
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "UPDATE items SET estado = ?, resultado = ?, error = ? WHERE job_id = ? AND indice = ?",
+                (
+                    "error" if error else "completado",
+                    None if error else json.dumps(resultado, ensure_ascii=False),
+                    error, job_id, indice,
+                ),
+            )
+            self._conn.execute(
+                f"UPDATE jobs SET {contador} = {contador} + 1, actualizado = ? WHERE id = ?",
+                (time.time(), job_id),
+            )
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            terminado = row["completados"] + row["fallidos"] >= row["total"]
+            if terminado:
+                estado = "completado_con_errores" if row["fallidos"] else "completado"
+                self._conn.execute("UPDATE jobs SET estado = ? WHERE id = ?", (estado, job_id))
+            self._conn.execute("COMMIT")
+        return self.get_job(job_id) if terminado else None
+
+    def unfinished_items(self) -> List[Tuple[str, int]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, indice FROM items WHERE estado IN ('pendiente', 'procesando') "
+                "ORDER BY rowid"
+            ).fetchall()
+        return [(row["job_id"], row["indice"]) for row in rows]
+
+
+def job_to_dict(job: Dict) -> Dict:
+    return {
+        "job_id": job["id"],
+        "estado": job["estado"],
+        "tipo": job["tipo"],
+        "total": job["total"],
+        "completados": job["completados"],
+        "fallidos": job["fallidos"],
+        "pendientes": job["total"] - job["completados"] - job["fallidos"],
+        "resultados": f"/batch/{job['id']}/resultados",
+    }
+
+
+class BatchQueue:
+
+    def __init__(self, store: JobStore, workers: int = BATCH_WORKERS):
+        self.store = store
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        # Referencias a los webhooks en curso: sin ellas la tarea puede recolectarse a medias
+        self._webhooks: Set[asyncio.Task] = set()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def enqueue(self, job_id: str, indice: int):
+        self._queue.put_nowait((job_id, indice))
+
+    def start(self):
+        # Los items que quedaron a medias en una ejecución anterior se reencolan
+        for job_id, indice in self.store.unfinished_items():
+            self.enqueue(job_id, indice)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        tareas = self._tasks + list(self._webhooks)
+        for task in tareas:
+            task.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            job_id, indice = await self._queue.get()
+            try:
+                # Cada item tiene su propia traza, como una petición, y sus llamadas al LLM
+                # esperan detrás de las interactivas
+                with traza(f"{job_id}-{indice}"), prioridad_llm(PRIORIDAD_LOTE):
+                    await self._procesar_item(job_id, indice)
+            except Exception as e:
+                logger.error(f"Error inesperado en el worker de lotes ({job_id}/{indice}): {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _procesar_item(self, job_id: str, indice: int):
+        # sqlite es síncrono: cada acceso al store va a un hilo para no bloquear el event loop
+        job = await asyncio.to_thread(self.store.get_job, job_id)
+        item = await asyncio.to_thread(self.store.get_item, job_id, indice)
+        if job is None or item is None or item["estado"] in ("completado", "error"):
+            return
+
+        await asyncio.to_thread(self.store.mark_processing, job_id, indice)
+        resultado, error = None, None
+        try:
+            doc = await asyncio.to_thread(documento_desde_fichero, item["path"], item["archivo"])
+            while True:
+                try:
+                    resultado = await procesar_archivo(doc, job["tipo"], job["proveedor"], bool(job["anonymize"]))
+                    break
+                except ExtractionQueueFull:
+                    # El tráfico interactivo tiene prioridad: el lote espera a que haya hueco
+                    await asyncio.sleep(BATCH_QUEUE_FULL_RETRY_SECONDS)
+                except LLMSaturado as e:
+                    # Reintentos agotados contra el límite de la cuenta: el item espera y se repite
+                    await asyncio.sleep(max(e.retry_after, BATCH_QUEUE_FULL_RETRY_SECONDS))
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.warning(f"Error procesando {item['archivo']} del lote {job_id}: {error}")
+
+        terminado = await asyncio.to_thread(self.store.finish_item, job_id, indice, resultado, error)
+        try:
+            os.remove(item["path"])
+        except OSError:
+            pass
+
+        if terminado:
+            await asyncio.to_thread(shutil.rmtree, Path(BATCH_DATA_DIR) / job_id, ignore_errors=True)
+            if terminado["webhook_url"]:
+                task = asyncio.create_task(enviar_webhook(terminado["webhook_url"], job_to_dict(terminado)))
+                self._webhooks.add(task)
+                task.add_done_callback(self._webhook_terminado)
+
+    def _webhook_terminado(self, task: asyncio.Task):
+        self._webhooks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error inesperado enviando webhook: {task.exception()}")
+
+
+def _host_privado(ip: str) -> bool:
+    direccion = ipaddress.ip_address(ip.split("%")[0])
+    return not direccion.is_global or direccion.is_multicast
+
+
+async def validar_webhook(url: str) -> Optional[str]:
+    # Devuelve el motivo del rechazo o None. El servidor hace el POST, así que una URL
+    # libre permitiría llegar a servicios internos (SSRF): solo http(s) hacia hosts
+    # públicos, o hacia los de BATCH_WEBHOOK_ALLOWED_HOSTS
+    partes = urlsplit(url)
+    if partes.scheme not in ("http", "https") or not partes.hostname:
+        return "el webhook debe ser una URL http o https"
+    host = partes.hostname.lower()
+    if BATCH_WEBHOOK_ALLOWED_HOSTS:
+        return None if host in BATCH_WEBHOOK_ALLOWED_HOSTS else f"host de webhook no permitido: {host}"
+    try:
+        puerto = partes.port or (443 if partes.scheme == "https" else 80)
+        direcciones = await asyncio.get_running_loop().getaddrinfo(host, puerto)
+    except (OSError, ValueError) as e:
+        return f"no se puede resolver el host del webhook {host}: {e}"
+    # Se comprueban todas las direcciones: basta una interna para rechazarlo
+    if any(_host_privado(direccion[4][0]) for direccion in direcciones):
+        return f"el webhook apunta a una dirección privada o reservada: {host}"
+    return None
+
+
+async def enviar_webhook(url: str, payload: Dict):
+    timeout = aiohttp.ClientTimeout(total=10)
+    for intento in range(1, BATCH_WEBHOOK_RETRIES + 1):
+        # Se valida otra vez al enviar: el DNS puede haber cambiado desde que se creó el lote
+        motivo = await validar_webhook(url)
+        if motivo:
+            logger.warning(f"Webhook {url} descartado: {motivo}")
+            return
+        try:
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                # Sin redirecciones: una respuesta 3xx no puede desviar el POST a otro host
+                async with session.post(url, json=payload, allow_redirects=False) as resp:
+                    if resp.status < 400:
+                        return
+                    logger.warning(f"Webhook {url} respondió {resp.status} (intento {intento})")
+        except Exception as e:
+            logger.warning(f"Error enviando webhook {url} (intento {intento}): {e}")
+        await asyncio.sleep(2 ** intento)
+
+
+_store_instance = None
+_queue_instance = None
+
+def get_job_store() -> JobStore:
+    global _store_instance
+    if _store_instance is None:
+        _store_instance = JobStore()
+    return _store_instance
+
+
+def get_batch_queue() -> BatchQueue:
+    global _queue_instance
+    if _queue_instance is None:
+        _queue_instance = BatchQueue(get_job_store())
+    return _queue_instance
+
+
+async def start_batch_workers():
+    get_batch_queue().start()
+
+
+async def stop_batch_workers():
+    if _queue_instance is not None:
+        await _queue_instance.stop()
+
+
+def _nombre_seguro(indice: int, filename: str) -> str:
+    return f"{indice:05d}_{os.path.basename(filename) or 'documento'}"
+
+
+def _extraer_zip(zip_path: str, destino: Path, inicio: int) -> List[Tuple[str, str]]:
+    archivos = []
+    with zipfile.ZipFile(zip_path) as zf:
+        miembros = [
+            info for info in zf.infolist()
+            if not info.is_dir() and not os.path.basename(info.filename).startswith(".")
+            and not info.filename.startswith("__MACOSX")
+        ]
+        if inicio + len(miembros) > BATCH_MAX_FILES:
+            raise HTTPException(status_code=413, detail=f"El lote supera el máximo de {BATCH_MAX_FILES} archivos")
+        if sum(info.file_size for info in miembros) > BATCH_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"El zip descomprimido supera {BATCH_MAX_BYTES} bytes")
+        for info in miembros:
+            if info.file_size > UPLOAD_MAX_BYTES:
+                raise _archivo_demasiado_grande(info.filename)
+
+        for info in miembros:
+            nombre = os.path.basename(info.filename)
+            path = destino / _nombre_seguro(inicio + len(archivos), nombre)
+            with zf.open(info) as origen, open(path, "wb") as f:
+                # El tamaño de la cabecera del zip puede mentir: se cuenta lo que se descomprime
+                copiados = 0
+                for chunk in iter(lambda: origen.read(UPLOAD_CHUNK_SIZE), b""):
+                    copiados += len(chunk)
+                    if copiados > UPLOAD_MAX_BYTES:
+                        raise _archivo_demasiado_grande(info.filename)
+                    f.write(chunk)
+            archivos.append((nombre, str(path)))
+    return archivos
+
+
+def _archivo_demasiado_grande(filename: str) -> HTTPException:
+    # Cada documento del lote tiene el mismo límite que una subida a /extraer
+    return HTTPException(status_code=413, detail=f"{filename} supera el límite de {UPLOAD_MAX_BYTES} bytes")
+
+
+async def _guardar_upload(file: UploadFile, path: Path, max_bytes: int = UPLOAD_MAX_BYTES):
+    size = 0
+    with open(path, "wb") as f:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise _archivo_demasiado_grande(os.path.basename(file.filename or "documento"))
+            await asyncio.to_thread(f.write, chunk)
+
+
+@router.post("", status_code=202)
+async def crear_lote(
+    files: List[UploadFile] = File(...),
+    tipo: str = Form("documento"),
+    proveedor: str = Form(None),
+    anonymize: bool = Form(True),
+    webhook_url: str = Form(None)
+):
+    if tipo not in TIPOS_EXTRACCION:
+        raise HTTPException(status_code=400, detail=f"Tipo no soportado: {tipo}")
+    if tipo == "dades_venda":
+        proveedor = None
+    if webhook_url:
+        motivo = await validar_webhook(webhook_url)
+        if motivo:
+            raise HTTPException(status_code=400, detail=motivo)
+
+    job_id = uuid.uuid4().hex
+    destino = Path(BATCH_DATA_DIR) / job_id
+    destino.mkdir(parents=True, exist_ok=True)
+
+    archivos: List[Tuple[str, str]] = []
+    try:
+        for file in files:
+            filename = os.path.basename(file.filename or "documento")
+            if filename.lower().endswith(".zip"):
+                zip_path = destino / f"_{uuid.uuid4().hex}.zip"
+                # El zip es el contenedor del lote: su límite es el del lote y el de cada
+                # documento se aplica a los miembros
+                await _guardar_upload(file, zip_path, BATCH_MAX_BYTES)
+                try:
+                    archivos.extend(await asyncio.to_thread(_extraer_zip, str(zip_path), destino, len(archivos)))
+                except zipfile.BadZipFile:
+                    raise HTTPException(status_code=400, detail=f"Zip no válido: {filename}")
+                finally:
+                    zip_path.unlink(missing_ok=True)
+            else:
+                if len(archivos) >= BATCH_MAX_FILES:
+                    raise HTTPException(status_code=413, detail=f"El lote supera el máximo de {BATCH_MAX_FILES} archivos")
+                path = destino / _nombre_seguro(len(archivos), filename)
+                await _guardar_upload(file, path)
+                archivos.append((filename, str(path)))
+
+        if not archivos:
+            raise HTTPException(status_code=400, detail="El lote no contiene archivos")
+
+        store = get_job_store()
+        await asyncio.to_thread(store.create_job, job_id, tipo, proveedor, anonymize, webhook_url, archivos)
+    except Exception:
+        shutil.rmtree(destino, ignore_errors=True)
+        raise
+
+    queue = get_batch_queue()
+    for indice in range(len(archivos)):
+        queue.enqueue(job_id, indice)
+
+    return job_to_dict(await asyncio.to_thread(store.get_job, job_id))
+
+
+@router.get("/{job_id}")
+async def estado_lote(job_id: str):
+    job = await asyncio.to_thread(get_job_store().get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+    return job_to_dict(job)
+
+
+@router.get("/{job_id}/resultados")
+async def resultados_lote(job_id: str):
+    store = get_job_store()
+    job = await asyncio.to_thread(store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+    return {**job_to_dict(job), "items": await asyncio.to_thread(store.get_items, job_id)}
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+from app.telemetry import CACHE_CONSULTAS
+
+logger = logging.getLogger(__name__)
+
+# Configuración de la caché de extracción
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # memory | sqlite | none
+CACHE_MAX_ITEMS = int(os.getenv("CACHE_MAX_ITEMS", "2000"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "cache/extraction_cache.sqlite")
+
+_MISSING = object()
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_text(texto: str) -> str:
+    return hash_bytes(texto.encode("utf-8"))
+
+
+def build_key(*parts) -> str:
+    return "|".join("" if p is None else str(p) for p in parts)
+
+
+class CacheBackend:
+
+    def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class NullCache(CacheBackend):
+
+    def get(self, key: str) -> Any:
+        return _MISSING
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self) -> int:
+        return 0
+
+
+class MemoryLRUCache(CacheBackend):
+
+    def __init__(self, max_items: int = CACHE_MAX_ITEMS, ttl: float = CACHE_TTL):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache(CacheBackend):
+
+    def __init__(self, path: str = CACHE_SQLITE_PATH, table: str = "cache",
+                 max_items: int = CACHE_MAX_ITEMS, ttl: float = CACHE_TTL):
+        self.path = path
+        self.table = table
+        self.max_items = max_items
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed)")
+
+    def get(self, key: str) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return _MISSING
+            if row[1] < now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return _MISSING
+            self._conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + self.ttl, now),
+            )
+            exceso = len(self) - self.max_items
+            if exceso > 0:
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY accessed LIMIT ?)",
+                    (exceso,),
+                )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self) -> int:
+        return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class ExtractionCache:
+
+    def __init__(self, name: str, backend: CacheBackend):
+        self.name = name
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Error leyendo caché {self.name}: {e}")
+            value = _MISSING
+        if value is _MISSING:
+            self.misses += 1
+            CACHE_CONSULTAS.labels(self.name, "miss").inc()
+            return None
+        self.hits += 1
+        CACHE_CONSULTAS.labels(self.name, "hit").inc()
+        return value
+
+    def set(self, key: str, value: Any):
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            logger.warning(f"Error escribiendo caché {self.name}: {e}")
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entradas": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def _create_backend(table: str) -> CacheBackend:
+    if CACHE_BACKEND == "sqlite":
+        return SQLiteCache(CACHE_SQLITE_PATH, table=table)
+    if CACHE_BACKEND == "none":
+        return NullCache()
+    return MemoryLRUCache()
+
+
+_result_cache_instance = None
+_text_cache_instance = None
+
+def get_result_cache() -> ExtractionCache:
+    global _result_cache_instance
+    if _result_cache_instance is None:
+        _result_cache_instance = ExtractionCache("resultado", _create_backend("resultado"))
+    return _result_cache_instance
+
+
+def get_text_cache() -> ExtractionCache:
+    global _text_cache_instance
+    if _text_cache_instance is None:
+        _text_cache_instance = ExtractionCache("texto", _create_backend("texto"))
+    return _text_cache_instance
@@ -0,0 +1,87 @@
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Un corte en línea en blanco (fin de tabla o de bloque) se prefiere a uno en mitad
+# de la tabla siempre que el trozo no quede por debajo de esta fracción del máximo
+MIN_FRACCION_CORTE_BLANDO = 0.5
+
+
+def _partir_linea(linea: str, max_tokens: int, encoding) -> List[str]:
+    tokens = encoding.encode_ordinary(linea)
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+
+def contar_lineas(texto: str, encoding) -> Tuple[List[str], List[int]]:
+    # Tokens de cada línea más el salto; su suma acota por arriba los del texto completo
+    lineas = texto.split("\n")
+    return lineas, [len(tokens) + 1 for tokens in encoding.encode_ordinary_batch(lineas)]
+
+
+def dividir_en_chunks(texto: str, max_tokens: int, encoding,
+                      lineas: Optional[List[str]] = None, conteos: Optional[List[int]] = None) -> List[str]:
+    # Trocea por líneas (filas de tabla en CSV/XLSX/XML) sin superar max_tokens por trozo.
+    # Solo se parte una línea si ella sola ya supera el máximo.
+    if lineas is None or conteos is None:
+        lineas, conteos = contar_lineas(texto, encoding)
+
+    chunks: List[str] = []
+    actual: List[Tuple[str, int]] = []
+    tokens_actual = 0
+    ultimo_blanco = -1  # posición en `actual` de la última línea en blanco
+
+    def _cerrar(hasta: int):
+        nonlocal actual, tokens_actual, ultimo_blanco
+        trozo = "\n".join(linea for linea, _ in actual[:hasta]).strip("\n")
+        if trozo.strip():
+            chunks.append(trozo)
+        actual = actual[hasta:]
+        tokens_actual = sum(c for _, c in actual)
+        ultimo_blanco = -1
+
+    for linea, n in zip(lineas, conteos):
+        if n > max_tokens:
+            if actual:
+                _cerrar(len(actual))
+            chunks.extend(_partir_linea(linea, max_tokens, encoding))
+            continue
+
+        if actual and tokens_actual + n > max_tokens:
+            hasta_blanco = sum(c for _, c in actual[:ultimo_blanco + 1])
+            if ultimo_blanco > 0 and hasta_blanco >= max_tokens * MIN_FRACCION_CORTE_BLANDO:
+                _cerrar(ultimo_blanco + 1)
+            if tokens_actual + n > max_tokens:
+                _cerrar(len(actual))
+
+        if not linea.strip():
+            ultimo_blanco = len(actual)
+        actual.append((linea, n))
+        tokens_actual += n
+
+    if actual:
+        _cerrar(len(actual))
+    return chunks
+
+
+class FusionResultados:
+    # Une los arrays de cada trozo en orden de llegada (admite items de varios trozos
+    # intercalados). Los trozos no se solapan: cada línea del documento va a un solo trozo,
+    # así que un mismo item en dos trozos son dos filas iguales de verdad (p. ej. el mismo
+    # producto en dos páginas) y se conservan las dos. Las cabeceras repetidas en cada
+    # página ya las quita la normalización antes de trocear
+
+    def __init__(self):
+        self.items: list = []
+
+    def add(self, trozo: int, item) -> bool:
+        self.items.append(item)
+        return True
+
+
+def fusionar_resultados(resultados: Iterable[list]) -> list:
+    fusion = FusionResultados()
+    for trozo, items in enumerate(resultados):
+        for item in items:
+            fusion.add(trozo, item)
+    return fusion.items
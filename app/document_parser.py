@@ -1,112 +1,121 @@
+import importlib
+import io
 import os
-from PyPDF2 import PdfReader
-import pytesseract
-import pandas as pd
-from pdf2image import convert_from_path
-from PIL import Image
-import xml.etree.ElementTree as ET
+import tempfile
+import threading
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.telemetry import etapa
+
+logger = logging.getLogger(__name__)
+
+# Cambia cuando cambia el texto que generan los parsers (invalida la caché de texto)
+PARSER_VERSION = "6"
+
+# Parsers que se cargan al arrancar el servicio y cada worker del pool ("pdf,excel" o "all").
+# Vacío: cada proceso importa un parser la primera vez que recibe un documento de ese formato
+PARSER_PREWARM = [nombre.strip() for nombre in os.getenv("PARSER_PREWARM", "").split(",") if nombre.strip()]
+
+# Bytes del principio del documento que se usan para reconocer el formato
+LONGITUD_CABECERA = 512
+
+FIRMA_PDF = b"%PDF-"
+FIRMA_ZIP = b"PK\x03\x04"  # .xlsx
+FIRMA_OLE2 = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"  # .xls
+FIRMAS_IMAGEN = (b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff", b"II*\x00", b"MM\x00*")
+
+
+@dataclass(frozen=True)
+class ParserPlugin:
+    nombre: str
+    funcion: str  # "modulo:funcion"; el módulo (y sus librerías) se importa en el primer uso
+    extensiones: Tuple[str, ...]
+    firmas: Tuple[bytes, ...] = ()
+    en_memoria: bool = True  # acepta un BytesIO además de una ruta
+
+
+PARSERS = (
+    ParserPlugin("pdf", "app.parsers.pdf:extraer_texto_pdf", (".pdf",), (FIRMA_PDF,), en_memoria=False),
+    ParserPlugin("excel", "app.parsers.excel:extraer_texto_excel", (".xlsx", ".xls"), (FIRMA_ZIP, FIRMA_OLE2)),
+    ParserPlugin("imagen", "app.parsers.imagen:extraer_texto_imagen", (".png", ".jpg", ".jpeg", ".tiff"), FIRMAS_IMAGEN),
+    ParserPlugin("xml", "app.parsers.xml:extraer_texto_xml", (".xml",)),
+    ParserPlugin("csv", "app.parsers.tablas:extraer_texto_csv", (".csv",)),
+    ParserPlugin("txt", "app.parsers.texto:extraer_texto_txt_csv", (".txt",)),
+)
+_POR_NOMBRE = {plugin.nombre: plugin for plugin in PARSERS}
+
+_cargados: Dict[str, Callable[..., str]] = {}
+_cargados_lock = threading.Lock()
+
+
+def detectar_parser(cabecera: bytes, filename: str) -> ParserPlugin:
+    # Las firmas binarias mandan sobre la extensión: un PDF o un Excel renombrado (adjuntos
+    # de ERP exportados como .csv o .txt) se parsea por lo que es. Los formatos de texto no
+    # tienen firma y se deciden por la extensión; sin extensión conocida, XML si lo parece
+    ext = os.path.splitext(filename)[1].lower()
+    for plugin in PARSERS:
+        if cabecera.startswith(plugin.firmas):
+            return plugin
+    for plugin in PARSERS:
+        if ext in plugin.extensiones:
+            return plugin
+    if cabecera.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"<"):
+        logger.debug("Detectado XML por contenido")
+        return _POR_NOMBRE["xml"]
+    raise ValueError(f"Tipo de archivo no soportado: '{ext}' para archivo: {filename}")
+
+
+def cargar_parser(plugin: ParserPlugin) -> Callable[..., str]:
+    parser = _cargados.get(plugin.nombre)
+    if parser is None:
+        with _cargados_lock:
+            parser = _cargados.get(plugin.nombre)
+            if parser is None:
+                modulo, funcion = plugin.funcion.split(":")
+                # En un worker recién arrancado esta etapa es el coste de importar el formato
+                with etapa("carga_parser", plugin.nombre):
+                    parser = getattr(importlib.import_module(modulo), funcion)
+                _cargados[plugin.nombre] = parser
+                logger.debug(f"Parser {plugin.nombre} cargado en el proceso {os.getpid()}")
+    return parser
+
+
+def parsers_cargados() -> List[str]:
+    return sorted(_cargados)
+
+
+def precargar_parsers(nombres: Optional[List[str]] = None) -> List[str]:
+    nombres = PARSER_PREWARM if nombres is None else nombres
+    if "all" in nombres:
+        nombres = list(_POR_NOMBRE)
+    for nombre in nombres:
+        plugin = _POR_NOMBRE.get(nombre)
+        if plugin is None:
+            logger.warning(f"PARSER_PREWARM: parser desconocido '{nombre}' (disponibles: {', '.join(_POR_NOMBRE)})")
+            continue
+        cargar_parser(plugin)
+    return parsers_cargados()
+
 
 def detectar_tipo_y_extraer(filepath: str) -> str:
-    ext = os.path.splitext(filepath)[1].lower()
-    
-    print(f"DEBUG: Extensión detectada: '{ext}' para archivo: {filepath}")
-
-    if ext in [".pdf"]:
-        return extraer_texto_pdf(filepath)
-    elif ext in [".xlsx", ".xls"]:
-        return extraer_texto_excel(filepath)
-    elif ext in [".csv", ".txt"]:
-        return extraer_texto_txt_csv(filepath)
-    elif ext in [".xml"]:
-        return extraer_texto_xml(filepath)
-    elif ext in [".png", ".jpg", ".jpeg", ".tiff"]:
-        return extraer_texto_imagen(filepath)
-    else:
-        if not ext or ext == "":
-            try:
-                with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                    first_line = f.readline().strip()
-                    if first_line.startswith('<?xml') or first_line.startswith('<'):
-                        print(f"DEBUG: Detectado XML por contenido")
-                        return extraer_texto_xml(filepath)
-            except:
-                pass
-        
-        raise ValueError(f"Tipo de archivo no soportado: '{ext}' para archivo: {filepath}")
-
-def extraer_texto_pdf(filepath):
-    try:
-        reader = PdfReader(filepath)
-        text = "\n".join(page.extract_text() or "" for page in reader.pages)
-        if text.strip():
-            return text
-    except Exception:
-        pass
-
-    pages = convert_from_path(filepath, dpi=300)
-    return "\n".join([pytesseract.image_to_string(p, lang="spa") for p in pages])
-
-
-def extraer_texto_excel(filepath):
-    df = pd.read_excel(filepath, sheet_name=0)
-    return df.to_string(index=False)
-
-def extraer_texto_txt_csv(filepath):
-    with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-        return f.read()
-
-def extraer_texto_imagen(filepath):
-    image = Image.open(filepath)
-    return pytesseract.image_to_string(image, lang="spa+eng+deu+cat")
-
-def extraer_texto_xml(filepath):
-    try:
-        tree = ET.parse(filepath)
-        root = tree.getroot()
-        
-        print(f"DEBUG XML: Root element: {root.tag}")
-        
-        def extract_text_recursive(element, level=0):
-            text_parts = []
-            indent = "  " * level
-            
-            if any(keyword in element.tag.lower() for keyword in ['item', 'product', 'article', 'line', 'articulo', 'producto']):
-                if element.text and element.text.strip():
-                    text_parts.append(f"{element.tag}: {element.text.strip()}")
-                
-                if element.attrib:
-                    for attr_name, attr_value in element.attrib.items():
-                        text_parts.append(f"  {attr_name}: {attr_value}")
-                
-                for child in element:
-                    if child.text and child.text.strip():
-                        text_parts.append(f"  {child.tag}: {child.text.strip()}")
-                    if child.attrib:
-                        for attr_name, attr_value in child.attrib.items():
-                            text_parts.append(f"    {attr_name}: {attr_value}")
-            else:
-                if element.text and element.text.strip():
-                    text_parts.append(f"{indent}{element.tag}: {element.text.strip()}")
-                
-                if element.attrib:
-                    for attr_name, attr_value in element.attrib.items():
-                        text_parts.append(f"{indent}  {attr_name}: {attr_value}")
-                
-                for child in element:
-                    text_parts.extend(extract_text_recursive(child, level + 1))
-            
-            return text_parts
-        
-        text_lines = extract_text_recursive(root)
-        result = "\n".join(text_lines)
-        
-        print(f"DEBUG XML: Texto extraído (primeros 500 chars): {result[:500]}")
-        
-        return result
-        
-    except ET.ParseError as e:
-        print(f"ERROR XML Parse: {e}")
-        raise ValueError(f"Error al parsear XML: {e}")
-    except Exception as e:
-        print(f"ERROR XML General: {e}")
-        raise ValueError(f"Error al procesar archivo XML: {e}")
+    with open(filepath, "rb") as f:
+        cabecera = f.read(LONGITUD_CABECERA)
+    plugin = detectar_parser(cabecera, filepath)
+    logger.debug(f"Formato detectado: '{plugin.nombre}' para archivo: {filepath}")
+    return cargar_parser(plugin)(filepath)
+
+
+def detectar_tipo_y_extraer_bytes(data: bytes, filename: str) -> str:
+    # Camino en memoria; los formatos que necesitan un fichero en disco (el OCR de PDF
+    # rasteriza con pdf2image) pasan por un temporal
+    plugin = detectar_parser(data[:LONGITUD_CABECERA], filename)
+    parser = cargar_parser(plugin)
+    if plugin.en_memoria:
+        return parser(io.BytesIO(data))
+
+    with tempfile.NamedTemporaryFile(prefix="upload_", suffix=plugin.extensiones[0]) as temp:
+        temp.write(data)
+        temp.flush()
+        return parser(temp.name)
@@ -0,0 +1,136 @@
+import asyncio
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+from app.document_parser import PARSER_PREWARM, parsers_cargados, precargar_parsers
+
+logger = logging.getLogger(__name__)
+
+# Pool de procesos para el parseo/OCR (configurable por entorno)
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 2)))
+EXTRACTION_QUEUE_SIZE = int(os.getenv("EXTRACTION_QUEUE_SIZE", str(EXTRACTION_WORKERS * 2)))
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", "180"))
+EXTRACTION_MAX_TASKS_PER_CHILD = int(os.getenv("EXTRACTION_MAX_TASKS_PER_CHILD", "200"))
+
+
+class ExtractionQueueFull(Exception):
+    pass
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+class ExtractionExecutor:
+
+    def __init__(self, max_workers: int = EXTRACTION_WORKERS, max_queue: int = EXTRACTION_QUEUE_SIZE,
+                 timeout: float = EXTRACTION_TIMEOUT, initializer: Optional[Callable] = None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        # Se ejecuta en cada worker al arrancar, también en los que sustituyen a uno reciclado
+        self.initializer = initializer
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Trabajos aceptados que aún ocupan un worker o esperan turno. Un trabajo que
+        # supera el timeout sigue contando hasta que el worker termina de verdad.
+        self.pending = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn evita heredar el estado del event loop y los hilos de uvicorn
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=EXTRACTION_MAX_TASKS_PER_CHILD or None,
+                initializer=self.initializer,
+            )
+        return self._pool
+
+    def _release(self, _future):
+        self.pending -= 1
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        if self.pending >= self.capacity:
+            self.rejected += 1
+            raise ExtractionQueueFull(
+                f"Cola de extracción llena ({self.pending}/{self.capacity} trabajos)"
+            )
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except BrokenProcessPool:
+            logger.error("Pool de extracción roto, recreándolo")
+            self._pool = None
+            future = self._get_pool().submit(fn, *args)
+
+        self.pending += 1
+
+        def _on_done(f):
+            try:
+                loop.call_soon_threadsafe(self._release, f)
+            except RuntimeError:
+                # El loop ya se cerró (apagado del servidor)
+                pass
+
+        future.add_done_callback(_on_done)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            future.cancel()
+            raise ExtractionTimeout(f"La extracción superó el límite de {timeout or self.timeout}s")
+        except BrokenProcessPool:
+            self._pool = None
+            raise
+
+    async def precalentar(self):
+        # Una tarea por worker: cada submit sin workers libres arranca uno nuevo, así todos
+        # pasan por el initializer antes de la primera petición. No cuenta para la cola
+        try:
+            futures = [asyncio.wrap_future(self._get_pool().submit(parsers_cargados)) for _ in range(self.max_workers)]
+            cargados = await asyncio.gather(*futures)
+            logger.info(f"Pool de extracción precalentado: {len(cargados)} workers con {', '.join(cargados[0]) or 'ningún parser'}")
+        except Exception as e:
+            logger.warning(f"No se pudo precalentar el pool de extracción: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "capacidad": self.capacity,
+            "pendientes": self.pending,
+            "rechazados": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_executor_instance = None
+
+def get_extraction_executor() -> ExtractionExecutor:
+    global _executor_instance
+    if _executor_instance is None:
+        _executor_instance = ExtractionExecutor(initializer=precargar_parsers if PARSER_PREWARM else None)
+    return _executor_instance
+
+
+def shutdown_extraction_executor():
+    global _executor_instance
+    if _executor_instance is not None:
+        _executor_instance.shutdown()
+        _executor_instance = None
@@ -0,0 +1,78 @@
+import json
+import logging
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+
+class JSONArrayStreamParser:
+    # Parser incremental de un array JSON de objetos: recibe el texto del modelo a trozos
+    # (con o sin ```json alrededor) y devuelve cada objeto en cuanto se cierra su llave
+
+    def __init__(self):
+        self._dentro_array = False
+        self._terminado = False
+        self._profundidad = 0
+        self._en_string = False
+        self._escape = False
+        self._buffer: List[str] = []
+        self.descartados = 0
+
+    def feed(self, texto: str) -> List[dict]:
+        objetos = []
+        for char in texto:
+            if self._terminado:
+                break
+            if not self._dentro_array:
+                # Todo lo anterior al '[' (valla de markdown, espacios) se ignora
+                if char == "[":
+                    self._dentro_array = True
+                continue
+
+            if self._profundidad > 0:
+                self._buffer.append(char)
+
+            if self._en_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._en_string = False
+                continue
+
+            if char == '"':
+                self._en_string = True
+            elif char in "{[":
+                if self._profundidad == 0:
+                    self._buffer = [char]
+                self._profundidad += 1
+            elif char in "}]":
+                if self._profundidad == 0:
+                    if char == "]":
+                        self._terminado = True
+                    continue
+                self._profundidad -= 1
+                if self._profundidad == 0:
+                    objeto = self._cerrar_elemento()
+                    if objeto is not None:
+                        objetos.append(objeto)
+        return objetos
+
+    def _cerrar_elemento(self):
+        fragmento = "".join(self._buffer)
+        self._buffer = []
+        try:
+            objeto = json.loads(fragmento)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Elemento JSON inválido en la respuesta en streaming: {e}")
+            self.descartados += 1
+            return None
+        if not isinstance(objeto, dict):
+            self.descartados += 1
+            return None
+        return objeto
+
+    @property
+    def completo(self) -> bool:
+        return self._terminado
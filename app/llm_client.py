@@ -0,0 +1,130 @@
+import os
+import logging
+from typing import AsyncIterator, List, Dict, Optional
+
+import aiohttp
+import openai
+
+from app.llm_scheduler import LLMScheduler
+
+logger = logging.getLogger(__name__)
+
+# Límites del cliente LLM (configurables por entorno)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "64"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_KEEPALIVE_TIMEOUT = float(os.getenv("LLM_KEEPALIVE_TIMEOUT", "60"))
+
+
+class LLMClient:
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, pool_size: int = LLM_POOL_SIZE,
+                 request_timeout: float = LLM_REQUEST_TIMEOUT, connect_timeout: float = LLM_CONNECT_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        # La concurrencia la limita el planificador junto con los límites por minuto
+        self.scheduler = LLMScheduler(max_concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def in_flight(self) -> int:
+        return self.scheduler.en_curso
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # La sesión se crea de forma perezosa dentro del event loop y se reutiliza
+        # entre peticiones para mantener las conexiones keep-alive
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=LLM_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    @staticmethod
+    def _tokens(messages: List[Dict], prompt_tokens: Optional[int], max_tokens: int) -> int:
+        # Sin recuento del tokenizador se estima como OpenAI, ~4 caracteres por token
+        if prompt_tokens is None:
+            prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+        return prompt_tokens + max_tokens
+
+    async def chat(self, messages: List[Dict], model: str, max_tokens: int,
+                   temperature: float = 0, request_timeout: Optional[float] = None,
+                   prompt_tokens: Optional[int] = None):
+        timeout = request_timeout or self.request_timeout
+
+        async def _llamada():
+            token = openai.aiosession.set(self._get_session())
+            try:
+                return await openai.ChatCompletion.acreate(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    request_timeout=(self.connect_timeout, timeout),
+                )
+            finally:
+                openai.aiosession.reset(token)
+
+        return await self.scheduler.ejecutar(_llamada, self._tokens(messages, prompt_tokens, max_tokens))
+
+    async def chat_stream(self, messages: List[Dict], model: str, max_tokens: int,
+                          temperature: float = 0, request_timeout: Optional[float] = None,
+                          prompt_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        # Igual que chat() pero devuelve el texto de la respuesta a medida que se genera.
+        # El hueco del planificador se mantiene hasta que termina el stream; solo se
+        # reintenta la apertura, nunca un stream que ya ha emitido texto
+        timeout = request_timeout or self.request_timeout
+        token = openai.aiosession.set(self._get_session())
+        liberar = None
+        try:
+            respuesta, liberar = await self.scheduler.abrir(
+                lambda: openai.ChatCompletion.acreate(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    request_timeout=(self.connect_timeout, timeout),
+                ),
+                self._tokens(messages, prompt_tokens, max_tokens),
+            )
+            async for chunk in respuesta:
+                if not chunk.choices:
+                    continue
+                contenido = chunk.choices[0].get("delta", {}).get("content")
+                if contenido:
+                    yield contenido
+        finally:
+            try:
+                openai.aiosession.reset(token)
+            except ValueError:
+                # El generador se cerró desde otro contexto
+                pass
+            if liberar is not None:
+                liberar()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_llm_client_instance = None
+
+def get_llm_client() -> LLMClient:
+    global _llm_client_instance
+    if _llm_client_instance is None:
+        _llm_client_instance = LLMClient()
+    return _llm_client_instance
+
+
+async def close_llm_client():
+    global _llm_client_instance
+    if _llm_client_instance is not None:
+        await _llm_client_instance.close()
+        _llm_client_instance = None
@@ -0,0 +1,284 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import openai
+
+from app.telemetry import LLM_REINTENTOS, registrar_etapa
+
+logger = logging.getLogger(__name__)
+
+# Límites de la cuenta de OpenAI por minuto (0 = sin límite configurado: se toma el que
+# anuncia OpenAI en las cabeceras x-ratelimit-limit-* de la primera respuesta 429)
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "0"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "0"))
+# Reintentos de 429, 5xx, timeouts y errores de conexión con backoff exponencial y jitter
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "1"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "30"))
+# Espera máxima en la cola de una llamada interactiva (0 = sin límite); los lotes esperan lo que haga falta
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "60"))
+
+# Menor número, antes sale de la cola. El tráfico interactivo adelanta a los lotes
+PRIORIDAD_INTERACTIVA = 0
+PRIORIDAD_LOTE = 1
+NOMBRES_PRIORIDAD = {PRIORIDAD_INTERACTIVA: "interactiva", PRIORIDAD_LOTE: "lote"}
+
+_prioridad_actual: ContextVar[int] = ContextVar("prioridad_llm", default=PRIORIDAD_INTERACTIVA)
+
+
+def prioridad_actual() -> int:
+    return _prioridad_actual.get()
+
+
+@contextmanager
+def prioridad_llm(prioridad: int) -> Iterator[None]:
+    # Como la traza, la prioridad viaja con el contexto hasta las tareas de cada trozo
+    token = _prioridad_actual.set(prioridad)
+    try:
+        yield
+    finally:
+        _prioridad_actual.reset(token)
+
+
+class LLMSaturado(Exception):
+
+    def __init__(self, mensaje: str, retry_after: float):
+        super().__init__(mensaje)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    # Cubo de `por_minuto` unidades que se rellena de forma continua; 0 = sin límite
+
+    def __init__(self, por_minuto: int):
+        self.configurar(por_minuto)
+
+    def configurar(self, por_minuto: int):
+        self.capacidad = por_minuto
+        self.disponible = float(por_minuto)
+        self._ultimo = time.monotonic()
+
+    def _rellenar(self, ahora: float):
+        if self.capacidad > 0:
+            self.disponible = min(self.capacidad, self.disponible + (ahora - self._ultimo) * self.capacidad / 60)
+        self._ultimo = ahora
+
+    def espera(self, n: int, ahora: float) -> float:
+        if self.capacidad <= 0:
+            return 0.0
+        self._rellenar(ahora)
+        # Una llamada mayor que el cubo entero sale cuando está lleno
+        falta = min(n, self.capacidad) - self.disponible
+        return falta * 60 / self.capacidad if falta > 0 else 0.0
+
+    def consumir(self, n: int):
+        if self.capacidad > 0:
+            self.disponible -= min(n, self.capacidad)
+
+    def devolver(self, n: int):
+        if self.capacidad > 0:
+            self.disponible = min(self.capacidad, self.disponible + min(n, self.capacidad))
+
+    def vaciar(self, ahora: float):
+        self._rellenar(ahora)
+        self.disponible = min(self.disponible, 0.0)
+
+
+@dataclass(order=True)
+class _Turno:
+    prioridad: int
+    secuencia: int
+    tokens: int = field(compare=False)
+    creado: float = field(compare=False)
+    admitido: asyncio.Future = field(compare=False)
+
+
+def _retry_after(e: Exception) -> Optional[float]:
+    cabeceras = getattr(e, "headers", None) or {}
+    valor = cabeceras.get("retry-after-ms")
+    if valor is not None:
+        try:
+            return float(valor) / 1000
+        except ValueError:
+            pass
+    valor = cabeceras.get("retry-after")
+    if valor is None:
+        return None
+    try:
+        return max(float(valor), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(valor).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _reintentable(e: Exception) -> bool:
+    if isinstance(e, openai.error.RateLimitError):
+        # Sin saldo no hay espera que lo arregle
+        return e.code != "insufficient_quota"
+    if isinstance(e, (openai.error.ServiceUnavailableError, openai.error.Timeout,
+                      openai.error.APIConnectionError, openai.error.TryAgain)):
+        return True
+    return isinstance(e, openai.error.APIError) and (e.http_status or 0) >= 500
+
+
+class LLMScheduler:
+    # Cola con prioridad delante del LLM: una llamada sale cuando hay hueco de concurrencia
+    # y caben su petición y sus tokens en los límites por minuto. Los tokens que cuenta
+    # OpenAI al admitir una llamada son los del prompt más max_tokens, así que se reservan ambos
+
+    def __init__(self, max_concurrency: int, rpm: int = LLM_RPM_LIMIT, tpm: int = LLM_TPM_LIMIT,
+                 max_retries: int = LLM_MAX_RETRIES, queue_timeout: float = LLM_QUEUE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.queue_timeout = queue_timeout
+        self._rpm = TokenBucket(rpm)
+        self._tpm = TokenBucket(tpm)
+        self._cola: List[_Turno] = []
+        self._secuencia = itertools.count()
+        self._temporizador: Optional[asyncio.TimerHandle] = None
+        self._pausa_hasta = 0.0
+        self.en_curso = 0
+        self.reintentos = 0
+        self.saturadas = 0
+
+    def pendientes(self, prioridad: Optional[int] = None) -> int:
+        return sum(1 for t in self._cola if not t.admitido.done() and prioridad in (None, t.prioridad))
+
+    def _despachar(self):
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+        ahora = time.monotonic()
+        while self._cola:
+            turno = self._cola[0]
+            if turno.admitido.done():
+                # Cancelado o caducado mientras esperaba
+                heapq.heappop(self._cola)
+                continue
+            if self.en_curso >= self.max_concurrency:
+                return  # _liberar vuelve a despachar
+            espera = max(self._pausa_hasta - ahora, self._rpm.espera(1, ahora), self._tpm.espera(turno.tokens, ahora))
+            if espera > 0:
+                # Orden estricto: el primero de la cola no se deja adelantar por llamadas más pequeñas
+                self._temporizador = asyncio.get_running_loop().call_later(espera, self._despachar)
+                return
+            heapq.heappop(self._cola)
+            self._rpm.consumir(1)
+            self._tpm.consumir(turno.tokens)
+            self.en_curso += 1
+            turno.admitido.set_result(ahora - turno.creado)
+
+    def _liberar(self):
+        self.en_curso -= 1
+        self._despachar()
+
+    async def _admitir(self, prioridad: int, secuencia: int, tokens: int) -> float:
+        turno = _Turno(prioridad, secuencia, tokens, time.monotonic(), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._cola, turno)
+        self._despachar()
+        limite = self.queue_timeout if prioridad == PRIORIDAD_INTERACTIVA and self.queue_timeout > 0 else None
+        try:
+            return await asyncio.wait_for(turno.admitido, limite)
+        except asyncio.TimeoutError:
+            self.saturadas += 1
+            raise LLMSaturado(
+                f"LLM saturado: la llamada esperó más de {limite:g}s en cola ({self.pendientes()} en espera)",
+                max(self._pausa_hasta - time.monotonic(), LLM_RETRY_BASE_SECONDS),
+            )
+        except asyncio.CancelledError:
+            if turno.admitido.done() and not turno.admitido.cancelled():
+                # Admitida justo cuando se canceló: no llega a enviarse
+                self._tpm.devolver(tokens)
+                self._rpm.devolver(1)
+                self._liberar()
+            raise
+
+    def _pausar(self, e: Exception, segundos: float):
+        # Tras un 429 no sale nada hasta que pase el Retry-After, y los cubos se vacían:
+        # la estimación iba por delante de lo que cuenta OpenAI y se vuelve al ritmo nominal
+        ahora = time.monotonic()
+        self._pausa_hasta = max(self._pausa_hasta, ahora + segundos)
+        cabeceras = getattr(e, "headers", None) or {}
+        for cubo, cabecera in ((self._rpm, "x-ratelimit-limit-requests"), (self._tpm, "x-ratelimit-limit-tokens")):
+            limite = str(cabeceras.get(cabecera, ""))
+            if cubo.capacidad <= 0 and limite.isdigit() and int(limite) > 0:
+                cubo.configurar(int(limite))
+                logger.info(f"Límite del LLM tomado de {cabecera}: {cubo.capacidad}/min")
+            cubo.vaciar(ahora)
+
+    def _backoff(self, intento: int) -> float:
+        tope = min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** intento)
+        return tope / 2 + random.uniform(0, tope / 2)
+
+    async def abrir(self, llamada: Callable[[], Awaitable[Any]], tokens: int,
+                    prioridad: Optional[int] = None) -> Tuple[Any, Callable[[], None]]:
+        # Ejecuta `llamada` con reintentos y devuelve su resultado con el hueco aún ocupado
+        # (un stream lo mantiene mientras se lee); `liberar` lo devuelve
+        prioridad = prioridad_actual() if prioridad is None else prioridad
+        # El reintento conserva su secuencia: vuelve a la cola por delante de las llamadas posteriores
+        secuencia = next(self._secuencia)
+        for intento in range(self.max_retries + 1):
+            espera = await self._admitir(prioridad, secuencia, tokens)
+            registrar_etapa("cola_llm", NOMBRES_PRIORIDAD.get(prioridad, str(prioridad)), espera)
+            try:
+                resultado = await llamada()
+            except BaseException as e:
+                # También en la cancelación (cliente desconectado): el hueco no puede perderse
+                self._liberar()
+                if not isinstance(e, Exception) or not _reintentable(e):
+                    raise
+                limitado = isinstance(e, openai.error.RateLimitError)
+                pausa = _retry_after(e)
+                if pausa is None:
+                    pausa = self._backoff(intento)
+                if intento == self.max_retries:
+                    if limitado:
+                        self.saturadas += 1
+                        raise LLMSaturado(f"LLM saturado tras {intento + 1} intentos: {e}", pausa) from e
+                    raise
+                self.reintentos += 1
+                LLM_REINTENTOS.labels(type(e).__name__).inc()
+                logger.warning(f"Llamada al LLM fallida ({type(e).__name__}: {e}), reintento {intento + 1} en {pausa:.1f}s")
+                if limitado:
+                    self._pausar(e, pausa)
+                else:
+                    await asyncio.sleep(pausa)
+                continue
+
+            liberado = False
+
+            def liberar():
+                nonlocal liberado
+                if not liberado:
+                    liberado = True
+                    self._liberar()
+
+            return resultado, liberar
+
+    async def ejecutar(self, llamada: Callable[[], Awaitable[Any]], tokens: int, prioridad: Optional[int] = None) -> Any:
+        resultado, liberar = await self.abrir(llamada, tokens, prioridad)
+        liberar()
+        return resultado
+
+    def stats(self) -> Dict:
+        return {
+            "en_curso": self.en_curso,
+            "en_cola": {nombre: self.pendientes(p) for p, nombre in NOMBRES_PRIORIDAD.items()},
+            "rpm": self._rpm.capacidad,
+            "tpm": self._tpm.capacidad,
+            "reintentos": self.reintentos,
+            "saturadas": self.saturadas,
+        }
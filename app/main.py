@@ -1,11 +1,78 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+import asyncio
+import logging
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query
+from fastapi.responses import JSONResponse, Response
 from app.model import ExtractionRequest, ExtractionResponse
-from app.agent import procesar_documento, procesar_dades_venda
-from app.document_parser import detectar_tipo_y_extraer
-from app.security.data_anonymizer import get_anonymizer
-import os
+from app.agent import procesar_documento, precalentar_tokenizador, CHUNK_TOKENS
+from app.normalizer import NORMALIZE_TEXT
+from app.prompts import get_prompt_registry
+from app.llm_client import close_llm_client, get_llm_client
+from app.llm_scheduler import LLMSaturado, NOMBRES_PRIORIDAD
+from app.audit import close_audit_sink, get_audit_sink
+from app.extraction_executor import get_extraction_executor, shutdown_extraction_executor, ExtractionQueueFull, ExtractionTimeout
+from app.cache import get_result_cache, get_text_cache, hash_text, build_key
+from app.uploads import recibir_upload, UploadSizeLimitMiddleware
+from app.pipeline import procesar_archivo, obtener_texto, clave_resultado, extraer_con_mapeo
+from app.document_parser import PARSER_PREWARM
+from app.streaming import respuesta_streaming, eventos_extraccion, eventos_cacheados, PATRON_FORMATO
+from app.security.anonymization_manager import router as anonymization_router
+from app.security.sharding import shutdown_shard_executor
+from app.batch import router as batch_router, start_batch_workers, stop_batch_workers, BATCH_MAX_BYTES, get_batch_queue
+from app.singleflight import get_single_flight
+from app.telemetry import TraceMiddleware, configurar_logging, metricas, registrar_cola
+
+configurar_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Agent IA Documents")
+app.add_middleware(UploadSizeLimitMiddleware, overrides={"/batch": BATCH_MAX_BYTES})
+# El último en añadirse es el más externo: la traza cubre también los rechazos por tamaño
+app.add_middleware(TraceMiddleware)
+app.include_router(batch_router)
+app.include_router(anonymization_router)
+
+# Errores que ya llevan su propio código HTTP y no deben convertirse en 500
+ERRORES_HTTP = (HTTPException, ExtractionQueueFull, ExtractionTimeout, LLMSaturado)
+
+
+@app.exception_handler(ExtractionQueueFull)
+async def cola_llena_handler(request, exc: ExtractionQueueFull):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
+
+@app.exception_handler(ExtractionTimeout)
+async def timeout_extraccion_handler(request, exc: ExtractionTimeout):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
+@app.exception_handler(LLMSaturado)
+async def llm_saturado_handler(request, exc: LLMSaturado):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(max(1, round(exc.retry_after)))})
+
+
+@app.on_event("startup")
+async def startup():
+    await asyncio.to_thread(precalentar_tokenizador)
+    await start_batch_workers()
+    if PARSER_PREWARM:
+        # En segundo plano: el servicio atiende peticiones mientras arrancan los workers
+        app.state.precalentado = asyncio.create_task(get_extraction_executor().precalentar())
+    registrar_cola("extraccion", lambda: get_extraction_executor().pending)
+    registrar_cola("llm_en_curso", lambda: get_llm_client().in_flight)
+    for prioridad, nombre in NOMBRES_PRIORIDAD.items():
+        registrar_cola(f"llm_espera_{nombre}", lambda prioridad=prioridad: get_llm_client().scheduler.pendientes(prioridad))
+    registrar_cola("lotes", lambda: get_batch_queue().depth)
+    registrar_cola("auditoria", lambda: get_audit_sink().stats()["pendientes"])
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_batch_workers()
+    await close_llm_client()
+    await asyncio.to_thread(close_audit_sink)
+    shutdown_extraction_executor()
+    shutdown_shard_executor()
+
 
 @app.get("/")
 async def root():
@@ -17,78 +84,168 @@ async def root():
             "redoc": "/redoc",
             "extraer": "/extraer",
             "extraer-archivo": "/extraer-archivo",
-            "extraer-dades-venda": "/extraer-dades-venda"
+            "extraer-stream": "/extraer/stream",
+            "extraer-archivo-stream": "/extraer-archivo/stream",
+            "extraer-dades-venda": "/extraer-dades-venda",
+            "batch": "/batch",
+            "metrics": "/metrics",
+            "admin-anonimizacion": "/admin/anonymization"
         }
     }
 
+@app.get("/metrics")
+async def metrics():
+    contenido, media_type = metricas()
+    return Response(content=contenido, media_type=media_type)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "resultado": get_result_cache().stats(),
+        "texto": get_text_cache().stats(),
+        "auditoria": get_audit_sink().stats(),
+        "singleflight": {nombre: get_single_flight(nombre).stats() for nombre in ("archivo", "texto")},
+        "llm": get_llm_client().scheduler.stats(),
+    }
+
 @app.post("/extraer", response_model=ExtractionResponse)
 async def extraer(req: ExtractionRequest):
     try:
-        resultado_json = await procesar_documento(
-            req.texto, 
-            proveedor=req.proveedor, 
-            anonymize=req.anonymize
-        )
-        
-        estadisticas = None
-        if req.anonymize:
-            anonymizer = get_anonymizer()
-            _, stats = anonymizer.anonymize(req.texto, req.proveedor)
-            estadisticas = {
-                "total_reemplazos": stats.total_replacements,
-                "por_tipo": stats.by_type
-            }
-        
-        return {
-            "resultado": resultado_json,
-            "estadisticas_anonimizacion": estadisticas
-        }
+        cache = get_result_cache()
+        chunk_tokens = CHUNK_TOKENS["documento"] if req.chunk_tokens is None else req.chunk_tokens
+        normalize = NORMALIZE_TEXT if req.normalize is None else req.normalize
+        prompt_version = get_prompt_registry().version("documento", req.proveedor)
+        clave = build_key("texto", hash_text(req.texto), prompt_version, req.proveedor, req.anonymize, chunk_tokens, normalize)
+        respuesta = cache.get(clave)
+        if respuesta is not None:
+            return respuesta
+
+        async def _extraer():
+            resultado = await procesar_documento(
+                req.texto, 
+                proveedor=req.proveedor, 
+                anonymize=req.anonymize,
+                chunk_tokens=chunk_tokens,
+                paralelismo=req.paralelismo,
+                normalize=normalize
+            )
+            respuesta = _respuesta_extraccion(resultado)
+            # Una lista vacía suele indicar un fallo de parseo: no se cachea
+            if resultado.items:
+                cache.set(clave, respuesta)
+            return respuesta
+
+        return await get_single_flight("texto").ejecutar(clave, _extraer)
+    except ERRORES_HTTP:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _respuesta_extraccion(resultado) -> dict:
+    return {
+        "resultado": resultado.items,
+        "estadisticas_anonimizacion": resultado.anonymization.to_dict() if resultado.anonymization else None,
+        "normalizacion": resultado.normalization.to_dict() if resultado.normalization else None,
+        "tokens": resultado.tokens_dict(),
+        "tiempos": resultado.timings
+    }
+
+
+@app.post("/extraer/stream")
+async def extraer_stream(req: ExtractionRequest, formato: str = Query("ndjson", pattern=PATRON_FORMATO)):
+    cache = get_result_cache()
+    chunk_tokens = CHUNK_TOKENS["documento"] if req.chunk_tokens is None else req.chunk_tokens
+    normalize = NORMALIZE_TEXT if req.normalize is None else req.normalize
+    prompt_version = get_prompt_registry().version("documento", req.proveedor)
+    clave = build_key("texto", hash_text(req.texto), prompt_version, req.proveedor, req.anonymize, chunk_tokens, normalize)
+    respuesta = cache.get(clave)
+    if respuesta is not None:
+        fin = {"cache": True, **{k: v for k, v in respuesta.items() if k != "resultado"}}
+        return respuesta_streaming(eventos_cacheados(respuesta["resultado"], fin), formato)
+
+    def _guardar(resultado):
+        if resultado.items:
+            cache.set(clave, _respuesta_extraccion(resultado))
+
+    eventos = eventos_extraccion(
+        req.texto, "documento", req.proveedor, req.anonymize, chunk_tokens, req.paralelismo, _guardar, normalize
+    )
+    return respuesta_streaming(eventos, formato)
+
+
 @app.post("/extraer-archivo")
 async def extraer_desde_archivo(
     file: UploadFile = File(...),
     proveedor: str = Form(None),
-    anonymize: bool = Form(True)
+    anonymize: bool = Form(True),
+    chunk_tokens: int = Form(None, ge=0),
+    paralelismo: int = Form(None, ge=1),
+    normalize: bool = Form(None)
 ):
     try:
-        print(f"DEBUG: Parámetros recibidos - proveedor: {proveedor}, anonymize: {anonymize}")
+        logger.debug(f"Parámetros recibidos - proveedor: {proveedor}, anonymize: {anonymize}")
         
-        temp_path = f"/tmp/{file.filename}"
-        with open(temp_path, "wb") as f:
-            f.write(await file.read())
+        async with recibir_upload(file) as doc:
+            resultado = await procesar_archivo(doc, "documento", proveedor, anonymize, chunk_tokens, paralelismo, normalize)
+        return {"resultado": resultado}
+    except ERRORES_HTTP:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error procesando archivo: {e}")
 
-        texto = detectar_tipo_y_extraer(temp_path)
-        print(f"DEBUG: Texto extraído (primeros 200 chars): {texto[:200]}")
-        
-        resultado = await procesar_documento(texto, proveedor, anonymize)
 
-        os.remove(temp_path)
-        return {"resultado": resultado}
+@app.post("/extraer-archivo/stream")
+async def extraer_desde_archivo_stream(
+    file: UploadFile = File(...),
+    proveedor: str = Form(None),
+    anonymize: bool = Form(True),
+    chunk_tokens: int = Form(None, ge=0),
+    paralelismo: int = Form(None, ge=1),
+    normalize: bool = Form(None),
+    formato: str = Form("ndjson", pattern=PATRON_FORMATO)
+):
+    # El texto se extrae antes de abrir el stream: los errores de parseo o de cola llena
+    # siguen devolviendo su código HTTP
+    try:
+        async with recibir_upload(file) as doc:
+            resultado = await extraer_con_mapeo(doc, "documento", proveedor)
+            if resultado is not None:
+                return respuesta_streaming(eventos_cacheados(resultado, {"mapeo": True}), formato)
+            cache = get_result_cache()
+            clave = clave_resultado(doc, "documento", proveedor, anonymize, chunk_tokens, normalize)
+            resultado = cache.get(clave)
+            if resultado is not None:
+                return respuesta_streaming(eventos_cacheados(resultado), formato)
+            texto = await obtener_texto(doc)
+    except ERRORES_HTTP:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error procesando archivo: {e}")
 
+    def _guardar(resultado):
+        if resultado.items:
+            cache.set(clave, resultado.items)
+
+    eventos = eventos_extraccion(texto, "documento", proveedor, anonymize, chunk_tokens, paralelismo, _guardar, normalize)
+    return respuesta_streaming(eventos, formato)
+
 
 @app.post("/extraer-dades-venda")
 async def extraer_dades_venda(
     file: UploadFile = File(...),
-    anonymize: bool = Form(True)
+    anonymize: bool = Form(True),
+    chunk_tokens: int = Form(None, ge=0),
+    paralelismo: int = Form(None, ge=1),
+    normalize: bool = Form(None)
 ):
     try:
-        print(f"DEBUG DADES VENDA: Parámetros recibidos - anonymize: {anonymize}")
+        logger.debug(f"Dades venda: parámetros recibidos - anonymize: {anonymize}")
         
-        temp_path = f"/tmp/{file.filename}"
-        with open(temp_path, "wb") as f:
-            f.write(await file.read())
-
-        texto = detectar_tipo_y_extraer(temp_path)
-        print(f"DEBUG DADES VENDA: Texto extraído (primeros 200 chars): {texto[:200]}")
-        
-        resultado = await procesar_dades_venda(texto, None, anonymize)
-
-        os.remove(temp_path)
+        async with recibir_upload(file) as doc:
+            resultado = await procesar_archivo(doc, "dades_venda", None, anonymize, chunk_tokens, paralelismo, normalize)
         return {"resultado": resultado}
+    except ERRORES_HTTP:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error procesando dades venda: {e}")
@@ -0,0 +1,361 @@
+import io
+import json
+import os
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+import logging
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from app.document_parser import LONGITUD_CABECERA, detectar_parser
+from app.parsers.tablas import iterar_filas_csv
+from app.uploads import UploadedDocument
+
+logger = logging.getLogger(__name__)
+
+# Mapeos declarativos por proveedor para documentos estructurados (XML, CSV, Excel).
+# Si un documento encaja con un mapeo, el resultado se construye directamente sin LLM
+EXTRACTION_MAPPINGS_PATH = os.getenv(
+    "EXTRACTION_MAPPINGS_PATH",
+    os.path.join(os.path.dirname(__file__), "config", "extraction_mappings.json"),
+)
+
+# Cada cuánto se comprueba (stat) si el fichero de mapeos ha cambiado
+EXTRACTION_MAPPINGS_RELOAD_INTERVAL = float(os.getenv("EXTRACTION_MAPPINGS_RELOAD_INTERVAL", "2"))
+
+# Mapeos que se prueban para cualquier proveedor, después de los del propio proveedor
+PROVEEDOR_COMODIN = "*"
+
+# Formato de mapeo según el parser que detecta app.document_parser (firma y extensión)
+FORMATOS_POR_PARSER = {
+    "xml": "xml",
+    "csv": "tabla",
+    "excel": "tabla",
+}
+
+_NUMERO = re.compile(r'-?\d+(?:\.\d+)?')
+_MILES_ES = re.compile(r'^-?\d{1,3}(?:\.\d{3})+(?:,\d+)?$')
+_FECHA_DMY = re.compile(r'^(\d{1,2})[/.\-](\d{1,2})[/.\-](\d{2,4})$')
+_FECHA_YMD = re.compile(r'^(\d{4})[/.\-](\d{1,2})[/.\-](\d{1,2})')
+_FECHA_MY = re.compile(r'^(\d{1,2})[/.\-](\d{4})$')
+
+
+def _a_entero(valor: str):
+    valor = valor.strip().replace(" ", "")
+    if _MILES_ES.match(valor):
+        # 1.000 / 1.000,00 son miles en los albaranes en castellano
+        valor = valor.replace(".", "").replace(",", ".")
+    elif "," in valor and "." in valor:
+        valor = valor.replace(",", "")
+    else:
+        valor = valor.replace(",", ".")
+    match = _NUMERO.search(valor)
+    if not match:
+        return 0
+    return int(float(match.group()))
+
+
+def _a_fecha(valor: str) -> str:
+    # Mismo formato que pide el prompt: YYYY-MM-DD, con día 01 si solo hay mes y año
+    valor = valor.strip()
+    try:
+        if m := _FECHA_YMD.match(valor):
+            return date(int(m.group(1)), int(m.group(2)), int(m.group(3))).isoformat()
+        if m := _FECHA_DMY.match(valor):
+            anio = int(m.group(3))
+            anio = anio + 2000 if anio < 100 else anio
+            return date(anio, int(m.group(2)), int(m.group(1))).isoformat()
+        if m := _FECHA_MY.match(valor):
+            return date(int(m.group(2)), int(m.group(1)), 1).isoformat()
+    except ValueError:
+        pass
+    return valor
+
+
+CONVERSORES = {
+    "str": lambda valor: valor.strip(),
+    "int": _a_entero,
+    "fecha": _a_fecha,
+}
+
+
+class Mapping:
+
+    def __init__(self, nombre: str, definicion: Dict):
+        self.nombre = nombre
+        self.formato = definicion["formato"]
+        self.campos: Dict[str, str] = definicion["campos"]
+        self.tipos: Dict[str, str] = definicion.get("tipos", {})
+        self.requeridos: List[str] = definicion.get("requeridos", ["codigo"])
+        # XML: ruta ElementTree de cada fila
+        self.filas: str = definicion.get("filas", ".//item")
+        # La misma ruta como pasos de etiqueta ("" = cualquier profundidad) para reconocer las
+        # filas durante el iterparse; None si usa predicados u otra sintaxis que exige el árbol entero
+        self.pasos_filas = _pasos_ruta(self.filas)
+        # Tablas: separador del CSV (se detecta si falta) y hoja del Excel
+        self.separador: Optional[str] = definicion.get("separador")
+        self.hoja = definicion.get("hoja", 0)
+
+        for campo, tipo in self.tipos.items():
+            if tipo not in CONVERSORES:
+                raise ValueError(f"Tipo '{tipo}' no soportado en el campo {campo} del mapeo {nombre}")
+
+    def _item(self, valores: Dict[str, str]) -> Optional[Dict]:
+        if any(not valores.get(campo, "").strip() for campo in self.requeridos):
+            return None
+        return {
+            campo: CONVERSORES[self.tipos.get(campo, "str")](valores.get(campo) or "")
+            for campo in self.campos
+        }
+
+    def item_xml(self, fila: ET.Element) -> Optional[Dict]:
+        valores = {}
+        for campo, ruta in self.campos.items():
+            # "hijo/nieto" para texto y "hijo/@atributo" o "@atributo" para atributos
+            ruta, _, atributo = ruta.partition("@")
+            ruta = ruta.rstrip("/")
+            nodo = fila.find(ruta) if ruta else fila
+            if nodo is None:
+                continue
+            valor = nodo.get(atributo) if atributo else nodo.text
+            valores[campo] = valor or ""
+        return self._item(valores)
+
+    def aplicar_xml(self, root: ET.Element) -> List[Dict]:
+        return [item for item in map(self.item_xml, root.iterfind(self.filas)) if item is not None]
+
+    def aplicar_tabla(self, cabecera: List[str], filas: List[List[str]]) -> List[Dict]:
+        indices = {nombre.strip().lower(): i for i, nombre in enumerate(cabecera)}
+        columnas = {campo: indices.get(columna.strip().lower()) for campo, columna in self.campos.items()}
+        if any(columnas.get(campo) is None for campo in self.requeridos):
+            return []
+
+        items = []
+        for fila in filas:
+            valores = {
+                campo: fila[i] if i is not None and i < len(fila) else ""
+                for campo, i in columnas.items()
+            }
+            item = self._item(valores)
+            if item is not None:
+                items.append(item)
+        return items
+
+
+_PASO_SIMPLE = re.compile(r'^(?:\*|(?:\{[^}]*\})?[\w\-.]+)$')
+
+
+def _pasos_ruta(ruta: str) -> Optional[List[str]]:
+    # ".//item" -> ["", "item"], "lineas/linea" -> ["lineas", "linea"], relativos a la raíz
+    pasos = []
+    for paso in re.sub(r'^\./', '', ruta).split("/"):
+        if paso == "" and pasos and pasos[-1] == "":
+            return None
+        if paso == "" or _PASO_SIMPLE.match(paso) and paso not in (".", ".."):
+            pasos.append(paso)
+        else:
+            return None
+    return pasos if pasos and pasos[-1] else None
+
+
+def _casa_ruta(pasos: List[str], etiquetas: List[str]) -> bool:
+    # `etiquetas`: camino desde el primer hijo de la raíz hasta el elemento
+    if not pasos:
+        return not etiquetas
+    if pasos[0] == "":
+        return any(_casa_ruta(pasos[1:], etiquetas[i:]) for i in range(len(etiquetas)))
+    return bool(etiquetas) and pasos[0] in ("*", etiquetas[0]) and _casa_ruta(pasos[1:], etiquetas[1:])
+
+
+def _origen(doc: UploadedDocument):
+    return io.BytesIO(doc.data) if doc.data is not None else doc.path
+
+
+def _cabecera(doc: UploadedDocument) -> bytes:
+    if doc.data is not None:
+        return doc.data[:LONGITUD_CABECERA]
+    with open(doc.path, "rb") as f:
+        return f.read(LONGITUD_CABECERA)
+
+
+def _contenido(doc: UploadedDocument) -> bytes:
+    if doc.data is not None:
+        return doc.data
+    with open(doc.path, "rb") as f:
+        return f.read()
+
+
+def _aplicar_xml_streaming(doc: UploadedDocument, candidatos: List[Mapping]) -> List[List[Dict]]:
+    # Una sola pasada de iterparse para todos los candidatos: cada fila se convierte en
+    # item al cerrarse y, si no está dentro de otra fila, se libera, así la memoria no
+    # crece con el documento (como app.parsers.xml)
+    items: List[List[Tuple[int, Dict]]] = [[] for _ in candidatos]
+    # (elemento, etiquetas desde el primer hijo de la raíz, candidatos que lo tienen por fila, orden)
+    pila: List[Tuple[ET.Element, Tuple[str, ...], List[int], int]] = []
+    # Un documento tiene pocos caminos de etiquetas distintos: cada uno se compara una vez
+    casan_por_ruta: Dict[Tuple[str, ...], List[int]] = {}
+    filas_abiertas = 0
+    orden = 0
+    for evento, elem in ET.iterparse(_origen(doc), events=("start", "end")):
+        if evento == "start":
+            etiquetas: Tuple[str, ...] = pila[-1][1] + (elem.tag,) if pila else ()
+            casan = casan_por_ruta.get(etiquetas)
+            if casan is None:
+                casan = [i for i, m in enumerate(candidatos) if pila and _casa_ruta(m.pasos_filas, list(etiquetas))]
+                casan_por_ruta[etiquetas] = casan
+            filas_abiertas += bool(casan)
+            pila.append((elem, etiquetas, casan, orden))
+            orden += 1
+            continue
+
+        _, _, casan, posicion = pila.pop()
+        for i in casan:
+            item = candidatos[i].item_xml(elem)
+            if item is not None:
+                items[i].append((posicion, item))
+        filas_abiertas -= bool(casan)
+        if not filas_abiertas and pila:
+            elem.clear()
+            pila[-1][0].remove(elem)
+    # Orden del documento, como iterfind (una fila anidada se cierra antes que la que la contiene)
+    return [[item for _, item in sorted(encontrados, key=lambda x: x[0])] for encontrados in items]
+
+
+def _cabecera_y_filas(filas) -> Tuple[List[str], List[List[str]]]:
+    filas = [fila for fila in filas if any(celda for celda in fila)]
+    return (filas[0], filas[1:]) if filas else ([], [])
+
+
+def _leer_csv(data: bytes, separador: Optional[str]):
+    return _cabecera_y_filas(iterar_filas_csv(io.BytesIO(data), separador))
+
+
+def _leer_excel(doc: UploadedDocument, hoja):
+    from app.parsers.excel import iterar_filas_excel
+
+    return _cabecera_y_filas(iterar_filas_excel(_origen(doc), hoja))
+
+
+class MappingEngine:
+
+    def __init__(self, path: str = EXTRACTION_MAPPINGS_PATH,
+                 reload_interval: float = EXTRACTION_MAPPINGS_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._recarga_lock = threading.Lock()
+        self._mappings: Dict[str, Dict[str, List[Mapping]]] = {}
+        self._firma: Optional[Tuple[int, int]] = None
+        self._revisado = time.monotonic()
+        self.reload()
+
+    def _firma_actual(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _recargar_si_cambia(self):
+        # Como las plantillas de prompt: el fichero solo se revisa cada reload_interval
+        # segundos y un mapeo nuevo se aplica sin reiniciar
+        if self.reload_interval <= 0 or time.monotonic() - self._revisado < self.reload_interval:
+            return
+        with self._recarga_lock:
+            if time.monotonic() - self._revisado < self.reload_interval:
+                return
+            self._revisado = time.monotonic()
+            if self._firma_actual() != self._firma:
+                self.reload()
+
+    def reload(self):
+        mappings: Dict[str, Dict[str, List[Mapping]]] = {}
+        # Se anota antes de leer: un fichero con errores no se reintenta hasta que cambie
+        self._firma = self._firma_actual()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                config = json.load(f)
+        except FileNotFoundError:
+            config = {}
+        except Exception as e:
+            logger.error(f"Error cargando mapeos de extracción {self.path}: {e}")
+            return
+
+        for proveedor, por_tipo in config.items():
+            if proveedor.startswith("_") or not isinstance(por_tipo, dict):
+                continue
+            for tipo, definiciones in por_tipo.items():
+                for i, definicion in enumerate(definiciones):
+                    nombre = definicion.get("nombre") or f"{proveedor}/{tipo}/{i}"
+                    try:
+                        mapping = Mapping(nombre, definicion)
+                    except (KeyError, ValueError) as e:
+                        logger.error(f"Mapeo de extracción inválido {nombre}: {e}")
+                        continue
+                    mappings.setdefault(proveedor, {}).setdefault(tipo, []).append(mapping)
+
+        with self._lock:
+            self._mappings = mappings
+        logger.info(f"Mapeos de extracción cargados para {len(mappings)} proveedores")
+
+    def candidatos(self, tipo: str, proveedor: Optional[str], formato: str) -> List[Mapping]:
+        self._recargar_si_cambia()
+        with self._lock:
+            mappings = self._mappings
+        candidatos = []
+        for clave in ([proveedor] if proveedor else []) + [PROVEEDOR_COMODIN]:
+            candidatos.extend(m for m in mappings.get(clave, {}).get(tipo, []) if m.formato == formato)
+        return candidatos
+
+    def extraer(self, doc: UploadedDocument, tipo: str, proveedor: Optional[str]) -> Optional[List[Dict]]:
+        # Devuelve None si ningún mapeo encaja y hay que recurrir al LLM
+        try:
+            parser = detectar_parser(_cabecera(doc), doc.filename).nombre
+        except (OSError, ValueError):
+            return None
+        formato = FORMATOS_POR_PARSER.get(parser)
+        candidatos = self.candidatos(tipo, proveedor, formato) if formato else []
+        if not candidatos:
+            return None
+
+        try:
+            if formato == "xml":
+                if all(mapping.pasos_filas is not None for mapping in candidatos):
+                    encontrados = _aplicar_xml_streaming(doc, candidatos)
+                else:
+                    # Alguna ruta de filas necesita el árbol completo (predicados, "..")
+                    root = ET.parse(_origen(doc)).getroot()
+                    encontrados = [mapping.aplicar_xml(root) for mapping in candidatos]
+                for mapping, items in zip(candidatos, encontrados):
+                    if items:
+                        return self._encontrado(mapping, doc, items)
+            else:
+                leidas = {}
+                for mapping in candidatos:
+                    clave = mapping.hoja if parser == "excel" else mapping.separador
+                    if clave not in leidas:
+                        if parser == "csv":
+                            leidas[clave] = _leer_csv(_contenido(doc), mapping.separador)
+                        else:
+                            leidas[clave] = _leer_excel(doc, mapping.hoja)
+                    items = mapping.aplicar_tabla(*leidas[clave])
+                    if items:
+                        return self._encontrado(mapping, doc, items)
+        except Exception as e:
+            logger.warning(f"No se pudo aplicar el mapeo a {doc.filename}, se usará el LLM: {e}")
+        return None
+
+    def _encontrado(self, mapping: Mapping, doc: UploadedDocument, items: List[Dict]) -> List[Dict]:
+        logger.info(f"{doc.filename}: {len(items)} items extraídos con el mapeo {mapping.nombre} (sin LLM)")
+        return items
+
+
+_engine_instance = None
+
+def get_mapping_engine() -> MappingEngine:
+    global _engine_instance
+    if _engine_instance is None:
+        _engine_instance = MappingEngine()
+    return _engine_instance
@@ -1,11 +1,17 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, Any
 
 class ExtractionRequest(BaseModel):
     texto: str
     proveedor: Optional[str] = None
     anonymize: bool = True
+    chunk_tokens: Optional[int] = Field(None, ge=0)
+    paralelismo: Optional[int] = Field(None, ge=1)
+    normalize: Optional[bool] = None
 
 class ExtractionResponse(BaseModel):
     resultado: Any
     estadisticas_anonimizacion: Optional[dict] = None
+    normalizacion: Optional[dict] = None
+    tokens: Optional[dict] = None
+    tiempos: Optional[dict] = None
@@ -0,0 +1,110 @@
+import os
+import re
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Normalización del texto extraído antes de anonimizar y enviar al LLM
+NORMALIZE_TEXT = os.getenv("NORMALIZE_TEXT", "true").lower() in ("1", "true", "yes")
+# Líneas del principio y del final de cada página candidatas a cabecera/pie
+NORMALIZE_ZONA_PAGINA = int(os.getenv("NORMALIZE_ZONA_PAGINA", "6"))
+# Fracción mínima de páginas en las que debe repetirse una línea para considerarla cabecera/pie
+NORMALIZE_MIN_FRACCION_PAGINAS = float(os.getenv("NORMALIZE_MIN_FRACCION_PAGINAS", "0.5"))
+
+SEPARADOR_PAGINA = "\f"
+
+BOILERPLATE_PATRONES = [
+    r'(?:p[áa]gina|p[àa]gina|page|p[áa]g\.?)\s*\d+(?:\s*(?:de|of|/)\s*\d+)?',
+    r'-\s*\d+\s*-',
+    r'[\s\-=_*.·|~+]{3,}',
+    r'(?:suma y sigue|contin[úu]a en la p[áa]gina siguiente|sigue\s*\.\.\.)',
+]
+_BOILERPLATE = re.compile(r'^\s*(?:' + '|'.join(BOILERPLATE_PATRONES) + r')\s*$', re.IGNORECASE)
+_ESPACIOS = re.compile(r'[ \u00a0]{2,}')
+# En una cabecera o pie repetido solo cambia de una página a otra el número de página
+_NUMERO_PAGINA = re.compile(BOILERPLATE_PATRONES[0], re.IGNORECASE)
+# Importes con decimales o celdas separadas por tabuladores: filas de la tabla, nunca se quitan
+_FILA_DATOS = re.compile(r'\d[,.]\d\d(?!\d)|\t')
+
+
+@dataclass
+class NormalizationStats:
+    caracteres_antes: int = 0
+    caracteres_despues: int = 0
+    tokens_antes: int = 0
+    tokens_despues: int = 0
+    lineas_repetidas: int = 0
+    lineas_boilerplate: int = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "caracteres_antes": self.caracteres_antes,
+            "caracteres_despues": self.caracteres_despues,
+            "tokens_antes": self.tokens_antes,
+            "tokens_despues": self.tokens_despues,
+            "tokens_ahorrados": self.tokens_antes - self.tokens_despues,
+            "lineas_repetidas": self.lineas_repetidas,
+            "lineas_boilerplate": self.lineas_boilerplate,
+        }
+
+
+def _clave_repeticion(linea: str) -> str:
+    # Solo se igualan líneas idénticas salvo por el número de página: con cualquier otro
+    # número enmascarado, filas de producto que difieren en código, lote o cantidad
+    # compartirían clave y se borrarían como si fueran cabecera
+    if _FILA_DATOS.search(linea):
+        return ""
+    return _NUMERO_PAGINA.sub("#", " ".join(linea.split()).lower())
+
+
+def _cabeceras_repetidas(paginas: List[List[str]]) -> set:
+    if len(paginas) < 2:
+        return set()
+    apariciones: Counter = Counter()
+    for lineas in paginas:
+        no_vacias = [l for l in lineas if l.strip()]
+        zona = no_vacias[:NORMALIZE_ZONA_PAGINA] + no_vacias[-NORMALIZE_ZONA_PAGINA:]
+        apariciones.update({_clave_repeticion(l) for l in zona})
+    minimo = max(2, int(len(paginas) * NORMALIZE_MIN_FRACCION_PAGINAS + 0.5))
+    return {clave for clave, n in apariciones.items() if n >= minimo and clave}
+
+
+def normalizar_texto(texto: str, stats: Optional[NormalizationStats] = None) -> str:
+    stats = stats if stats is not None else NormalizationStats()
+    stats.caracteres_antes = len(texto)
+
+    paginas = [pagina.split("\n") for pagina in texto.split(SEPARADOR_PAGINA)]
+    repetidas = _cabeceras_repetidas(paginas)
+
+    salida: List[str] = []
+    vistas = set()
+    for lineas in paginas:
+        no_vacias = [i for i, l in enumerate(lineas) if l.strip()]
+        zona = set(no_vacias[:NORMALIZE_ZONA_PAGINA] + no_vacias[-NORMALIZE_ZONA_PAGINA:])
+        for i, linea in enumerate(lineas):
+            # Los tabuladores separan celdas de tablas y se conservan
+            linea = _ESPACIOS.sub("  ", linea).strip(" \u00a0\r")
+            if not linea.strip():
+                # Una sola línea en blanco entre bloques: el troceo la usa como frontera
+                if salida and salida[-1]:
+                    salida.append("")
+                continue
+            if _BOILERPLATE.match(linea):
+                stats.lineas_boilerplate += 1
+                continue
+            if i in zona and repetidas:
+                clave = _clave_repeticion(linea)
+                if clave and clave in repetidas:
+                    # Se conserva la primera aparición (datos del proveedor en la cabecera)
+                    if clave in vistas:
+                        stats.lineas_repetidas += 1
+                        continue
+                    vistas.add(clave)
+            salida.append(linea)
+
+    resultado = "\n".join(salida).strip()
+    stats.caracteres_despues = len(resultado)
+    return resultado
@@ -0,0 +1,272 @@
+import os
+import re
+import time
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pytesseract
+from PIL import Image, ImageOps
+
+from app.telemetry import registrar_etapa
+
+logger = logging.getLogger(__name__)
+
+# Primera pasada con un solo modelo; el idioma real se decide con su resultado
+OCR_IDIOMA_INICIAL = os.getenv("OCR_IDIOMA_INICIAL", "spa")
+# Idiomas entre los que se elige (antes se usaban todos a la vez: spa+eng+deu+cat)
+OCR_IDIOMAS = os.getenv("OCR_IDIOMAS", "spa,cat,eng,deu").split(",")
+# Un segundo idioma se añade si puntúa al menos esta fracción del primero (albaranes bilingües)
+OCR_FRACCION_SEGUNDO_IDIOMA = float(os.getenv("OCR_FRACCION_SEGUNDO_IDIOMA", "0.5"))
+
+# DPI de los PDF escaneados: se empieza bajo y solo se sube si el texto sale pequeño
+# o con poca confianza
+OCR_PDF_DPI_BAJO = int(os.getenv("OCR_PDF_DPI_BAJO", "200"))
+OCR_PDF_DPI_ALTO = int(os.getenv("OCR_PDF_DPI_ALTO", "300"))
+OCR_CONFIANZA_MINIMA = float(os.getenv("OCR_CONFIANZA_MINIMA", "70"))
+# Altura mediana de palabra (px) por debajo de la cual tesseract pierde precisión
+OCR_ALTURA_MINIMA_PX = int(os.getenv("OCR_ALTURA_MINIMA_PX", "20"))
+# Las fotos de móvil se reducen a este lado máximo (un A4 a 300 dpi mide 3508 px)
+OCR_MAX_LADO = int(os.getenv("OCR_MAX_LADO", "3500"))
+
+# Búsqueda del ángulo de inclinación sobre una miniatura
+OCR_DESKEW_MAX_GRADOS = float(os.getenv("OCR_DESKEW_MAX_GRADOS", "5"))
+OCR_DESKEW_PASO = 0.5
+OCR_DESKEW_LADO = 800
+
+# Solo palabras propias de cada idioma: las comunes a español y catalán ("de", "la", "el",
+# "que", "factura"...) o a varios ("total") sumarían a los dos y un texto en español
+# acabaría con una segunda pasada spa+cat
+PALABRAS_IDIOMA = {
+    "spa": {"y", "los", "las", "por", "con", "para", "fecha", "cantidad", "albarán", "albaran",
+            "pedido", "precio", "unidades", "lote", "entrega", "mercancía", "mercancia", "cliente",
+            "dirección", "direccion"},
+    "cat": {"i", "els", "les", "per", "amb", "data", "quantitat", "albarà", "comanda", "preu",
+            "unitats", "lot", "lliurament", "mercaderia", "client", "adreça"},
+    "eng": {"the", "and", "of", "to", "for", "with", "date", "quantity", "invoice", "order",
+            "price", "units", "batch", "delivery", "customer", "address"},
+    "deu": {"der", "die", "das", "und", "mit", "für", "von", "den", "datum", "menge",
+            "rechnung", "lieferschein", "preis", "stück", "charge", "bestellung"},
+}
+_PALABRA = re.compile(r"[^\W\d_]+")
+
+
+@dataclass
+class OCRPasada:
+    dpi: Optional[int]
+    idioma: str
+    segundos: float
+    confianza: float
+    altura_px: float
+
+
+@dataclass
+class OCRPagina:
+    numero: int = 1
+    texto: str = ""
+    idioma: str = ""
+    dpi: Optional[int] = None
+    inclinacion: float = 0.0
+    segundos_render: float = 0.0
+    segundos_preproceso: float = 0.0
+    segundos_ocr: float = 0.0
+    pasadas: List[OCRPasada] = field(default_factory=list)
+
+    @property
+    def segundos(self) -> float:
+        return self.segundos_render + self.segundos_preproceso + self.segundos_ocr
+
+    def to_dict(self) -> Dict:
+        return {
+            "pagina": self.numero,
+            "idioma": self.idioma,
+            "dpi": self.dpi,
+            "inclinacion": self.inclinacion,
+            "pasadas": len(self.pasadas),
+            "confianza": self.pasadas[-1].confianza if self.pasadas else None,
+            "segundos": round(self.segundos, 3),
+            "segundos_render": round(self.segundos_render, 3),
+            "segundos_preproceso": round(self.segundos_preproceso, 3),
+            "segundos_ocr": round(self.segundos_ocr, 3),
+        }
+
+
+def _umbral_otsu(gris: Image.Image) -> int:
+    histograma = np.array(gris.histogram()[:256], dtype=np.float64)
+    total = histograma.sum()
+    if not total:
+        return 128
+    niveles = np.arange(256)
+    peso_fondo = np.cumsum(histograma)
+    suma_fondo = np.cumsum(histograma * niveles)
+    peso_texto = total - peso_fondo
+    with np.errstate(divide="ignore", invalid="ignore"):
+        media_fondo = suma_fondo / peso_fondo
+        media_texto = (suma_fondo[-1] - suma_fondo) / peso_texto
+        varianza = peso_fondo * peso_texto * (media_fondo - media_texto) ** 2
+    return int(np.nanargmax(varianza))
+
+
+def _angulo_inclinacion(binaria: Image.Image) -> float:
+    # Perfil de proyección: con el ángulo correcto las líneas de texto dan filas muy
+    # negras separadas por filas blancas, es decir, la máxima varianza entre filas
+    miniatura = binaria.copy()
+    miniatura.thumbnail((OCR_DESKEW_LADO, OCR_DESKEW_LADO))
+    miniatura = ImageOps.invert(miniatura)
+    mejor, mejor_varianza = 0.0, -1.0
+    for angulo in np.arange(-OCR_DESKEW_MAX_GRADOS, OCR_DESKEW_MAX_GRADOS + OCR_DESKEW_PASO / 2, OCR_DESKEW_PASO):
+        rotada = miniatura.rotate(float(angulo), resample=Image.NEAREST, fillcolor=0)
+        varianza = float(np.asarray(rotada, dtype=np.float32).sum(axis=1).var())
+        if varianza > mejor_varianza:
+            mejor, mejor_varianza = float(angulo), varianza
+    return mejor
+
+
+def preprocesar(imagen: Image.Image) -> Tuple[Image.Image, float]:
+    # Escala de grises, reducción, binarización (Otsu) y enderezado
+    imagen = ImageOps.exif_transpose(imagen)
+    gris = ImageOps.autocontrast(imagen.convert("L"))
+    if max(gris.size) > OCR_MAX_LADO:
+        gris.thumbnail((OCR_MAX_LADO, OCR_MAX_LADO), Image.LANCZOS)
+    umbral = _umbral_otsu(gris)
+    tabla = [0] * (umbral + 1) + [255] * (255 - umbral)
+    angulo = _angulo_inclinacion(gris.point(tabla)) if OCR_DESKEW_MAX_GRADOS > 0 else 0.0
+    if angulo:
+        # Se rota la imagen en grises (bilineal es bastante más rápido que bicúbico sobre un A4)
+        # y se binariza una sola vez después
+        gris = gris.rotate(angulo, resample=Image.BILINEAR, expand=True, fillcolor=255)
+    return gris.point(tabla), angulo
+
+
+def detectar_idioma(texto: str) -> str:
+    # Recuento de palabras frecuentes por idioma sobre el texto de la primera pasada
+    palabras = Counter(p.lower() for p in _PALABRA.findall(texto))
+    puntos = {
+        idioma: sum(n for palabra, n in palabras.items() if palabra in PALABRAS_IDIOMA.get(idioma, ()))
+        for idioma in OCR_IDIOMAS
+    }
+    ordenados = sorted(puntos.items(), key=lambda x: x[1], reverse=True)
+    if not ordenados or not ordenados[0][1]:
+        return OCR_IDIOMA_INICIAL
+    idiomas = [ordenados[0][0]]
+    if len(ordenados) > 1 and ordenados[1][1] >= ordenados[0][1] * OCR_FRACCION_SEGUNDO_IDIOMA:
+        idiomas.append(ordenados[1][0])
+    return "+".join(idiomas)
+
+
+def _texto_desde_datos(datos: Dict) -> Tuple[str, float, float]:
+    # Una sola llamada a tesseract (image_to_data) da el texto, la confianza y el tamaño de letra
+    lineas: Dict[Tuple[int, int, int], List[str]] = {}
+    confianzas, alturas = [], []
+    for i, palabra in enumerate(datos["text"]):
+        confianza = float(datos["conf"][i])
+        if confianza < 0 or not palabra.strip():
+            continue
+        confianzas.append(confianza)
+        alturas.append(datos["height"][i])
+        clave = (datos["block_num"][i], datos["par_num"][i], datos["line_num"][i])
+        lineas.setdefault(clave, []).append(palabra)
+
+    partes, bloque_anterior = [], None
+    for (bloque, parrafo, _), palabras in lineas.items():
+        if bloque_anterior is not None and (bloque, parrafo) != bloque_anterior:
+            partes.append("")
+        partes.append(" ".join(palabras))
+        bloque_anterior = (bloque, parrafo)
+
+    confianza = sum(confianzas) / len(confianzas) if confianzas else 0.0
+    altura = float(np.median(alturas)) if alturas else 0.0
+    return "\n".join(partes), confianza, altura
+
+
+class OCREngine:
+
+    def _pasada(self, imagen: Image.Image, idioma: str, dpi: Optional[int], pagina: OCRPagina) -> str:
+        inicio = time.perf_counter()
+        datos = pytesseract.image_to_data(imagen, lang=idioma, output_type=pytesseract.Output.DICT)
+        texto, confianza, altura = _texto_desde_datos(datos)
+        segundos = time.perf_counter() - inicio
+        pagina.segundos_ocr += segundos
+        pagina.pasadas.append(OCRPasada(dpi, idioma, segundos, round(confianza, 1), altura))
+        return texto
+
+    def _preprocesar(self, imagen: Image.Image, pagina: OCRPagina) -> Image.Image:
+        inicio = time.perf_counter()
+        procesada, pagina.inclinacion = preprocesar(imagen)
+        pagina.segundos_preproceso += time.perf_counter() - inicio
+        return procesada
+
+    def _reconocer(self, imagen: Image.Image, pagina: OCRPagina, dpi: Optional[int],
+                   idioma: Optional[str]) -> str:
+        procesada = self._preprocesar(imagen, pagina)
+        if idioma is None:
+            texto = self._pasada(procesada, OCR_IDIOMA_INICIAL, dpi, pagina)
+            idioma = detectar_idioma(texto)
+            if idioma != OCR_IDIOMA_INICIAL:
+                texto = self._pasada(procesada, idioma, dpi, pagina)
+        else:
+            texto = self._pasada(procesada, idioma, dpi, pagina)
+        pagina.idioma = idioma
+        pagina.dpi = dpi
+        return texto
+
+    @staticmethod
+    def _insuficiente(pasada: OCRPasada) -> bool:
+        return pasada.confianza < OCR_CONFIANZA_MINIMA or 0 < pasada.altura_px < OCR_ALTURA_MINIMA_PX
+
+    def reconocer_imagen(self, imagen: Image.Image, idioma: Optional[str] = None) -> OCRPagina:
+        pagina = OCRPagina()
+        pagina.texto = self._reconocer(imagen, pagina, None, idioma)
+        ultima = pagina.pasadas[-1]
+        if 0 < ultima.altura_px < OCR_ALTURA_MINIMA_PX and max(imagen.size) * 1.5 <= OCR_MAX_LADO:
+            # Letra pequeña en una imagen sin DPI que elegir: se amplía y se repite
+            factor = min(2.0, OCR_ALTURA_MINIMA_PX * 1.2 / ultima.altura_px)
+            ampliada = imagen.resize((int(imagen.width * factor), int(imagen.height * factor)), Image.LANCZOS)
+            texto = self._reconocer(ampliada, pagina, None, pagina.idioma)
+            if pagina.pasadas[-1].confianza >= ultima.confianza:
+                pagina.texto = texto
+        self._log(pagina)
+        return pagina
+
+    def reconocer_pagina(self, renderizar: Callable[[int], Image.Image], numero: int = 1,
+                         idioma: Optional[str] = None) -> OCRPagina:
+        # `renderizar(dpi)` rasteriza la página; solo se vuelve a rasterizar a más DPI
+        # si la primera pasada no es suficiente
+        pagina = OCRPagina(numero=numero)
+        mejor_texto, mejor = "", None
+        for dpi in (OCR_PDF_DPI_BAJO, OCR_PDF_DPI_ALTO):
+            inicio = time.perf_counter()
+            imagen = renderizar(dpi)
+            pagina.segundos_render += time.perf_counter() - inicio
+            try:
+                texto = self._reconocer(imagen, pagina, dpi, idioma or (pagina.idioma or None))
+            finally:
+                imagen.close()
+            pasada = pagina.pasadas[-1]
+            if mejor is None or pasada.confianza >= mejor.confianza:
+                mejor_texto, mejor = texto, pasada
+            if not self._insuficiente(pasada) or dpi >= OCR_PDF_DPI_ALTO:
+                break
+        pagina.texto, pagina.dpi = mejor_texto, mejor.dpi
+        self._log(pagina)
+        return pagina
+
+    @staticmethod
+    def _log(pagina: OCRPagina):
+        registrar_etapa("ocr_pagina", str(pagina.dpi or "imagen"), pagina.segundos)
+        logger.info(
+            f"OCR página {pagina.numero}: idioma={pagina.idioma} dpi={pagina.dpi} "
+            f"pasadas={len(pagina.pasadas)} confianza={pagina.pasadas[-1].confianza if pagina.pasadas else 0} "
+            f"inclinación={pagina.inclinacion} {pagina.segundos:.2f}s"
+        )
+
+
+_engine_instance = None
+
+def get_ocr_engine() -> OCREngine:
+    global _engine_instance
+    if _engine_instance is None:
+        _engine_instance = OCREngine()
+    return _engine_instance
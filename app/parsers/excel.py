@@ -0,0 +1,48 @@
+import io
+from typing import Iterator, List
+
+from openpyxl import load_workbook
+
+from app.document_parser import FIRMA_OLE2
+from app.parsers.tablas import celda, texto_tabla
+
+
+def _es_xls(origen) -> bool:
+    # El formato binario antiguo (OLE2) no lo lee openpyxl
+    if isinstance(origen, io.BytesIO):
+        posicion = origen.tell()
+        cabecera = origen.read(len(FIRMA_OLE2))
+        origen.seek(posicion)
+        return cabecera == FIRMA_OLE2
+    with open(origen, "rb") as f:
+        return f.read(len(FIRMA_OLE2)) == FIRMA_OLE2
+
+
+def iterar_filas_excel(origen, hoja=0) -> Iterator[List[str]]:
+    # openpyxl en modo read-only lee la hoja fila a fila sin cargarla entera
+    if _es_xls(origen):
+        # pandas solo hace falta para el .xls: se importa aquí y no con el parser
+        import pandas as pd
+
+        df = pd.read_excel(origen, sheet_name=hoja, header=None, dtype=object)
+        for fila in df.itertuples(index=False):
+            yield [celda(None if pd.isna(v) else v) for v in fila]
+        return
+
+    # Con una ruta openpyxl valida la extensión; abierto vale también un .xlsx renombrado
+    fichero = open(origen, "rb") if isinstance(origen, str) else None
+    try:
+        libro = load_workbook(fichero or origen, read_only=True, data_only=True)
+        try:
+            hoja_ws = libro.worksheets[hoja] if isinstance(hoja, int) else libro[hoja]
+            for fila in hoja_ws.iter_rows(values_only=True):
+                yield [celda(v) for v in fila]
+        finally:
+            libro.close()
+    finally:
+        if fichero is not None:
+            fichero.close()
+
+
+def extraer_texto_excel(filepath):
+    return texto_tabla(iterar_filas_excel(filepath))
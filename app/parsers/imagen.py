@@ -0,0 +1,8 @@
+from PIL import Image
+
+from app.ocr import get_ocr_engine
+
+
+def extraer_texto_imagen(filepath):
+    with Image.open(filepath) as image:
+        return get_ocr_engine().reconocer_imagen(image).texto
@@ -0,0 +1,54 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from PyPDF2 import PdfReader
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+# OCR de PDF página a página: cada worker rasteriza y reconoce una sola página,
+# así la memoria queda acotada a OCR_PAGE_WORKERS imágenes simultáneas
+# (DPI, idioma y preprocesado los decide app.ocr)
+OCR_PAGE_WORKERS = int(os.getenv("OCR_PAGE_WORKERS", "2"))
+
+
+def extraer_texto_pdf(filepath):
+    try:
+        reader = PdfReader(filepath)
+        textos = [_texto_capa_pdf(page) for page in reader.pages]
+    except Exception:
+        textos = [""] * pdfinfo_from_path(filepath)["Pages"]
+
+    # Solo se hace OCR de las páginas sin capa de texto
+    paginas_ocr = [i for i, texto in enumerate(textos) if not texto.strip()]
+    if paginas_ocr:
+        # El idioma se detecta en la primera página escaneada y el resto lo reutiliza:
+        # cada página sin él podría costar una pasada más por DPI
+        primera = _ocr_pagina_pdf(filepath, paginas_ocr[0] + 1)
+        textos[paginas_ocr[0]] = primera.texto
+        resto = paginas_ocr[1:]
+        if resto:
+            with ThreadPoolExecutor(max_workers=min(OCR_PAGE_WORKERS, len(resto))) as pool:
+                paginas = pool.map(lambda i: _ocr_pagina_pdf(filepath, i + 1, primera.idioma), resto)
+                for i, pagina in zip(resto, paginas):
+                    textos[i] = pagina.texto
+
+    # Salto de página explícito para que la normalización detecte cabeceras y pies repetidos
+    return "\n\f".join(textos)
+
+
+def _texto_capa_pdf(page) -> str:
+    try:
+        return page.extract_text() or ""
+    except Exception:
+        return ""
+
+
+def _ocr_pagina_pdf(filepath: str, numero_pagina: int, idioma: Optional[str] = None):
+    # El motor de OCR (pytesseract arrastra numpy y pandas) solo se carga si hay páginas
+    # escaneadas: los PDF con capa de texto no lo necesitan
+    from app.ocr import get_ocr_engine
+
+    def _renderizar(dpi: int):
+        return convert_from_path(filepath, dpi=dpi, first_page=numero_pagina, last_page=numero_pagina)[0]
+
+    return get_ocr_engine().reconocer_pagina(_renderizar, numero_pagina, idioma)
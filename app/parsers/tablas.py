@@ -0,0 +1,53 @@
+import csv
+import io
+from datetime import date, datetime
+from typing import Iterator, List
+
+# Las tablas (Excel/CSV) se emiten fila a fila con este separador, sin relleno de columnas
+SEPARADOR_CELDAS = "\t"
+
+
+def celda(valor) -> str:
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    if isinstance(valor, datetime):
+        return valor.date().isoformat() if valor.time() == datetime.min.time() else valor.isoformat(sep=" ")
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return " ".join(str(valor).split())
+
+
+def _fila_compacta(valores) -> str:
+    celdas = [celda(v) for v in valores]
+    while celdas and not celdas[-1]:
+        celdas.pop()
+    return SEPARADOR_CELDAS.join(celdas)
+
+
+def texto_tabla(filas: Iterator[List[str]]) -> str:
+    return "\n".join(linea for linea in (_fila_compacta(fila) for fila in filas) if linea)
+
+
+def iterar_filas_csv(origen, separador=None) -> Iterator[List[str]]:
+    if isinstance(origen, io.BytesIO):
+        stream = io.TextIOWrapper(origen, encoding="utf-8-sig", errors="ignore", newline="")
+    else:
+        stream = open(origen, "r", encoding="utf-8-sig", errors="ignore", newline="")
+    try:
+        if separador is None:
+            muestra = stream.read(4096)
+            stream.seek(0)
+            try:
+                separador = csv.Sniffer().sniff(muestra, delimiters=",;\t|").delimiter
+            except csv.Error:
+                separador = ","
+        for fila in csv.reader(stream, delimiter=separador):
+            yield [celda(v) for v in fila]
+    finally:
+        stream.close()
+
+
+def extraer_texto_csv(filepath):
+    return texto_tabla(iterar_filas_csv(filepath))
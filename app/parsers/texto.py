@@ -0,0 +1,8 @@
+import io
+
+
+def extraer_texto_txt_csv(filepath):
+    if isinstance(filepath, io.BytesIO):
+        return io.TextIOWrapper(filepath, encoding="utf-8", errors="ignore").read()
+    with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
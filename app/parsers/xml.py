@@ -0,0 +1,123 @@
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+from typing import List
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Etiquetas XML que se consideran líneas de producto y se emiten en una sola línea
+ETIQUETAS_ITEM_XML = ('item', 'product', 'article', 'line', 'articulo', 'producto')
+
+
+@lru_cache(maxsize=4096)
+def _etiqueta(tag: str) -> str:
+    # Sin el espacio de nombres: en exportaciones EDI es la mayor parte de cada etiqueta
+    return tag.rsplit("}", 1)[-1]
+
+
+@lru_cache(maxsize=4096)
+def _es_item(tag: str) -> bool:
+    tag = _etiqueta(tag).lower()
+    return any(keyword in tag for keyword in ETIQUETAS_ITEM_XML)
+
+
+def _atributos(elem) -> List[str]:
+    return [f"{_etiqueta(k)}={v}" for k, v in elem.attrib.items()]
+
+
+def _linea_item(elem) -> str:
+    # Un item y sus hijos directos en una sola línea: "item: codigo=1 | unidades=6"
+    partes = []
+    if elem.text and elem.text.strip():
+        partes.append(elem.text.strip())
+    partes.extend(_atributos(elem))
+    for child in elem:
+        if child.text and child.text.strip():
+            partes.append(f"{_etiqueta(child.tag)}={child.text.strip()}")
+        partes.extend(_atributos(child))
+    return f"{_etiqueta(elem.tag)}: {' | '.join(partes)}"
+
+
+def _linea_elemento(elem) -> str:
+    partes = [elem.text.strip()] if elem.text and elem.text.strip() else []
+    partes.extend(_atributos(elem))
+    return f"{_etiqueta(elem.tag)}: {' | '.join(partes)}" if partes else ""
+
+
+class _NodoXML:
+    __slots__ = ("elem", "es_item", "emitido", "contiene_item", "buffer")
+
+    def __init__(self, elem: ET.Element, es_item: bool):
+        self.elem = elem
+        self.es_item = es_item
+        self.emitido = False
+        self.contiene_item = False
+        self.buffer: List[str] = []
+
+
+def extraer_texto_xml(filepath):
+    # iterparse: cada elemento se libera al cerrarse, así la memoria no crece con el
+    # tamaño del fichero. Un elemento con nombre de item que contiene otros items
+    # (p. ej. <lineas>) se trata como contenedor y sus items se emiten uno por línea
+    lineas: List[str] = []
+    pila: List[_NodoXML] = []
+    items_abiertos: List[_NodoXML] = []
+
+    def _destino() -> List[str]:
+        # Lo que hay dentro de un item se acumula aparte hasta saber si es item o contenedor
+        return items_abiertos[-1].buffer if items_abiertos else lineas
+
+    def _emitir_cabecera(nodo: _NodoXML):
+        if not nodo.emitido and not nodo.es_item:
+            nodo.emitido = True
+            linea = _linea_elemento(nodo.elem)
+            if linea:
+                _destino().append(linea)
+
+    try:
+        for evento, elem in ET.iterparse(filepath, events=("start", "end")):
+            if evento == "start":
+                if pila:
+                    # El texto del padre ya está leído: se emite antes que sus hijos
+                    _emitir_cabecera(pila[-1])
+                nodo = _NodoXML(elem, _es_item(elem.tag))
+                pila.append(nodo)
+                if nodo.es_item:
+                    items_abiertos.append(nodo)
+                continue
+
+            nodo = pila.pop()
+            padre = pila[-1] if pila else None
+            quitar = True
+            if nodo.es_item:
+                items_abiertos.pop()
+                if nodo.contiene_item:
+                    cabecera = _linea_elemento(elem)
+                    if cabecera:
+                        _destino().append(cabecera)
+                    _destino().extend(nodo.buffer)
+                else:
+                    _destino().append(_linea_item(elem))
+                if items_abiertos:
+                    items_abiertos[-1].contiene_item = True
+            else:
+                _emitir_cabecera(nodo)
+                if padre is not None and padre.es_item:
+                    # Hijo directo de un item: se conserva su texto para la línea del item
+                    quitar = False
+                    for hijo in list(elem):
+                        elem.remove(hijo)
+
+            if quitar:
+                elem.clear()
+                if padre is not None:
+                    padre.elem.remove(elem)
+
+        return "\n".join(lineas)
+
+    except ET.ParseError as e:
+        logger.error(f"Error parseando XML: {e}")
+        raise ValueError(f"Error al parsear XML: {e}")
+    except Exception as e:
+        logger.error(f"Error general en XML: {e}")
+        raise ValueError(f"Error al procesar archivo XML: {e}")
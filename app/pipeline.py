@@ -0,0 +1,107 @@
+import asyncio
+import os
+import logging
+from typing import Optional
+
+from app.agent import procesar_documento, procesar_dades_venda, CHUNK_TOKENS
+from app.normalizer import NORMALIZE_TEXT
+from app.prompts import get_prompt_registry
+from app.document_parser import detectar_parser, detectar_tipo_y_extraer, detectar_tipo_y_extraer_bytes, LONGITUD_CABECERA, PARSER_VERSION
+from app.extraction_executor import get_extraction_executor
+from app.cache import get_result_cache, get_text_cache, build_key
+from app.mappings import get_mapping_engine
+from app.uploads import UploadedDocument, copia_propia, liberar_copia
+from app.singleflight import get_single_flight
+from app.telemetry import etapa, ejecutar_con_etapas, registrar_etapas
+
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo de un CSV/TXT en memoria que se parsea directamente en el event loop;
+# por encima va al pool como el resto (un CSV de 9 MB tarda ~0,7 s y bloquearía el servicio)
+PARSE_INLINE_MAX_BYTES = int(os.getenv("PARSE_INLINE_MAX_BYTES", str(64 * 1024)))
+
+# Pipeline de un documento subido, compartido por los endpoints individuales y por /batch
+TIPOS_EXTRACCION = {
+    "documento": procesar_documento,
+    "dades_venda": procesar_dades_venda,
+}
+
+
+async def extraer_texto_en_pool(doc: UploadedDocument) -> str:
+    with etapa("parseo", doc.ext or "sin_extension"):
+        if (doc.data is not None and len(doc.data) <= PARSE_INLINE_MAX_BYTES
+                and detectar_parser(doc.data[:LONGITUD_CABECERA], doc.filename).nombre in ("csv", "txt")):
+            # Decodificar texto plano pequeño es más barato que enviarlo al pool
+            return detectar_tipo_y_extraer_bytes(doc.data, doc.filename)
+        if doc.data is not None:
+            fn, args = detectar_tipo_y_extraer_bytes, (doc.data, doc.filename)
+        else:
+            fn, args = detectar_tipo_y_extraer, (doc.path,)
+        texto, etapas = await get_extraction_executor().run(ejecutar_con_etapas, fn, *args)
+    # Etapas medidas dentro del worker (páginas de OCR)
+    registrar_etapas(etapas)
+    return texto
+
+
+async def obtener_texto(doc: UploadedDocument) -> str:
+    cache = get_text_cache()
+    clave = build_key(doc.sha256, doc.ext, PARSER_VERSION)
+
+    texto = cache.get(clave)
+    if texto is None:
+        texto = await extraer_texto_en_pool(doc)
+        cache.set(clave, texto)
+    return texto
+
+
+def clave_resultado(doc: UploadedDocument, tipo: str, proveedor: Optional[str], anonymize: bool,
+                    chunk_tokens: Optional[int], normalize: Optional[bool] = None) -> str:
+    if chunk_tokens is None:
+        chunk_tokens = CHUNK_TOKENS[tipo]
+    if normalize is None:
+        normalize = NORMALIZE_TEXT
+    # La versión depende de la plantilla efectiva (con variante de proveedor) y cambia al recargarla.
+    # El troceo cambia lo que ve el modelo, así que forma parte de la clave; el paralelismo no
+    prompt_version = get_prompt_registry().version(tipo, proveedor)
+    return build_key(tipo, doc.sha256, prompt_version, proveedor, anonymize, chunk_tokens, normalize)
+
+
+async def extraer_con_mapeo(doc: UploadedDocument, tipo: str, proveedor: Optional[str]) -> Optional[list]:
+    # Camino determinista para XML/CSV/Excel con un mapeo conocido: no se cachea porque
+    # es más barato que la propia caché y así un mapeo nuevo se aplica en cuanto el motor
+    # recarga el fichero (EXTRACTION_MAPPINGS_RELOAD_INTERVAL)
+    return await asyncio.to_thread(get_mapping_engine().extraer, doc, tipo, proveedor)
+
+
+async def procesar_archivo(doc: UploadedDocument, tipo: str = "documento",
+                           proveedor: Optional[str] = None, anonymize: bool = True,
+                           chunk_tokens: Optional[int] = None, paralelismo: Optional[int] = None,
+                           normalize: Optional[bool] = None) -> list:
+    procesar = TIPOS_EXTRACCION[tipo]
+    resultado = await extraer_con_mapeo(doc, tipo, proveedor)
+    if resultado is not None:
+        return resultado
+
+    cache = get_result_cache()
+    clave = clave_resultado(doc, tipo, proveedor, anonymize, chunk_tokens, normalize)
+    resultado = cache.get(clave)
+    if resultado is not None:
+        return resultado
+
+    async def _extraer(propio: UploadedDocument) -> list:
+        try:
+            texto = await obtener_texto(propio)
+        finally:
+            liberar_copia(doc, propio)
+        logger.debug(f"Texto extraído (primeros 200 chars): {texto[:200]}")
+
+        resultado = (await procesar(texto, proveedor, anonymize, chunk_tokens, paralelismo, normalize)).items
+
+        # Una lista vacía suele indicar un fallo de parseo: no se cachea
+        if resultado:
+            cache.set(clave, resultado)
+        return resultado
+
+    # Subidas idénticas simultáneas (reintentos del ERP) comparten parseo, OCR y LLM.
+    # La ejecución compartida trabaja sobre su propia copia del temporal
+    return await get_single_flight("archivo").ejecutar(clave, lambda: _extraer(copia_propia(doc)))
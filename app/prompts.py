@@ -0,0 +1,143 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_DOCUMENTO = "{documento_extraido}"
+
+# Plantillas base por tipo de extracción y variantes por proveedor en
+# PROMPT_VARIANTS_DIR/<tipo>.<proveedor>.txt
+PROMPTS_DIR = os.getenv("PROMPTS_DIR", os.path.dirname(__file__))
+PROMPT_VARIANTS_DIR = os.getenv("PROMPT_VARIANTS_DIR", os.path.join(PROMPTS_DIR, "prompts"))
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", "2"))
+
+PROMPT_FILES = {
+    "documento": "prompt.txt",
+    "dades_venda": "prompt_dades_venda.txt",
+}
+
+_PROVEEDOR_VALIDO = re.compile(r'^[\w\-]+$')
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    nombre: str
+    path: str
+    system: str   # instrucciones estables: prefijo idéntico en todas las llamadas
+    sufijo: str   # lo que la plantilla pone después del documento
+    version: str
+
+    @property
+    def fijo(self) -> str:
+        return self.system + self.sufijo
+
+    def mensajes(self, documento: str) -> List[Dict[str, str]]:
+        # El prefijo va en un mensaje system aparte para que el proveedor pueda
+        # reutilizarlo entre llamadas; solo el mensaje user cambia
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": documento + self.sufijo},
+        ]
+
+
+def parsear_plantilla(nombre: str, path: str, contenido: str, modelo: str) -> PromptTemplate:
+    if PLACEHOLDER_DOCUMENTO in contenido:
+        system, sufijo = contenido.split(PLACEHOLDER_DOCUMENTO, 1)
+    else:
+        logger.warning(f"La plantilla {path} no contiene {PLACEHOLDER_DOCUMENTO}: el documento irá al final")
+        system, sufijo = contenido, ""
+    system = system.rstrip() + "\n"
+    version = hashlib.sha256(f"{modelo}\n{system}\n{sufijo}".encode("utf-8")).hexdigest()[:12]
+    return PromptTemplate(nombre, path, system, sufijo, version)
+
+
+class PromptRegistry:
+
+    def __init__(self, modelo: str, base_dir: str = PROMPTS_DIR, variants_dir: str = PROMPT_VARIANTS_DIR,
+                 archivos: Optional[Dict[str, str]] = None, reload_interval: float = PROMPT_RELOAD_INTERVAL):
+        self.modelo = modelo
+        self.base_dir = base_dir
+        self.variants_dir = variants_dir
+        self.archivos = archivos or PROMPT_FILES
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._plantillas: Dict[str, Tuple[float, PromptTemplate]] = {}  # path -> (mtime, plantilla)
+        # path -> (última revisión, plantilla): las claves son ficheros que existen, no los
+        # proveedores que llegan en las peticiones, así la caché no crece con ellos
+        self._resueltas: Dict[str, Tuple[float, PromptTemplate]] = {}
+        self._variantes: Tuple[float, frozenset] = (float("-inf"), frozenset())
+
+    def _variantes_disponibles(self, ahora: float) -> frozenset:
+        # Un listado del directorio cada reload_interval en vez de un exists() por petición
+        revisado, variantes = self._variantes
+        if ahora - revisado >= self.reload_interval:
+            try:
+                variantes = frozenset(f for f in os.listdir(self.variants_dir) if f.endswith(".txt"))
+            except OSError:
+                variantes = frozenset()
+            self._variantes = (ahora, variantes)
+        return variantes
+
+    def _ruta(self, nombre: str, proveedor: Optional[str], ahora: float) -> str:
+        if proveedor and _PROVEEDOR_VALIDO.match(proveedor):
+            variante = f"{nombre}.{proveedor}.txt"
+            if variante in self._variantes_disponibles(ahora):
+                return os.path.join(self.variants_dir, variante)
+        return os.path.join(self.base_dir, self.archivos[nombre])
+
+    def _cargar(self, nombre: str, path: str) -> PromptTemplate:
+        actual = self._plantillas.get(path)
+        try:
+            mtime = os.stat(path).st_mtime
+            if actual is not None and actual[0] == mtime:
+                return actual[1]
+            with open(path, encoding="utf-8-sig") as f:
+                plantilla = parsear_plantilla(nombre, path, f.read(), self.modelo)
+        except OSError as e:
+            if actual is None:
+                raise
+            logger.warning(f"No se pudo recargar la plantilla {path}, se mantiene la anterior: {e}")
+            return actual[1]
+
+        if actual is not None:
+            logger.info(f"Plantilla {path} recargada (versión {plantilla.version})")
+        self._plantillas[path] = (mtime, plantilla)
+        return plantilla
+
+    def get(self, nombre: str, proveedor: Optional[str] = None) -> PromptTemplate:
+        if nombre not in self.archivos:
+            raise KeyError(f"Plantilla desconocida: {nombre}")
+
+        # Los ficheros solo se revisan cada reload_interval segundos
+        ahora = time.monotonic()
+        path = self._ruta(nombre, proveedor, ahora)
+        resuelta = self._resueltas.get(path)
+        if resuelta is not None and ahora - resuelta[0] < self.reload_interval:
+            return resuelta[1]
+
+        with self._lock:
+            plantilla = self._cargar(nombre, path)
+            self._resueltas[path] = (ahora, plantilla)
+        return plantilla
+
+    def version(self, nombre: str, proveedor: Optional[str] = None) -> str:
+        return self.get(nombre, proveedor).version
+
+    def plantillas(self) -> List[PromptTemplate]:
+        return [self.get(nombre) for nombre in self.archivos]
+
+
+_registry_instance = None
+
+def get_prompt_registry() -> PromptRegistry:
+    global _registry_instance
+    if _registry_instance is None:
+        from app.agent import MODEL_NAME
+        _registry_instance = PromptRegistry(MODEL_NAME)
+    return _registry_instance
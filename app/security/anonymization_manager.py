@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Dict, List, Optional
@@ -28,7 +29,10 @@ class TestAnonymizationModel(BaseModel):
 @router.get("/proveedores")
 async def listar_proveedores():
     anonymizer = get_anonymizer()
-    return {"proveedores": list(anonymizer.provider_config.keys())}
+    return {
+        "proveedores": [p for p in anonymizer.provider_config.keys() if not p.startswith("_")],
+        "revision": anonymizer.config_version
+    }
 
 @router.get("/proveedor/{proveedor}")
 async def obtener_config_proveedor(proveedor: str):
@@ -41,37 +45,37 @@ async def obtener_config_proveedor(proveedor: str):
         "configuracion": anonymizer.provider_config[proveedor]
     }
 
-@router.post("/proveedor/{proveedor}")
-async def crear_actualizar_proveedor(proveedor: str, config: ProviderConfigModel):
-    anonymizer = get_anonymizer()
-    
-    anonymizer.provider_config[proveedor] = config.dict()
-    
-    anonymizer.save_provider_config()
-    
-    return {
-        "message": f"Configuración para {proveedor} guardada exitosamente",
-        "proveedor": proveedor,
-        "configuracion": anonymizer.provider_config[proveedor]
-    }
-
+# Declarada antes que /proveedor/{proveedor}: si no, esa ruta captura "agregar-dato"
 @router.post("/proveedor/agregar-dato")
 async def agregar_dato_proveedor(data: AddProviderDataModel):
     anonymizer = get_anonymizer()
     
     try:
-        anonymizer.add_provider_data(data.proveedor, data.field, data.value)
-        anonymizer.save_provider_config()
+        revision = await asyncio.to_thread(anonymizer.add_provider_data, data.proveedor, data.field, data.value)
         
         return {
             "message": f"Dato agregado exitosamente",
             "proveedor": data.proveedor,
             "field": data.field,
-            "value": data.value
+            "value": data.value,
+            "revision": revision
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/proveedor/{proveedor}")
+async def crear_actualizar_proveedor(proveedor: str, config: ProviderConfigModel):
+    anonymizer = get_anonymizer()
+    
+    revision = await asyncio.to_thread(anonymizer.set_provider_config, proveedor, config.dict())
+    
+    return {
+        "message": f"Configuración para {proveedor} guardada exitosamente",
+        "proveedor": proveedor,
+        "configuracion": anonymizer.provider_config[proveedor],
+        "revision": revision
+    }
+
 @router.delete("/proveedor/{proveedor}")
 async def eliminar_proveedor(proveedor: str):
     anonymizer = get_anonymizer()
@@ -79,10 +83,9 @@ async def eliminar_proveedor(proveedor: str):
     if proveedor not in anonymizer.provider_config:
         raise HTTPException(status_code=404, detail="Proveedor no encontrado")
     
-    del anonymizer.provider_config[proveedor]
-    anonymizer.save_provider_config()
+    revision = await asyncio.to_thread(anonymizer.delete_provider, proveedor)
     
-    return {"message": f"Proveedor {proveedor} eliminado exitosamente"}
+    return {"message": f"Proveedor {proveedor} eliminado exitosamente", "revision": revision}
 
 @router.post("/test")
 async def probar_anonimizacion(test_data: TestAnonymizationModel):
@@ -97,10 +100,7 @@ async def probar_anonimizacion(test_data: TestAnonymizationModel):
     return {
         "texto_original": test_data.texto,
         "texto_anonimizado": texto_anonimizado,
-        "estadisticas": {
-            "total_reemplazos": stats.total_replacements,
-            "por_tipo": stats.by_type
-        },
+        "estadisticas": stats.to_dict(),
         "proveedor_usado": test_data.proveedor
     }
 
@@ -0,0 +1,130 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import logging
+from datetime import date
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto comprueba cada worker si el fichero de configuración ha cambiado (stat)
+ANON_CONFIG_POLL_INTERVAL = float(os.getenv("ANON_CONFIG_POLL_INTERVAL", "0.5"))
+
+# Contador de revisiones dentro del propio JSON (las claves con "_" no son proveedores)
+CLAVE_REVISION = "_revision"
+
+
+class AnonymizationConfigStore:
+    # Fichero JSON compartido por todos los workers: las escrituras son atómicas
+    # (temporal + os.replace) y se serializan entre procesos con flock; cada lectura
+    # parte de la última versión en disco para no pisar cambios de otro worker
+
+    def __init__(self, path: str):
+        self.path = path
+        self._firma: Optional[Tuple[int, int, int]] = None
+
+    def _firma_actual(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _leer(self) -> Dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def cargar(self) -> Tuple[Optional[Dict], int]:
+        # None si el fichero no se puede leer (p. ej. editado a mano con un error):
+        # quien llama conserva la configuración que ya tenía
+        firma = self._firma_actual()
+        self._firma = firma
+        try:
+            config = self._leer()
+        except Exception as e:
+            logger.warning(f"No se pudo cargar configuración de proveedores: {e}")
+            return None, 0
+        return config, int(config.get(CLAVE_REVISION, 0))
+
+    def ha_cambiado(self) -> bool:
+        return self._firma_actual() != self._firma
+
+    def actualizar(self, cambio: Callable[[Dict], None]) -> Tuple[Dict, int]:
+        # Lectura-modificación-escritura bajo un lock de fichero exclusivo entre procesos
+        directorio = os.path.dirname(self.path) or "."
+        os.makedirs(directorio, exist_ok=True)
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                config = self._leer()
+                cambio(config)
+                revision = int(config.get(CLAVE_REVISION, 0)) + 1
+                config[CLAVE_REVISION] = revision
+                config["_ultima_actualizacion"] = date.today().isoformat()
+                self._escribir_atomico(config, directorio)
+                self._firma = self._firma_actual()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        logger.info(f"Configuración de anonimización guardada (revisión {revision})")
+        return config, revision
+
+    def _escribir_atomico(self, config: Dict, directorio: str):
+        fd, temporal = tempfile.mkstemp(prefix=".anonymization_", suffix=".json", dir=directorio)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(config, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, self.path)
+        except BaseException:
+            try:
+                os.remove(temporal)
+            except OSError:
+                pass
+            raise
+
+
+class ConfigWatcher:
+    # Hilo por proceso que detecta cambios con un stat() y aplica la nueva configuración
+    # fuera del camino de las peticiones (incluida la recompilación de los matchers)
+
+    def __init__(self, store: AnonymizationConfigStore, aplicar: Callable[[Dict, int], None],
+                 intervalo: float = ANON_CONFIG_POLL_INTERVAL):
+        self.store = store
+        self.aplicar = aplicar
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._hilo is None and self.intervalo > 0:
+            self._hilo = threading.Thread(target=self._bucle, name="anon-config-watcher", daemon=True)
+            self._hilo.start()
+
+    def comprobar(self) -> bool:
+        if not self.store.ha_cambiado():
+            return False
+        config, revision = self.store.cargar()
+        if config is None:
+            return False
+        self.aplicar(config, revision)
+        return True
+
+    def _bucle(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.comprobar()
+            except Exception as e:
+                logger.warning(f"Error recargando configuración de anonimización: {e}")
+
+    def stop(self):
+        self._parar.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=self.intervalo * 2 + 1)
+            self._hilo = None
+
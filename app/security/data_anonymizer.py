@@ -1,12 +1,54 @@
 import re
-import json
 import logging
+from concurrent.futures import BrokenExecutor
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from pathlib import Path
+from app.security.provider_matcher import ProviderMatcherIndex
+from app.security.config_store import AnonymizationConfigStore, ConfigWatcher
+from app.security.sharding import (ANON_SHARD_MIN_CHARS, ANON_SHARD_WORKERS, get_shard_executor,
+                                   hilos_sin_gil, shutdown_shard_executor, trocear)
+from app.telemetry import etapa
 
 logger = logging.getLogger(__name__)
 
+# Un patrón que empieza por \b seguido de un átomo de caracteres de palabra se puede
+# reescribir como "átomo + lookbehind" (equivalente): así el motor de re puede
+# saltar directamente a las posiciones candidatas en lugar de probar cada carácter.
+_LEADING_BOUNDARY = re.compile(
+    r'^(?P<flags>\(\?[aiLmsux]+\))?\\b'
+    r'(?P<atom>\\d|\[(?:[A-Za-z0-9]-[A-Za-z0-9]|[A-Za-z0-9])+\]|[A-Za-z0-9]+)'
+    r'(?P<quant>\{(?P<min>\d+)(?P<range>,(?P<max>\d*))?\}|[+*?])?'
+)
+
+
+def _accelerate_pattern(pattern: str) -> str:
+    m = _LEADING_BOUNDARY.match(pattern)
+    if not m:
+        return pattern
+    
+    flags, atom, quant = m.group('flags') or '', m.group('atom'), m.group('quant')
+    es_literal = not atom.startswith(('\\', '['))
+    if quant and (es_literal or quant in ('*', '?')):
+        return pattern
+    
+    if not quant:
+        resto = ''
+    elif quant == '+':
+        resto = f'{atom}*'
+    else:
+        minimo = int(m.group('min'))
+        if minimo < 1:
+            return pattern
+        if m.group('range') is None:
+            resto = f'{atom}{{{minimo - 1}}}' if minimo > 2 else atom * (minimo - 1)
+        elif m.group('max'):
+            resto = f'{atom}{{{minimo - 1},{int(m.group("max")) - 1}}}'
+        else:
+            resto = f'{atom}{{{minimo - 1},}}'
+    
+    return f'{flags}{atom}(?<!\\w{atom}){resto}{pattern[m.end():]}'
+
 @dataclass
 class AnonymizationStats:
     total_replacements: int = 0
@@ -15,6 +57,16 @@ class AnonymizationStats:
     def __post_init__(self):
         if self.by_type is None:
             self.by_type = {}
+    
+    def add(self, tipo: str, count: int = 1):
+        self.by_type[tipo] = self.by_type.get(tipo, 0) + count
+        self.total_replacements += count
+    
+    def to_dict(self) -> Dict:
+        return {
+            "total_reemplazos": self.total_replacements,
+            "por_tipo": self.by_type
+        }
 
 class DataAnonymizer:
     
@@ -35,8 +87,14 @@ class DataAnonymizer:
             else:
                 self.config_path = "app/config/anonymization_config.json"
         
-        self.provider_config = self._load_provider_config()
-        self.stats = AnonymizationStats()
+        # Configuración publicada: (config, índice de matchers, revisión). Se sustituye
+        # entera al recargar, así una petición nunca ve una mezcla de dos versiones
+        self.config_store = AnonymizationConfigStore(self.config_path)
+        self._estado: Tuple[Dict, ProviderMatcherIndex, int] = ({}, ProviderMatcherIndex(dict), 0)
+        self._apply_config(*self._load_provider_config())
+        self.watcher = ConfigWatcher(self.config_store, self._apply_config)
+        self._compiled_patterns = []
+        self._regex_fingerprint = None
         
         self.regex_patterns = {
             'cif_nif_nie': [
@@ -90,64 +148,86 @@ class DataAnonymizer:
                 r'\b€\s*\d{1,6}[,\.]\d{2}\b',
             ],
         }
+        # Las reglas de corte de app.security.sharding están derivadas de estos patrones
+        self._default_fingerprint = self._patterns_fingerprint()
     
-    def _load_provider_config(self) -> Dict:
-        try:
-            if Path(self.config_path).exists():
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            logger.warning(f"No se pudo cargar configuración de proveedores: {e}")
-        return {}
+    def _load_provider_config(self) -> Tuple[Dict, int]:
+        config, revision = self.config_store.cargar()
+        return (config if config is not None else {}), revision
     
-    def _apply_regex_patterns(self, texto: str) -> str:
-        for pattern_type, patterns in self.regex_patterns.items():
-            for pattern in patterns:
-                matches = len(re.findall(pattern, texto))
-                if matches > 0:
-                    self.stats.by_type[pattern_type] = self.stats.by_type.get(pattern_type, 0) + matches
-                    self.stats.total_replacements += matches
-                    
-                    placeholder = f'[{pattern_type.upper()}]'
-                    texto = re.sub(pattern, placeholder, texto)
+    @property
+    def provider_config(self) -> Dict:
+        return self._estado[0]
+    
+    @property
+    def provider_matchers(self) -> ProviderMatcherIndex:
+        return self._estado[1]
+    
+    @property
+    def config_version(self) -> int:
+        return self._estado[2]
+    
+    def _apply_config(self, config: Dict, revision: int):
+        # El índice global se compila antes de publicar la configuración (en el hilo
+        # del watcher o del admin), no en la primera petición que lo necesite
+        matchers = ProviderMatcherIndex(lambda: config)
+        matchers.get(None)
+        self._estado = (config, matchers, revision)
+        logger.info(f"Configuración de anonimización aplicada (revisión {revision})")
+    
+    def reload_if_changed(self) -> bool:
+        return self.watcher.comprobar()
+    
+    def update_provider_config(self, cambio) -> int:
+        # Escritura atómica sobre la última versión en disco; el resto de workers la
+        # recogen con su watcher
+        config, revision = self.config_store.actualizar(cambio)
+        self._apply_config(config, revision)
+        return revision
+    
+    def _patterns_fingerprint(self) -> Tuple:
+        return tuple((tipo, tuple(patterns)) for tipo, patterns in self.regex_patterns.items())
+    
+    def _get_compiled_patterns(self) -> List[Tuple[str, "re.Pattern", str]]:
+        # Se recompila solo si cambia el conjunto de patrones
+        fingerprint = self._patterns_fingerprint()
+        if fingerprint != self._regex_fingerprint:
+            compiled = []
+            for pattern_type, patterns in self.regex_patterns.items():
+                placeholder = f'[{pattern_type.upper()}]'
+                seen = set()
+                for pattern in patterns:
+                    # Un patrón repetido del mismo tipo ya no encuentra nada tras la primera sustitución
+                    if pattern in seen:
+                        continue
+                    seen.add(pattern)
+                    compiled.append((pattern_type, re.compile(_accelerate_pattern(pattern)), placeholder))
+            self._compiled_patterns = compiled
+            self._regex_fingerprint = fingerprint
+        return self._compiled_patterns
+    
+    def _apply_regex_patterns(self, texto: str, stats: AnonymizationStats) -> str:
+        for pattern_type, pattern, placeholder in self._get_compiled_patterns():
+            texto, matches = pattern.subn(placeholder, texto)
+            if matches > 0:
+                stats.add(pattern_type, matches)
         
         return texto
     
-    def _apply_provider_config(self, texto: str, proveedor: str = None) -> str:
-        if not proveedor or proveedor not in self.provider_config:
+    def _apply_provider_config(self, texto: str, proveedor: str, stats: AnonymizationStats,
+                               provider_config: Optional[Dict] = None,
+                               provider_matchers: Optional[ProviderMatcherIndex] = None) -> str:
+        provider_config = self.provider_config if provider_config is None else provider_config
+        provider_matchers = self.provider_matchers if provider_matchers is None else provider_matchers
+        if proveedor and proveedor not in provider_config:
             return texto
         
-        config = self.provider_config[proveedor]
-        
-        for field, values in config.items():
-            if isinstance(values, list):
-                for value in values:
-                    if value and value.strip():
-                        escaped_value = re.escape(value.strip())
-                        if field == 'codigos_especiales':
-                            if any(char.isdigit() for char in value):
-                                pattern = rf'(?:CIF:\s*)?{escaped_value}'
-                            else:
-                                pattern = rf'{escaped_value}'
-                        else:
-                            pattern = rf'\b{escaped_value}\b'
-                        
-                        matches = len(re.findall(pattern, texto, re.IGNORECASE))
-                        if matches > 0:
-                            if field == 'nombres_empresa':
-                                placeholder = '[NOMBRES_EMPRESA_PROVEEDOR]'
-                            elif field == 'codigos_especiales' and any(char.isdigit() for char in value):
-                                placeholder = '[CIF]'
-                            else:
-                                placeholder = f'[{field.upper()}_PROVEEDOR]'
-                            texto = re.sub(pattern, placeholder, texto, flags=re.IGNORECASE)
-                            
-                            self.stats.by_type[f'{field}_proveedor'] = self.stats.by_type.get(f'{field}_proveedor', 0) + matches
-                            self.stats.total_replacements += matches
-        
-        return texto
+        return provider_matchers.get(proveedor).apply(texto, lambda field: stats.add(f'{field}_proveedor'))
+    
+    def invalidate_provider_matchers(self, proveedor: Optional[str] = None):
+        self.provider_matchers.invalidate(proveedor)
     
-    def _apply_heuristic_detection(self, texto: str) -> str:
+    def _apply_heuristic_detection(self, texto: str, stats: AnonymizationStats) -> str:
         lines = texto.split('\n')
         processed_lines = []
         
@@ -160,16 +240,14 @@ class DataAnonymizer:
                 line_upper == line.strip().upper()):
                 
                 processed_lines.append('[NOMBRE_EMPRESA_DETECTADO]')
-                self.stats.by_type['empresa_heuristica'] = self.stats.by_type.get('empresa_heuristica', 0) + 1
-                self.stats.total_replacements += 1
+                stats.add('empresa_heuristica')
                 continue
             
             if (any(keyword in line_upper for keyword in ['CALLE', 'AVENIDA', 'PLAZA', 'PASEO']) and
                 any(char.isdigit() for char in line)):
                 
                 processed_lines.append('[DIRECCION_DETECTADA]')
-                self.stats.by_type['direccion_heuristica'] = self.stats.by_type.get('direccion_heuristica', 0) + 1
-                self.stats.total_replacements += 1
+                stats.add('direccion_heuristica')
                 continue
             
             processed_lines.append(line)
@@ -178,41 +256,112 @@ class DataAnonymizer:
     
     def anonymize(self, texto: str, proveedor: str = None, 
                   apply_heuristics: bool = True) -> Tuple[str, AnonymizationStats]:
+        # Estadísticas por llamada: el anonimizador no guarda estado mutable entre llamadas
+        stats = AnonymizationStats()
         if not texto or not texto.strip():
-            return texto, self.stats
-        
-        self.stats = AnonymizationStats()
+            return texto, stats
         
         logger.info(f"Iniciando anonimización{f' para proveedor: {proveedor}' if proveedor else ''}")
         
-        print(f"DEBUG Anonymizer: proveedor recibido = '{proveedor}'")
-        print(f"DEBUG Anonymizer: proveedores disponibles = {list(self.provider_config.keys())}")
+        provider_config, provider_matchers, revision = self._estado
+        logger.debug(f"Anonymizer: proveedor recibido = '{proveedor}', disponibles = {len(provider_config)}, revisión {revision}")
         
-        if proveedor and proveedor in self.provider_config:
-            config = self.provider_config[proveedor]
-            print(f"DEBUG Anonymizer: config encontrada = {config}")
+        if proveedor and proveedor in provider_config:
+            config = provider_config[proveedor]
+            logger.debug(f"Anonymizer: config encontrada = {config}")
             if config.get('anonimizar', True) == False:
                 logger.info(f"Anonimización completamente deshabilitada para proveedor: {proveedor}")
-                print(f"DEBUG Anonymizer: ANONIMIZACION COMPLETAMENTE DESHABILITADA!")
-                return texto, self.stats
+                return texto, stats
         else:
-            print(f"DEBUG Anonymizer: Proveedor no encontrado o None, continuando con anonimización")
+            logger.debug("Anonymizer: proveedor no encontrado o None, continuando con anonimización")
         
-        texto = self._apply_regex_patterns(texto)
-        
-        if proveedor:
-            texto = self._apply_provider_config(texto, proveedor)
+        if self._shardable(texto, proveedor, provider_config, provider_matchers):
+            texto, por_trozo = self._anonymize_sharded(texto, proveedor, apply_heuristics, provider_config,
+                                                       provider_matchers, revision)
         else:
-            for provider_name in self.provider_config.keys():
-                if not provider_name.startswith('_'):
-                    texto = self._apply_provider_config(texto, provider_name)
+            texto, pasadas = self._anonymize_passes(texto, proveedor, apply_heuristics, provider_config,
+                                                    provider_matchers)
+            por_trozo = [pasadas]
+        stats = self._merge_stats(por_trozo)
+        
+        logger.info(f"Anonimización completada: {stats.total_replacements} reemplazos realizados")
+        
+        return texto, stats
+    
+    def _anonymize_passes(self, texto: str, proveedor: Optional[str], apply_heuristics: bool,
+                          provider_config: Dict, provider_matchers: ProviderMatcherIndex
+                          ) -> Tuple[str, List[AnonymizationStats]]:
+        # Estadísticas separadas por pasada para poder fusionar trozos en el mismo orden que en serie
+        pasadas = [AnonymizationStats(), AnonymizationStats(), AnonymizationStats()]
+        with etapa("anonimizacion", "regex"):
+            texto = self._apply_regex_patterns(texto, pasadas[0])
+        
+        # Con proveedor se usa su índice; sin proveedor, el índice global de todos
+        with etapa("anonimizacion", "proveedor"):
+            texto = self._apply_provider_config(texto, proveedor, pasadas[1], provider_config, provider_matchers)
         
         if apply_heuristics:
-            texto = self._apply_heuristic_detection(texto)
+            with etapa("anonimizacion", "heuristica"):
+                texto = self._apply_heuristic_detection(texto, pasadas[2])
+        
+        return texto, pasadas
+    
+    def _merge_stats(self, por_trozo: List[List[AnonymizationStats]]) -> AnonymizationStats:
+        # En serie los tipos de regex entran en el orden de los patrones y los de proveedor y
+        # heurística en orden de aparición en el texto (= orden de los trozos)
+        stats = AnonymizationStats()
+        regex: Dict[str, int] = {}
+        for pasadas in por_trozo:
+            for tipo, count in pasadas[0].by_type.items():
+                regex[tipo] = regex.get(tipo, 0) + count
+        for tipo in self.regex_patterns:
+            if tipo in regex:
+                stats.add(tipo, regex[tipo])
+        for pasada in (1, 2):
+            for pasadas in por_trozo:
+                for tipo, count in pasadas[pasada].by_type.items():
+                    stats.add(tipo, count)
+        return stats
+    
+    def _shardable(self, texto: str, proveedor: Optional[str], provider_config: Dict,
+                   provider_matchers: ProviderMatcherIndex) -> bool:
+        if len(texto) < ANON_SHARD_MIN_CHARS or ANON_SHARD_WORKERS < 2:
+            return False
+        if self._patterns_fingerprint() != self._default_fingerprint:
+            logger.debug("Patrones de anonimización modificados: anonimización en serie")
+            return False
+        if proveedor and proveedor not in provider_config:
+            return True
+        # Un literal de proveedor con salto de línea podría cruzar un corte
+        return not provider_matchers.get(proveedor).multilinea
+    
+    def _anonymize_sharded(self, texto: str, proveedor: Optional[str], apply_heuristics: bool,
+                           provider_config: Dict, provider_matchers: ProviderMatcherIndex, revision: int
+                           ) -> Tuple[str, List[List[AnonymizationStats]]]:
+        trozos = trocear(texto)
+        if len(trozos) < 2:
+            texto, pasadas = self._anonymize_passes(texto, proveedor, apply_heuristics, provider_config,
+                                                    provider_matchers)
+            return texto, [pasadas]
         
-        logger.info(f"Anonimización completada: {self.stats.total_replacements} reemplazos realizados")
+        with etapa("anonimizacion", "trozos"):
+            try:
+                if hilos_sin_gil():
+                    futuros = [get_shard_executor().submit(self._anonymize_passes, trozo, proveedor, apply_heuristics,
+                                                           provider_config, provider_matchers) for trozo in trozos]
+                else:
+                    futuros = [get_shard_executor().submit(_anonimizar_trozo, trozo, proveedor, apply_heuristics,
+                                                           provider_config, revision) for trozo in trozos]
+                resultados = [futuro.result() for futuro in futuros]
+            except BrokenExecutor as e:
+                logger.warning(f"Pool de anonimización roto ({e}), anonimizando en serie")
+                shutdown_shard_executor()
+                texto, pasadas = self._anonymize_passes(texto, proveedor, apply_heuristics, provider_config,
+                                                        provider_matchers)
+                return texto, [pasadas]
         
-        return texto, self.stats
+        logger.debug(f"Anonimización en {len(trozos)} trozos")
+        return "".join(t for t, _ in resultados), [pasadas for _, pasadas in resultados]
     
     def create_provider_config_template(self, proveedor: str) -> Dict:
         return {
@@ -228,24 +377,41 @@ class DataAnonymizer:
             }
         }
     
-    def add_provider_data(self, proveedor: str, field: str, value: str):
-        if proveedor not in self.provider_config:
-            self.provider_config[proveedor] = self.create_provider_config_template(proveedor)[proveedor]
-        
-        if field not in self.provider_config[proveedor]:
-            self.provider_config[proveedor][field] = []
-        
-        if value not in self.provider_config[proveedor][field]:
-            self.provider_config[proveedor][field].append(value)
+    def set_provider_config(self, proveedor: str, config: Dict) -> int:
+        def _cambio(actual: Dict):
+            actual[proveedor] = config
+        return self.update_provider_config(_cambio)
+    
+    def delete_provider(self, proveedor: str) -> int:
+        def _cambio(actual: Dict):
+            actual.pop(proveedor, None)
+        return self.update_provider_config(_cambio)
     
-    def save_provider_config(self):
-        try:
-            Path(self.config_path).parent.mkdir(parents=True, exist_ok=True)
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(self.provider_config, f, indent=2, ensure_ascii=False)
-            logger.info(f"Configuración guardada en {self.config_path}")
-        except Exception as e:
-            logger.error(f"Error guardando configuración: {e}")
+    def add_provider_data(self, proveedor: str, field: str, value: str) -> int:
+        def _cambio(actual: Dict):
+            if proveedor not in actual:
+                actual[proveedor] = self.create_provider_config_template(proveedor)[proveedor]
+            
+            if field not in actual[proveedor]:
+                actual[proveedor][field] = []
+            
+            if value not in actual[proveedor][field]:
+                actual[proveedor][field].append(value)
+        return self.update_provider_config(_cambio)
+
+
+_shard_anonymizer = None
+
+def _anonimizar_trozo(texto: str, proveedor: Optional[str], apply_heuristics: bool,
+                      config: Dict, revision: int) -> Tuple[str, List[AnonymizationStats]]:
+    # En el worker: se aplica la misma configuración que vio la petición en el proceso padre
+    global _shard_anonymizer
+    if _shard_anonymizer is None:
+        _shard_anonymizer = DataAnonymizer()
+    if _shard_anonymizer.provider_config != config:
+        _shard_anonymizer._apply_config(config, revision)
+    provider_config, provider_matchers, _ = _shard_anonymizer._estado
+    return _shard_anonymizer._anonymize_passes(texto, proveedor, apply_heuristics, provider_config, provider_matchers)
 
 
 _anonymizer_instance = None
@@ -254,6 +420,7 @@ def get_anonymizer() -> DataAnonymizer:
     global _anonymizer_instance
     if _anonymizer_instance is None:
         _anonymizer_instance = DataAnonymizer()
+        _anonymizer_instance.watcher.start()
     return _anonymizer_instance
 
 
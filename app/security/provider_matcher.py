@@ -0,0 +1,191 @@
+import re
+import threading
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Tipos de literal según las reglas de _apply_provider_config
+BOUNDED = 'b'    # \bvalor\b
+UNBOUNDED = 'u'  # valor (codigos_especiales sin dígitos)
+CIF = 'c'        # (?:CIF:\s*)?valor (codigos_especiales con dígitos)
+
+# Placeholders ya insertados por la pasada de regex: se dejan intactos
+_PLACEHOLDER = r'(?-i:\[[A-Z_]+\])'
+
+Entry = Tuple[str, str, str, str]  # (literal, tipo, campo, placeholder)
+
+
+def build_trie_regex(words: Iterable[str]) -> str:
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def _to_regex(node: Dict) -> str:
+        ramas = [re.escape(char) + _to_regex(child) for char, child in sorted(node.items()) if char]
+        if not ramas:
+            return ''
+        regex = ramas[0] if len(ramas) == 1 else '(?:' + '|'.join(ramas) + ')'
+        if '' in node:
+            # Opcional voraz: primero se intenta el literal más largo
+            regex = f'(?:{regex})?'
+        return regex
+
+    return _to_regex(trie)
+
+
+def provider_entries(config: Dict) -> List[Entry]:
+    entries = []
+    for field, values in config.items():
+        if not isinstance(values, list):
+            continue
+        for value in values:
+            if not isinstance(value, str) or not value.strip():
+                continue
+            literal = value.strip()
+            tiene_digitos = any(char.isdigit() for char in literal)
+            if field == 'codigos_especiales':
+                tipo = CIF if tiene_digitos else UNBOUNDED
+            else:
+                tipo = BOUNDED
+
+            if field == 'nombres_empresa':
+                placeholder = '[NOMBRES_EMPRESA_PROVEEDOR]'
+            elif tipo == CIF:
+                placeholder = '[CIF]'
+            else:
+                placeholder = f'[{field.upper()}_PROVEEDOR]'
+            entries.append((literal, tipo, field, placeholder))
+    return entries
+
+
+def _prefijos_cruzados(primero: Iterable[str], segundo: Iterable[str]) -> bool:
+    # ¿Algún literal de un conjunto es prefijo propio de uno del otro? En orden alfabético
+    # un prefijo va antes que sus extensiones: la pila guarda la cadena de prefijos abierta
+    pila: List[Tuple[str, int]] = []
+    for literal, origen in sorted({(l, 0) for l in primero} | {(l, 1) for l in segundo}):
+        while pila and not literal.startswith(pila[-1][0]):
+            pila.pop()
+        if any(o != origen and p != literal for p, o in pila):
+            return True
+        pila.append((literal, origen))
+    return False
+
+
+class ProviderMatcher:
+
+    def __init__(self, entries: Iterable[Entry]):
+        # Una rama por (campo, tipo) en el orden de la config: en una misma posición gana el
+        # primer campo, como en la versión secuencial ("Nom1" de nombres_empresa antes que
+        # "Nom1-" de codigos_especiales), y un literal repetido en varios campos es del primero.
+        # Entre coincidencias que empiezan en posiciones distintas gana la de más a la izquierda
+        grupos: Dict[Tuple[str, str], Dict[str, Tuple[str, str]]] = {}
+        for literal, tipo, field, placeholder in entries:
+            grupos.setdefault((field, tipo), {}).setdefault(literal.lower(), (field, placeholder))
+
+        # Campos seguidos del mismo tipo comparten rama (menos alternativas que probar en cada
+        # posición) salvo que un literal de uno sea prefijo de otro del siguiente: entonces el
+        # trie daría el más largo y no el del primer campo
+        self._tablas: List[Dict[str, Tuple[str, str]]] = []
+        self._tipos: List[str] = []
+        for (_, tipo), tabla in grupos.items():
+            if self._tipos and self._tipos[-1] == tipo and not _prefijos_cruzados(self._tablas[-1], tabla):
+                for literal, entrada in tabla.items():
+                    self._tablas[-1].setdefault(literal, entrada)
+            else:
+                self._tablas.append(dict(tabla))
+                self._tipos.append(tipo)
+
+        ramas = [f'(?P<ph>{_PLACEHOLDER})']
+        for i, (tipo, tabla) in enumerate(zip(self._tipos, self._tablas)):
+            trie = build_trie_regex(tabla)
+            if tipo == CIF:
+                ramas.append(rf'(?P<g{i}>(?:CIF:\s*)?(?P<v{i}>{trie}))')
+            elif tipo == BOUNDED:
+                ramas.append(rf'\b(?P<g{i}>{trie})\b')
+            else:
+                ramas.append(rf'(?P<g{i}>{trie})')
+
+        self.size = sum(len(tabla) for tabla in self._tablas)
+        # Literales que cruzan líneas: impiden anonimizar por trozos (app.security.sharding)
+        self.multilinea = any("\n" in literal for tabla in self._tablas for literal in tabla)
+        self._regex = re.compile('|'.join(ramas), re.IGNORECASE) if self.size else None
+
+    def apply(self, texto: str, on_match: Callable[[str], None]) -> str:
+        if self._regex is None:
+            return texto
+
+        def _replace(m):
+            grupo = m.lastgroup
+            if grupo == 'ph':
+                return m.group()
+            i = int(grupo[1:])
+            encontrado = m.group(f'v{i}' if self._tipos[i] == CIF else grupo)
+            entrada = self._tablas[i].get(encontrado.lower()) or self._buscar(self._tablas[i], encontrado)
+            if entrada is None:
+                return m.group()
+            field, placeholder = entrada
+            on_match(field)
+            return placeholder
+
+        return self._regex.sub(_replace, texto)
+
+    @staticmethod
+    def _buscar(tabla: Dict[str, Tuple[str, str]], encontrado: str) -> Optional[Tuple[str, str]]:
+        # re.IGNORECASE no pliega igual que str.lower() ('ſ' casa con 's', el signo Kelvin
+        # con 'k'): si la clave no está, se busca el literal que casa como lo hizo la regex
+        for literal, entrada in tabla.items():
+            if re.fullmatch(re.escape(literal), encontrado, re.IGNORECASE):
+                return entrada
+        return None
+
+
+class ProviderMatcherIndex:
+
+    def __init__(self, get_config: Callable[[], Dict]):
+        self._get_config = get_config
+        self._entries: Dict[str, List[Entry]] = {}
+        self._matchers: Dict[str, ProviderMatcher] = {}
+        self._global: Optional[ProviderMatcher] = None
+        self._lock = threading.Lock()
+
+    def _provider_entries(self, proveedor: str) -> List[Entry]:
+        entries = self._entries.get(proveedor)
+        if entries is None:
+            config = self._get_config().get(proveedor)
+            entries = provider_entries(config) if isinstance(config, dict) else []
+            self._entries[proveedor] = entries
+        return entries
+
+    def get(self, proveedor: Optional[str] = None) -> ProviderMatcher:
+        with self._lock:
+            if proveedor:
+                matcher = self._matchers.get(proveedor)
+                if matcher is None:
+                    matcher = ProviderMatcher(self._provider_entries(proveedor))
+                    self._matchers[proveedor] = matcher
+                return matcher
+
+            if self._global is None:
+                entries = []
+                for provider_name in list(self._get_config().keys()):
+                    if not provider_name.startswith('_'):
+                        entries.extend(self._provider_entries(provider_name))
+                self._global = ProviderMatcher(entries)
+                logger.info(f"Índice de proveedores compilado: {self._global.size} literales")
+            return self._global
+
+    def invalidate(self, proveedor: Optional[str] = None):
+        # Solo se recalculan los literales del proveedor modificado; el índice global
+        # se recompone a partir de los literales ya extraídos del resto
+        with self._lock:
+            if proveedor is None:
+                self._entries.clear()
+                self._matchers.clear()
+            else:
+                self._entries.pop(proveedor, None)
+                self._matchers.pop(proveedor, None)
+            self._global = None
@@ -0,0 +1,162 @@
+import os
+import re
+import sys
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Anonimización por trozos de textos grandes (volcados de OCR, exportaciones de Excel).
+# Por debajo de ANON_SHARD_MIN_CHARS, o con menos de 2 workers, se usa el camino en serie
+ANON_SHARD_MIN_CHARS = int(os.getenv("ANON_SHARD_MIN_CHARS", "1000000"))
+ANON_SHARD_CHARS = int(os.getenv("ANON_SHARD_CHARS", "250000"))
+ANON_SHARD_WORKERS = int(os.getenv("ANON_SHARD_WORKERS", str(os.cpu_count() or 1)))
+
+# Los cortes se hacen justo después de un "\n" y solo si ningún patrón por defecto puede
+# casar a través de él (las reglas de abajo están derivadas de esos patrones: si se cambian
+# los patrones, DataAnonymizer vuelve al camino en serie). Dentro de una línea no casa nada
+# distinto, y "\n" es un carácter de no-palabra igual que el inicio/fin de cadena, así que
+# \b y los lookbehind se comportan igual en el trozo que en el texto completo.
+#
+# Solo los tokens \s (\s*, \s+) pueden cruzar un salto de línea. Sea L el último carácter
+# no blanco antes del corte y R el primero después:
+#  - direcciones (C/, Calle, Avda., Av., Plaza...) y "CIF:" de proveedor van seguidas de
+#    \s+ / \s* y luego casi cualquier cosa: inseguro si el texto antes del corte acaba así
+#  - teléfonos, IBAN y cuentas: grupos de dígitos separados por \s*, con 9 dígitos como
+#    mínimo en total; inseguro si L es de palabra, R es dígito y los dígitos de los tramos
+#    [\d\s] a ambos lados del corte suman 9 o más
+#  - precios: "€\s*1,00" y "1,00\s*€"
+#  - direcciones "\d{5}\s+Ciudad Nombre": R letra y antes cinco dígitos seguidos de palabras
+#  - direcciones "Av. Nombre 12": R dígito y antes "Av."/"Avenida", blancos y una palabra
+# Las sustituciones solo insertan placeholders "[TIPO]", que no contienen dígitos, blancos
+# ni letras minúsculas, así que un corte seguro en el texto original sigue siéndolo en el
+# texto que ve cada pasada.
+_COLA_CLAVE = re.compile(r'(?i)(?:C/|Calle|Avda?\.?|Av\.?|Avenida|Paseo|Plaza|Pz\.?|Pol[ií]gono|Pol\.?|CIF:)\Z')
+_COLA_PRECIO = re.compile(r'\d[,.]\d\d\Z')
+_CABEZA_PRECIO = re.compile(r'\d{1,6}[,.]\d\d')
+_COLA_CP = re.compile(r'\d{5}\Z')
+_COLA_AVENIDA = re.compile(r'(?i)(?:Av\.?|Avenida)\Z')
+_DIGITO = re.compile(r'\d')
+_PALABRA = re.compile(r'\w')
+_MINIMO_DIGITOS = 9
+# Ventana que se inspecciona a cada lado; si un tramo la llena, el corte se descarta
+_VENTANA = 80
+# Distancia máxima que se busca un corte seguro a partir de cada objetivo: en textos
+# donde casi ningún salto es seguro (tablas numéricas) la búsqueda no debe costar más
+# que lo que ahorra
+_BUSQUEDA_MAX = 64 * 1024
+
+
+def _es_numerico(c: str) -> bool:
+    # isdigit() incluye a \d (y algo más): la cuenta de dígitos solo puede salir por exceso
+    return c.isdigit() or c.isspace()
+
+
+def _retroceder(texto: str, fin: int, limite: int, condicion) -> Optional[int]:
+    # Inicio del tramo que cumple `condicion` y termina en `fin`; None si llena la ventana
+    i = fin
+    while i > limite and condicion(texto[i - 1]):
+        i -= 1
+    return None if i == limite > 0 else i
+
+
+def corte_seguro(texto: str, salto: int) -> bool:
+    # `salto` es la posición de un "\n"; el corte quedaría en salto + 1
+    a = salto
+    while a > 0 and texto[a - 1].isspace():
+        a -= 1
+    b = salto + 1
+    while b < len(texto) and texto[b].isspace():
+        b += 1
+    if a == 0 or b == len(texto):
+        return False
+    izquierda, derecha = texto[a - 1], texto[b]
+    inicio = max(a - _VENTANA, 0)
+
+    if _COLA_CLAVE.search(texto, max(a - 9, 0), a):
+        return False
+
+    if _PALABRA.match(izquierda) and _DIGITO.match(derecha):
+        cola = _retroceder(texto, a, inicio, _es_numerico)
+        fin = min(b + _VENTANA, len(texto))
+        cabeza = b
+        while cabeza < fin and _es_numerico(texto[cabeza]):
+            cabeza += 1
+        if (cola is None or cabeza == b + _VENTANA
+                or sum(c.isdigit() for c in texto[cola:a]) + sum(c.isdigit() for c in texto[b:cabeza]) >= _MINIMO_DIGITOS):
+            return False
+
+    if izquierda == "€" and _CABEZA_PRECIO.match(texto, b):
+        return False
+    if derecha == "€" and _COLA_PRECIO.search(texto, max(a - 4, 0), a):
+        return False
+
+    limite = max(a - _VENTANA * 4, 0)
+    if derecha.isalpha():
+        # Retrocede por la cadena de palabras y blancos; antes tiene que haber cinco dígitos
+        j = _retroceder(texto, a, limite, lambda c: c.isalpha() or c.isspace())
+        if j is None or _COLA_CP.search(texto, max(j - 5, 0), j):
+            return False
+
+    if _DIGITO.match(derecha) and izquierda.isalpha():
+        j = _retroceder(texto, a, limite, str.isalpha)
+        k = _retroceder(texto, j, limite, str.isspace) if j is not None else None
+        if j is None or k is None or (k < j and _COLA_AVENIDA.search(texto, max(k - 8, 0), k)):
+            return False
+
+    return True
+
+
+def cortes_seguros(texto: str, objetivo: int) -> List[int]:
+    # Posiciones de corte (inicio de cada trozo salvo el primero) cada ~objetivo caracteres
+    cortes = []
+    siguiente = objetivo
+    while siguiente < len(texto) - objetivo // 4:
+        salto = texto.find("\n", siguiente)
+        limite = siguiente + min(objetivo // 2, _BUSQUEDA_MAX)
+        while salto != -1 and salto < limite and not corte_seguro(texto, salto):
+            salto = texto.find("\n", salto + 1)
+        if salto == -1:
+            break
+        if salto < limite:
+            cortes.append(salto + 1)
+            siguiente = salto + 1 + objetivo
+        else:
+            # Sin corte cerca de este objetivo: ese trozo será más grande
+            siguiente += objetivo
+    return cortes
+
+
+def trocear(texto: str, workers: int = ANON_SHARD_WORKERS) -> List[str]:
+    objetivo = max(ANON_SHARD_CHARS, -(-len(texto) // max(workers, 1)))
+    limites = [0] + cortes_seguros(texto, objetivo) + [len(texto)]
+    return [texto[inicio:fin] for inicio, fin in zip(limites, limites[1:])]
+
+
+def hilos_sin_gil() -> bool:
+    # En builds free-threaded los trozos van a hilos: sin copiar el texto entre procesos
+    return hasattr(sys, "_is_gil_enabled") and not sys._is_gil_enabled()
+
+
+_executor_instance: Optional[Executor] = None
+
+def get_shard_executor() -> Executor:
+    global _executor_instance
+    if _executor_instance is None:
+        if hilos_sin_gil():
+            _executor_instance = ThreadPoolExecutor(ANON_SHARD_WORKERS, thread_name_prefix="anon-shard")
+        else:
+            # Pool propio: no compite con el parseo ni cuenta para su cola de extracción
+            _executor_instance = ProcessPoolExecutor(
+                max_workers=ANON_SHARD_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+    return _executor_instance
+
+
+def shutdown_shard_executor():
+    global _executor_instance
+    if _executor_instance is not None:
+        _executor_instance.shutdown(wait=False, cancel_futures=True)
+        _executor_instance = None
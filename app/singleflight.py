@@ -0,0 +1,82 @@
+import asyncio
+import os
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict
+
+from app.llm_scheduler import prioridad_actual
+from app.telemetry import COALESCIDAS
+
+logger = logging.getLogger(__name__)
+
+# Si el último cliente que espera un resultado se va, por defecto la ejecución sigue:
+# el resultado queda en caché para el reintento que suele llegar justo después
+SINGLEFLIGHT_CANCELAR_HUERFANAS = os.getenv("SINGLEFLIGHT_CANCELAR_HUERFANAS", "false").lower() in ("1", "true", "yes")
+
+
+@dataclass
+class _Vuelo:
+    tarea: asyncio.Task
+    esperando: int = 0
+
+
+class SingleFlight:
+    # Peticiones concurrentes con la misma clave comparten una sola ejecución.
+    # Cada una espera el resultado con shield: si un cliente se desconecta (se cancela
+    # su petición) la ejecución compartida sigue para el resto
+
+    def __init__(self, nombre: str, cancelar_huerfanas: bool = SINGLEFLIGHT_CANCELAR_HUERFANAS):
+        self.nombre = nombre
+        self.cancelar_huerfanas = cancelar_huerfanas
+        self._vuelos: Dict[str, _Vuelo] = {}
+        self.ejecuciones = 0
+        self.coalescidas = 0
+        self.canceladas = 0
+
+    def _terminar(self, clave: str, vuelo: _Vuelo, tarea: asyncio.Task):
+        if self._vuelos.get(clave) is vuelo:
+            del self._vuelos[clave]
+        # Sin nadie esperando, la excepción se recoge aquí para que no quede sin leer
+        if not tarea.cancelled() and tarea.exception() is not None and not vuelo.esperando:
+            logger.warning(f"Ejecución compartida {self.nombre} sin clientes terminó con error: {tarea.exception()}")
+
+    async def ejecutar(self, clave: str, fabrica: Callable[[], Awaitable[Any]]) -> Any:
+        # `fabrica` solo se llama si no hay ya una ejecución en curso para la clave.
+        # La tarea compartida copia el contexto de quien la lanza (prioridad en la cola del
+        # LLM, traza): una petición interactiva no se une a la ejecución de un lote ni al revés
+        clave = f"{prioridad_actual()}:{clave}"
+        vuelo = self._vuelos.get(clave)
+        if vuelo is None:
+            vuelo = _Vuelo(asyncio.ensure_future(fabrica()))
+            self._vuelos[clave] = vuelo
+            vuelo.tarea.add_done_callback(lambda tarea: self._terminar(clave, vuelo, tarea))
+            self.ejecuciones += 1
+        else:
+            self.coalescidas += 1
+            COALESCIDAS.labels(self.nombre).inc()
+            logger.info(f"Petición coalescida con una ejecución en curso ({self.nombre}, {vuelo.esperando} esperando)")
+
+        vuelo.esperando += 1
+        try:
+            return await asyncio.shield(vuelo.tarea)
+        finally:
+            vuelo.esperando -= 1
+            if not vuelo.esperando and not vuelo.tarea.done() and self.cancelar_huerfanas:
+                self.canceladas += 1
+                vuelo.tarea.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "en_curso": len(self._vuelos),
+            "ejecuciones": self.ejecuciones,
+            "coalescidas": self.coalescidas,
+            "canceladas": self.canceladas,
+        }
+
+
+_vuelos_instances: Dict[str, SingleFlight] = {}
+
+def get_single_flight(nombre: str = "extraccion") -> SingleFlight:
+    if nombre not in _vuelos_instances:
+        _vuelos_instances[nombre] = SingleFlight(nombre)
+    return _vuelos_instances[nombre]
@@ -0,0 +1,75 @@
+import json
+import logging
+from typing import AsyncIterator, Callable, Dict, Iterable, Optional
+
+from fastapi.responses import StreamingResponse
+
+from app.agent import ExtractionResult, extraer_en_streaming
+
+logger = logging.getLogger(__name__)
+
+# Formatos de salida de los endpoints /stream
+FORMATOS_STREAM = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+PATRON_FORMATO = "^(ndjson|sse)$"
+
+
+def _serializar(evento: Dict, formato: str) -> str:
+    datos = json.dumps(evento, ensure_ascii=False)
+    if formato == "sse":
+        return f"event: {evento['tipo']}\ndata: {datos}\n\n"
+    return datos + "\n"
+
+
+def respuesta_streaming(eventos: AsyncIterator[Dict], formato: str = "ndjson") -> StreamingResponse:
+    async def _cuerpo():
+        async for evento in eventos:
+            yield _serializar(evento, formato)
+
+    # X-Accel-Buffering evita que un nginx delante acumule la respuesta
+    return StreamingResponse(
+        _cuerpo(),
+        media_type=FORMATOS_STREAM[formato],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _evento_fin(result: ExtractionResult) -> Dict:
+    return {
+        "tipo": "fin",
+        "total": len(result.items),
+        "estadisticas_anonimizacion": result.anonymization.to_dict() if result.anonymization else None,
+        "normalizacion": result.normalization.to_dict() if result.normalization else None,
+        "tokens": result.tokens_dict(),
+        "tiempos": result.timings,
+    }
+
+
+async def eventos_cacheados(items: Iterable, fin: Optional[Dict] = None) -> AsyncIterator[Dict]:
+    # Resultados ya disponibles (caché o mapeo determinista) con el mismo formato de eventos
+    total = 0
+    for item in items:
+        total += 1
+        yield {"tipo": "item", "item": item}
+    yield {"tipo": "fin", "total": total, **(fin or {"cache": True})}
+
+
+async def eventos_extraccion(texto: str, tipo: str, proveedor: Optional[str], anonymize: bool,
+                             chunk_tokens: Optional[int], paralelismo: Optional[int],
+                             al_terminar: Optional[Callable[[ExtractionResult], None]] = None,
+                             normalize: Optional[bool] = None) -> AsyncIterator[Dict]:
+    # Las cabeceras ya se han enviado: un fallo a mitad se comunica como evento de error
+    result = ExtractionResult()
+    try:
+        async for item in extraer_en_streaming(texto, tipo, proveedor, anonymize, chunk_tokens, paralelismo, result, normalize):
+            yield {"tipo": "item", "item": item}
+    except Exception as e:
+        logger.error(f"Error en extracción en streaming: {e}")
+        yield {"tipo": "error", "detail": str(e)}
+        return
+
+    if al_terminar is not None:
+        al_terminar(result)
+    yield _evento_fin(result)
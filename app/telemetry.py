@@ -0,0 +1,175 @@
+import os
+import time
+import uuid
+import random
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+logger = logging.getLogger(__name__)
+
+# Nivel de log de la aplicación y fracción de peticiones cuyo log DEBUG se emite.
+# El muestreo es por traza: una petición muestreada saca todas sus líneas DEBUG
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.01"))
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s"
+
+# Cabecera con el identificador de traza (se respeta la que envíe el cliente)
+TRACE_HEADER = "x-request-id"
+
+BUCKETS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+ETAPA_SEGUNDOS = Histogram(
+    "agent_etapa_segundos", "Duración de cada etapa del pipeline",
+    ["etapa", "detalle"], buckets=BUCKETS_SEGUNDOS,
+)
+PETICION_SEGUNDOS = Histogram(
+    "agent_http_peticion_segundos", "Duración de las peticiones HTTP",
+    ["endpoint", "metodo", "estado"], buckets=BUCKETS_SEGUNDOS,
+)
+TOKENS_LLM = Counter("agent_llm_tokens_total", "Tokens enviados y recibidos del LLM", ["tipo", "direccion"])
+TOKENS_DOCUMENTO = Histogram(
+    "agent_documento_tokens", "Tokens de documento por extracción", ["tipo"],
+    buckets=(100, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000),
+)
+CACHE_CONSULTAS = Counter("agent_cache_consultas_total", "Consultas a las cachés", ["cache", "resultado"])
+COALESCIDAS = Counter(
+    "agent_singleflight_coalescidas_total", "Peticiones que esperaron una ejecución idéntica en curso", ["operacion"]
+)
+LLM_REINTENTOS = Counter("agent_llm_reintentos_total", "Llamadas al LLM reintentadas", ["motivo"])
+COLA_PROFUNDIDAD = Gauge("agent_cola_profundidad", "Trabajos pendientes en cada cola", ["cola"])
+
+
+@dataclass
+class Traza:
+    id: str
+    muestreada: bool = False
+    etapas: List[Tuple[str, str, float]] = field(default_factory=list)
+
+    def resumen(self) -> Dict[str, float]:
+        total: Dict[str, float] = {}
+        for nombre, _, segundos in self.etapas:
+            total[nombre] = total.get(nombre, 0.0) + segundos
+        return {nombre: round(segundos, 4) for nombre, segundos in total.items()}
+
+
+_traza_actual: ContextVar[Optional[Traza]] = ContextVar("traza_actual", default=None)
+
+
+def traza_actual() -> Optional[Traza]:
+    return _traza_actual.get()
+
+
+@contextmanager
+def traza(trace_id: Optional[str] = None) -> Iterator[Traza]:
+    actual = Traza(trace_id or uuid.uuid4().hex, random.random() < LOG_DEBUG_SAMPLE_RATE)
+    token = _traza_actual.set(actual)
+    try:
+        yield actual
+    finally:
+        _traza_actual.reset(token)
+
+
+def registrar_etapa(nombre: str, detalle: str, segundos: float):
+    ETAPA_SEGUNDOS.labels(nombre, detalle).observe(segundos)
+    actual = _traza_actual.get()
+    if actual is not None:
+        actual.etapas.append((nombre, detalle, segundos))
+
+
+@contextmanager
+def etapa(nombre: str, detalle: str = ""):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_etapa(nombre, detalle, time.perf_counter() - inicio)
+
+
+def ejecutar_con_etapas(fn: Callable, *args):
+    # Para el pool de procesos: las etapas medidas en el worker (p. ej. páginas de OCR)
+    # no llegan a sus métricas, así que se devuelven junto al resultado
+    with traza() as actual:
+        return fn(*args), actual.etapas
+
+
+def registrar_etapas(etapas: List[Tuple[str, str, float]]):
+    for nombre, detalle, segundos in etapas:
+        registrar_etapa(nombre, detalle, segundos)
+
+
+def registrar_tokens(tipo: str, prompt: int, completion: int, documento: Optional[int] = None):
+    TOKENS_LLM.labels(tipo, "entrada").inc(prompt)
+    TOKENS_LLM.labels(tipo, "salida").inc(completion)
+    if documento is not None:
+        TOKENS_DOCUMENTO.labels(tipo).observe(documento)
+
+
+def registrar_cola(nombre: str, profundidad: Callable[[], float]):
+    COLA_PROFUNDIDAD.labels(nombre).set_function(profundidad)
+
+
+def metricas() -> Tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class _TraceFilter(logging.Filter):
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        actual = _traza_actual.get()
+        record.trace_id = actual.id if actual is not None else "-"
+        if record.levelno <= logging.DEBUG:
+            return actual.muestreada if actual is not None else random.random() < LOG_DEBUG_SAMPLE_RATE
+        return True
+
+
+def configurar_logging():
+    # Logger raíz de la aplicación; uvicorn conserva su propia configuración
+    app_logger = logging.getLogger("app")
+    if any(isinstance(f, _TraceFilter) for h in app_logger.handlers for f in h.filters):
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(_TraceFilter())
+    app_logger.addHandler(handler)
+    app_logger.setLevel(LOG_LEVEL)
+    app_logger.propagate = False
+
+
+class TraceMiddleware:
+    # Middleware ASGI puro: asigna la traza antes que el resto y mide la petición completa,
+    # incluidas las respuestas en streaming
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        cabeceras = dict(scope.get("headers") or [])
+        trace_id = cabeceras.get(TRACE_HEADER.encode(), b"").decode("latin-1")[:64] or None
+        estado = 500
+
+        async def send_con_traza(message):
+            nonlocal estado
+            if message["type"] == "http.response.start":
+                estado = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(TRACE_HEADER.encode(), actual.id.encode())]
+            await send(message)
+
+        with traza(trace_id) as actual:
+            inicio = time.perf_counter()
+            try:
+                await self.app(scope, receive, send_con_traza)
+            finally:
+                segundos = time.perf_counter() - inicio
+                # El router deja el endpoint en el scope: se etiqueta por función y no por
+                # path para no crear una serie por cada /batch/{job_id}
+                endpoint = getattr(scope.get("endpoint"), "__name__", "sin_ruta")
+                PETICION_SEGUNDOS.labels(endpoint, scope["method"], str(estado)).observe(segundos)
+                logger.info(f"{scope['method']} {scope['path']} {estado} {segundos:.3f}s etapas={actual.resumen()}")
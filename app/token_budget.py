@@ -0,0 +1,63 @@
+import threading
+import logging
+from typing import Dict, List, Tuple
+
+import tiktoken
+
+from app.chunking import contar_lineas, dividir_en_chunks
+
+logger = logging.getLogger(__name__)
+
+_encodings: Dict[str, tiktoken.Encoding] = {}
+_encodings_lock = threading.Lock()
+
+
+def get_encoding(modelo: str) -> tiktoken.Encoding:
+    # encoding_for_model reconstruye el mapeo en cada llamada: se resuelve una vez por modelo
+    encoding = _encodings.get(modelo)
+    if encoding is None:
+        with _encodings_lock:
+            encoding = _encodings.get(modelo)
+            if encoding is None:
+                try:
+                    encoding = tiktoken.encoding_for_model(modelo)
+                except Exception:
+                    encoding = tiktoken.get_encoding("cl100k_base")
+                _encodings[modelo] = encoding
+    return encoding
+
+
+class TokenBudget:
+
+    def __init__(self, modelo: str, max_total_tokens: int, max_output_tokens: int, safety_margin: int):
+        self.modelo = modelo
+        self.encoding = get_encoding(modelo)
+        self.max_prompt_tokens = max_total_tokens - max_output_tokens - safety_margin
+        self._tokens_plantilla: Dict[str, int] = {}
+
+    def contar(self, texto: str) -> int:
+        return len(self.encoding.encode_ordinary(texto))
+
+    def tokens_plantilla(self, fijo: str) -> int:
+        # Tokens fijos de la plantilla (todo menos el documento), calculados una sola vez
+        tokens = self._tokens_plantilla.get(fijo)
+        if tokens is None:
+            tokens = self.contar(fijo)
+            self._tokens_plantilla[fijo] = tokens
+        return tokens
+
+    def max_documento(self, fijo: str) -> int:
+        return self.max_prompt_tokens - self.tokens_plantilla(fijo)
+
+    def trocear(self, texto: str, fijo: str, chunk_tokens: int = 0) -> Tuple[List[str], int]:
+        # Solo se codifica el documento (la plantilla ya está contada). El recuento por
+        # líneas, más caro, solo se hace si de verdad hay que trocear
+        limite = self.max_documento(fijo)
+        if chunk_tokens > 0:
+            limite = min(chunk_tokens, limite)
+
+        tokens_documento = self.contar(texto)
+        if tokens_documento <= limite:
+            return [texto], tokens_documento
+        lineas, conteos = contar_lineas(texto, self.encoding)
+        return dividir_en_chunks(texto, limite, self.encoding, lineas, conteos), tokens_documento
@@ -0,0 +1,174 @@
+import asyncio
+import dataclasses
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional
+
+from fastapi import HTTPException, UploadFile
+
+from app.telemetry import registrar_etapa
+
+logger = logging.getLogger(__name__)
+
+# Límites de subida (configurables por entorno)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_MEMORY_MAX_BYTES = int(os.getenv("UPLOAD_MEMORY_MAX_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or tempfile.gettempdir()
+
+# Formatos que los parsers pueden leer directamente desde memoria
+IN_MEMORY_EXTENSIONS = {".csv", ".txt", ".xml", ".png", ".jpg", ".jpeg", ".tiff"}
+
+
+@dataclass
+class UploadedDocument:
+    filename: str
+    ext: str
+    sha256: str
+    size: int
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+
+
+def _demasiado_grande(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"El archivo supera el límite de {max_bytes} bytes")
+
+
+@asynccontextmanager
+async def recibir_upload(file: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES) -> AsyncIterator[UploadedDocument]:
+    filename = os.path.basename(file.filename or "documento")
+    ext = os.path.splitext(filename)[1].lower()
+    hasher = hashlib.sha256()
+    size = 0
+
+    # Los formatos pequeños que se parsean en memoria nunca tocan disco; el resto
+    # (o si se supera el umbral) se vuelca por trozos a un temporal con nombre único
+    buffer = bytearray() if ext in IN_MEMORY_EXTENSIONS else None
+    temp = None
+    inicio = time.perf_counter()
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise _demasiado_grande(max_bytes)
+            hasher.update(chunk)
+
+            if buffer is not None and size <= UPLOAD_MEMORY_MAX_BYTES:
+                buffer.extend(chunk)
+                continue
+
+            if temp is None:
+                temp = tempfile.NamedTemporaryFile(prefix="upload_", suffix=ext, dir=UPLOAD_TMP_DIR, delete=False)
+                if buffer:
+                    await asyncio.to_thread(temp.write, bytes(buffer))
+                buffer = None
+            await asyncio.to_thread(temp.write, chunk)
+
+        registrar_etapa("upload", ext or "sin_extension", time.perf_counter() - inicio)
+        if temp is not None:
+            await asyncio.to_thread(temp.close)
+            doc = UploadedDocument(filename, ext, hasher.hexdigest(), size, path=temp.name)
+        else:
+            doc = UploadedDocument(filename, ext, hasher.hexdigest(), size, data=bytes(buffer or b""))
+
+        yield doc
+    finally:
+        if temp is not None:
+            temp.close()
+            try:
+                os.remove(temp.name)
+            except FileNotFoundError:
+                pass
+
+
+def copia_propia(doc: UploadedDocument) -> UploadedDocument:
+    # Enlace duro al temporal para quien lo siga usando cuando la petición original
+    # termine y borre el suyo (p. ej. una ejecución compartida entre peticiones)
+    if doc.path is None:
+        return doc
+    base, ext = os.path.splitext(doc.path)
+    destino = f"{base}.{uuid.uuid4().hex[:8]}{ext}"
+    try:
+        os.link(doc.path, destino)
+    except OSError:
+        shutil.copyfile(doc.path, destino)
+    return dataclasses.replace(doc, path=destino)
+
+
+def liberar_copia(original: UploadedDocument, copia: UploadedDocument):
+    if copia.path is not None and copia.path != original.path:
+        try:
+            os.remove(copia.path)
+        except FileNotFoundError:
+            pass
+
+
+def documento_desde_fichero(path: str, filename: Optional[str] = None) -> UploadedDocument:
+    filename = os.path.basename(filename or path)
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+            size += len(chunk)
+    return UploadedDocument(filename, os.path.splitext(filename)[1].lower(), hasher.hexdigest(), size, path=path)
+
+
+class UploadSizeLimitMiddleware:
+    # Corta el cuerpo de la petición en cuanto supera el límite, antes de que
+    # el parser multipart lo haya recibido entero
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_BYTES, overrides: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        # Límites propios por prefijo de ruta (p. ej. /batch admite lotes grandes)
+        self.overrides = overrides or {}
+
+    def _limite(self, path: str) -> int:
+        for prefix, limite in self.overrides.items():
+            if path.startswith(prefix):
+                return limite
+        return self.max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self._limite(scope["path"])
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            await self._rechazar(send, max_bytes)
+            return
+
+        recibido = 0
+
+        async def receive_limitado():
+            nonlocal recibido
+            message = await receive()
+            if message["type"] == "http.request":
+                recibido += len(message.get("body", b""))
+                if recibido > max_bytes:
+                    raise _demasiado_grande(max_bytes)
+            return message
+
+        await self.app(scope, receive_limitado, send)
+
+    async def _rechazar(self, send, max_bytes: int):
+        body = f'{{"detail":"El archivo supera el límite de {max_bytes} bytes"}}'.encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,64 @@
+# Compara el motor de regex precompilado del anonimizador con la implementación anterior
+# (re.findall + re.sub por patrón) sobre facturas sintéticas grandes.
+#
+#   python -m benchmarks.bench_anonymizer --lineas 20000 --repeticiones 5
+import argparse
+import json
+import re
+import time
+
+from app.security.data_anonymizer import DataAnonymizer, AnonymizationStats
+from benchmarks.synthetic import generar_albaran_texto
+
+
+def regex_legacy(anonymizer: DataAnonymizer, texto: str, stats: AnonymizationStats) -> str:
+    for pattern_type, patterns in anonymizer.regex_patterns.items():
+        for pattern in patterns:
+            matches = len(re.findall(pattern, texto))
+            if matches > 0:
+                stats.by_type[pattern_type] = stats.by_type.get(pattern_type, 0) + matches
+                stats.total_replacements += matches
+                texto = re.sub(pattern, f'[{pattern_type.upper()}]', texto)
+    return texto
+
+
+def regex_compilado(anonymizer: DataAnonymizer, texto: str, stats: AnonymizationStats) -> str:
+    return anonymizer._apply_regex_patterns(texto, stats)
+
+
+def medir(fn, anonymizer, texto, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        stats = AnonymizationStats()
+        inicio = time.perf_counter()
+        salida = fn(anonymizer, texto, stats)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), salida, stats
+
+
+def main(lineas: int, repeticiones: int):
+    anonymizer = DataAnonymizer()
+    texto = generar_albaran_texto(lineas, seed=42)
+
+    t_legacy, out_legacy, stats_legacy = medir(regex_legacy, anonymizer, texto, repeticiones)
+    t_nuevo, out_nuevo, stats_nuevo = medir(regex_compilado, anonymizer, texto, repeticiones)
+
+    assert out_legacy == out_nuevo, "La salida del motor compilado difiere de la implementación anterior"
+    assert stats_legacy.by_type == stats_nuevo.by_type, "Las estadísticas difieren"
+
+    print(json.dumps({
+        "lineas": lineas,
+        "bytes": len(texto.encode("utf-8")),
+        "reemplazos": stats_nuevo.total_replacements,
+        "legacy_s": round(t_legacy, 4),
+        "compilado_s": round(t_nuevo, 4),
+        "speedup": round(t_legacy / t_nuevo, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lineas", type=int, default=20000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+    main(args.lineas, args.repeticiones)
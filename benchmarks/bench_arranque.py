@@ -0,0 +1,80 @@
+# Coste de arranque: tiempo de importación de app.main y de lo que importa un worker del
+# pool de parseo, y pico de RSS de un worker recién arrancado que parsea un solo formato.
+# Cada medición se hace en un intérprete nuevo (como un arranque en frío o un respawn).
+#
+#   python -m benchmarks.bench_arranque --repeticiones 5 --salida resultados/arranque.json
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+from benchmarks.corpus import FORMATOS, escribir_documento
+from benchmarks.resultados import guardar, resumen_tiempos
+
+# Lo que ejecuta un proceso nuevo: importa `modulo` y, si hay fichero, lo parsea una vez
+_SONDA = """
+import json, resource, sys, time
+inicio = time.perf_counter()
+import app.telemetry, {modulo}
+importacion = time.perf_counter() - inicio
+parseo = None
+if len(sys.argv) > 1:
+    from app.document_parser import detectar_tipo_y_extraer
+    inicio = time.perf_counter()
+    detectar_tipo_y_extraer(sys.argv[1])
+    parseo = time.perf_counter() - inicio
+with open("/proc/self/status") as f:
+    pico = next(int(l.split()[1]) for l in f if l.startswith("VmHWM:"))
+print(json.dumps({{"importacion": importacion, "parseo": parseo, "rss_kb": pico,
+                  "modulos": len(sys.modules)}}))
+"""
+
+
+def sondear(modulo: str, path: str = None) -> Dict:
+    argumentos = [sys.executable, "-c", _SONDA.format(modulo=modulo)] + ([path] if path else [])
+    salida = subprocess.run(argumentos, check=True, capture_output=True, text=True,
+                            env=dict(os.environ, LOG_LEVEL="WARNING")).stdout
+    return json.loads(salida.strip().splitlines()[-1])
+
+
+def medir(modulo: str, repeticiones: int, path: str = None) -> Dict:
+    sondas = [sondear(modulo, path) for _ in range(repeticiones)]
+    resultado = resumen_tiempos([s["importacion"] for s in sondas])
+    resultado["rss_pico_mb"] = round(max(s["rss_kb"] for s in sondas) / 1024, 1)
+    resultado["modulos"] = sondas[0]["modulos"]
+    if path:
+        parseos = [s["parseo"] for s in sondas]
+        resultado["primer_parseo_p50_s"] = round(sorted(parseos)[len(parseos) // 2], 4)
+    return resultado
+
+
+def main(repeticiones: int, formatos: List[str], lineas: int, salida: str):
+    resultados = {
+        "importar/app.main": medir("app.main", repeticiones),
+        "importar/worker": medir("app.document_parser", repeticiones),
+    }
+    with tempfile.TemporaryDirectory() as directorio:
+        for formato in formatos:
+            extension = "pdf" if formato == "pdf_escaneado" else formato
+            path = os.path.join(directorio, f"albaran.{extension}")
+            escribir_documento(formato, path, lineas, seed=1)
+            try:
+                resultados[f"worker/{formato}"] = medir("app.document_parser", repeticiones, path)
+            except subprocess.CalledProcessError as e:
+                resultados[f"worker/{formato}"] = {"error": e.stderr.strip().splitlines()[-1]}
+
+    parametros = {"repeticiones": repeticiones, "formatos": formatos, "lineas": lineas}
+    guardar("arranque", parametros, resultados, salida)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--formatos", nargs="*", choices=FORMATOS, default=["pdf", "xlsx", "csv", "xml", "txt"])
+    parser.add_argument("--lineas", type=int, default=40)
+    parser.add_argument("--salida", default=None)
+    args = parser.parse_args()
+    main(args.repeticiones, args.formatos, args.lineas, args.salida)
@@ -0,0 +1,86 @@
+# Mide los tokens que ahorra la normalización (app.normalizer) sobre un corpus:
+# albaranes sintéticos con el formato que dejan los parsers (páginas de PDF separadas
+# por \f con la misma cabecera y pie, tablas alineadas con espacios) y, opcionalmente,
+# un directorio de documentos reales que se parsean con document_parser.
+#
+#   python -m benchmarks.bench_normalizer --documentos 20 --paginas 5
+#   python -m benchmarks.bench_normalizer --corpus /ruta/a/albaranes
+import argparse
+import json
+import os
+import random
+import time
+
+from benchmarks.synthetic import generar_cabecera, generar_linea
+
+
+def albaran_paginado(paginas: int, lineas_por_pagina: int, seed: int) -> str:
+    rng = random.Random(seed)
+    cabecera = generar_cabecera(rng)
+    textos = []
+    for pagina in range(1, paginas + 1):
+        lineas = [cabecera, ""]
+        lineas.extend(generar_linea(rng) for _ in range(lineas_por_pagina))
+        lineas.extend(["", "", "-" * 60, "Suma y sigue" if pagina < paginas else "",
+                       f"Página {pagina} de {paginas}", "Impreso el 12/03/2024 10:4{pagina % 10}"])
+        textos.append("\n".join(lineas))
+    return "\n\f".join(textos)
+
+
+def corpus_sintetico(documentos: int, paginas: int, lineas_por_pagina: int):
+    for i in range(documentos):
+        yield f"sintetico_{i}.txt", albaran_paginado(paginas, lineas_por_pagina, seed=i)
+
+
+def corpus_directorio(directorio: str):
+    from app.document_parser import detectar_tipo_y_extraer
+
+    for nombre in sorted(os.listdir(directorio)):
+        path = os.path.join(directorio, nombre)
+        if not os.path.isfile(path):
+            continue
+        try:
+            yield nombre, detectar_tipo_y_extraer(path)
+        except Exception as e:
+            print(f"  {nombre}: no se pudo parsear ({e})")
+
+
+def main(documentos: int, paginas: int, lineas_por_pagina: int, corpus: str = None):
+    from app.agent import get_token_budget
+    from app.normalizer import NormalizationStats, normalizar_texto
+
+    budget = get_token_budget()
+    fuente = corpus_directorio(corpus) if corpus else corpus_sintetico(documentos, paginas, lineas_por_pagina)
+
+    por_documento = {}
+    antes = despues = 0
+    segundos = 0.0
+    for nombre, texto in fuente:
+        stats = NormalizationStats()
+        inicio = time.perf_counter()
+        normalizado = normalizar_texto(texto, stats)
+        segundos += time.perf_counter() - inicio
+        stats.tokens_antes = budget.contar(texto)
+        stats.tokens_despues = budget.contar(normalizado)
+        antes += stats.tokens_antes
+        despues += stats.tokens_despues
+        por_documento[nombre] = stats.to_dict()
+
+    print(json.dumps({
+        "documentos": len(por_documento),
+        "tokens_antes": antes,
+        "tokens_despues": despues,
+        "ahorro_tokens": round(1 - despues / max(antes, 1), 3),
+        "segundos_normalizacion": round(segundos, 4),
+        "por_documento": por_documento,
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documentos", type=int, default=20)
+    parser.add_argument("--paginas", type=int, default=5)
+    parser.add_argument("--lineas-por-pagina", type=int, default=30)
+    parser.add_argument("--corpus", default=None, help="directorio con documentos reales")
+    args = parser.parse_args()
+    main(args.documentos, args.paginas, args.lineas_por_pagina, args.corpus)
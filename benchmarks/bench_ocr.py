@@ -0,0 +1,129 @@
+# Compara por página el OCR anterior (parámetros fijos: spa+eng+deu+cat en imágenes,
+# 300 dpi + spa en PDF) con app.ocr (preprocesado, DPI adaptativo e idioma detectado).
+# Sin --corpus se generan páginas escaneadas sintéticas (texto de albarán, ligeramente
+# inclinadas y con ruido). Necesita tesseract (y poppler para los PDF).
+#
+#   python -m benchmarks.bench_ocr --paginas 5
+#   python -m benchmarks.bench_ocr --corpus /ruta/a/escaneos
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import pytesseract
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from benchmarks.synthetic import generar_albaran_texto
+
+IDIOMAS_LEGACY_IMAGEN = "spa+eng+deu+cat"
+DPI_LEGACY_PDF = 300
+IDIOMA_LEGACY_PDF = "spa"
+
+
+def _fuente(tamano: int):
+    for path in ("/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf",
+                 "/usr/share/fonts/dejavu/DejaVuSansMono.ttf"):
+        if os.path.exists(path):
+            return ImageFont.truetype(path, tamano)
+    return ImageFont.load_default()
+
+
+def pagina_escaneada(seed: int) -> Image.Image:
+    # A4 a 300 dpi, como lo entregaría un escáner
+    rng = random.Random(seed)
+    imagen = Image.new("L", (2480, 3508), 235)
+    dibujo = ImageDraw.Draw(imagen)
+    fuente = _fuente(34)
+    for i, linea in enumerate(generar_albaran_texto(60, seed=seed, lineas_por_pagina=60).splitlines()[:70]):
+        dibujo.text((150, 150 + i * 46), linea, fill=rng.randint(10, 60), font=fuente)
+    imagen = imagen.rotate(rng.uniform(-2, 2), resample=Image.BICUBIC, fillcolor=235)
+    return imagen.filter(ImageFilter.GaussianBlur(0.8)).convert("RGB")
+
+
+def _legacy(path: str):
+    from pdf2image import convert_from_path, pdfinfo_from_path
+
+    if path.lower().endswith(".pdf"):
+        for numero in range(1, pdfinfo_from_path(path)["Pages"] + 1):
+            inicio = time.perf_counter()
+            imagen = convert_from_path(path, dpi=DPI_LEGACY_PDF, first_page=numero, last_page=numero)[0]
+            texto = pytesseract.image_to_string(imagen, lang=IDIOMA_LEGACY_PDF)
+            yield texto, time.perf_counter() - inicio
+    else:
+        inicio = time.perf_counter()
+        texto = pytesseract.image_to_string(Image.open(path), lang=IDIOMAS_LEGACY_IMAGEN)
+        yield texto, time.perf_counter() - inicio
+
+
+def _nuevo(path: str):
+    from pdf2image import convert_from_path, pdfinfo_from_path
+    from app.ocr import get_ocr_engine
+
+    engine = get_ocr_engine()
+    if path.lower().endswith(".pdf"):
+        idioma = None
+        for numero in range(1, pdfinfo_from_path(path)["Pages"] + 1):
+            # Como app.parsers.pdf: el idioma de la primera página vale para el resto
+            pagina = engine.reconocer_pagina(
+                lambda dpi: convert_from_path(path, dpi=dpi, first_page=numero, last_page=numero)[0], numero, idioma
+            )
+            idioma = idioma or pagina.idioma
+            yield pagina
+    else:
+        with Image.open(path) as imagen:
+            yield engine.reconocer_imagen(imagen)
+
+
+def _similitud(a: str, b: str) -> float:
+    # Solapamiento de palabras con el texto de referencia (si se conoce)
+    pa, pb = set(a.split()), set(b.split())
+    return round(len(pa & pb) / max(len(pb), 1), 3)
+
+
+def main(paginas: int, corpus: str = None, directorio_tmp: str = "/tmp/bench_ocr"):
+    try:
+        pytesseract.get_tesseract_version()
+    except Exception as e:
+        sys.exit(f"tesseract no disponible: {e}")
+
+    referencias = {}
+    if corpus:
+        ficheros = [os.path.join(corpus, f) for f in sorted(os.listdir(corpus))
+                    if f.lower().endswith((".pdf", ".png", ".jpg", ".jpeg", ".tiff"))]
+    else:
+        os.makedirs(directorio_tmp, exist_ok=True)
+        ficheros = []
+        for i in range(paginas):
+            path = os.path.join(directorio_tmp, f"escaneo_{i}.png")
+            pagina_escaneada(i).save(path)
+            ficheros.append(path)
+            referencias[path] = generar_albaran_texto(60, seed=i, lineas_por_pagina=60)
+
+    resultados, total_legacy, total_nuevo = [], 0.0, 0.0
+    for path in ficheros:
+        for (texto_legacy, segundos_legacy), pagina in zip(_legacy(path), _nuevo(path)):
+            total_legacy += segundos_legacy
+            total_nuevo += pagina.segundos
+            fila = {"fichero": os.path.basename(path), "legacy_segundos": round(segundos_legacy, 3), **pagina.to_dict()}
+            if path in referencias:
+                fila["legacy_similitud"] = _similitud(texto_legacy, referencias[path])
+                fila["similitud"] = _similitud(pagina.texto, referencias[path])
+            resultados.append(fila)
+
+    print(json.dumps({
+        "paginas": len(resultados),
+        "legacy_segundos": round(total_legacy, 3),
+        "nuevo_segundos": round(total_nuevo, 3),
+        "aceleracion": round(total_legacy / max(total_nuevo, 1e-9), 2),
+        "por_pagina": resultados,
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--paginas", type=int, default=5)
+    parser.add_argument("--corpus", default=None, help="directorio con PDF escaneados o imágenes")
+    args = parser.parse_args()
+    main(args.paginas, args.corpus)
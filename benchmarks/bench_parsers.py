@@ -0,0 +1,126 @@
+# Compara los parsers de XML, Excel y CSV en streaming con las implementaciones
+# anteriores (ElementTree completo + recursión, pandas.to_string, CSV en bruto) sobre
+# ficheros de varios MB: tiempo, pico de RSS y tokens del texto resultante.
+# Cada medición se hace en un proceso nuevo para que el pico de RSS sea comparable.
+#
+#   python -m benchmarks.bench_parsers --filas 100000
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks.corpus import escribir_csv, escribir_xlsx, escribir_xml
+from benchmarks.resultados import pico_rss_kb
+from benchmarks.synthetic import generar_filas
+
+
+def xml_legacy(filepath):
+    import xml.etree.ElementTree as ET
+
+    root = ET.parse(filepath).getroot()
+
+    def extract_text_recursive(element, level=0):
+        text_parts = []
+        indent = "  " * level
+        if any(keyword in element.tag.lower() for keyword in ['item', 'product', 'article', 'line', 'articulo', 'producto']):
+            if element.text and element.text.strip():
+                text_parts.append(f"{element.tag}: {element.text.strip()}")
+            for attr_name, attr_value in element.attrib.items():
+                text_parts.append(f"  {attr_name}: {attr_value}")
+            for child in element:
+                if child.text and child.text.strip():
+                    text_parts.append(f"  {child.tag}: {child.text.strip()}")
+                for attr_name, attr_value in child.attrib.items():
+                    text_parts.append(f"    {attr_name}: {attr_value}")
+        else:
+            if element.text and element.text.strip():
+                text_parts.append(f"{indent}{element.tag}: {element.text.strip()}")
+            for attr_name, attr_value in element.attrib.items():
+                text_parts.append(f"{indent}  {attr_name}: {attr_value}")
+            for child in element:
+                text_parts.extend(extract_text_recursive(child, level + 1))
+        return text_parts
+
+    return "\n".join(extract_text_recursive(root))
+
+
+def excel_legacy(filepath):
+    import pandas as pd
+    return pd.read_excel(filepath, sheet_name=0).to_string(index=False)
+
+
+def csv_legacy(filepath):
+    with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+def _nuevo(nombre):
+    from app.document_parser import PARSERS, cargar_parser
+    return cargar_parser(next(plugin for plugin in PARSERS if plugin.nombre == nombre))
+
+
+IMPLEMENTACIONES = {
+    "xml": (xml_legacy, "xml"),
+    "xlsx": (excel_legacy, "excel"),
+    "csv": (csv_legacy, "csv"),
+}
+
+
+def _medir_en_proceso(formato, variante, path):
+    legacy, nuevo = IMPLEMENTACIONES[formato]
+    fn = legacy if variante == "legacy" else _nuevo(nuevo)
+    import pandas  # noqa: F401  (mismas librerías cargadas en ambas variantes)
+    _nuevo(nuevo)
+    base = pico_rss_kb()
+    inicio = time.perf_counter()
+    texto = fn(path)
+    segundos = time.perf_counter() - inicio
+    pico = pico_rss_kb()
+    return segundos, base, pico, texto
+
+
+def generar_ficheros(directorio, filas):
+    datos = list(generar_filas(filas, seed=11))
+    ficheros = {
+        "xml": (escribir_xml, os.path.join(directorio, "edi.xml")),
+        "xlsx": (escribir_xlsx, os.path.join(directorio, "export.xlsx")),
+        "csv": (escribir_csv, os.path.join(directorio, "export.csv")),
+    }
+    for escritor, path in ficheros.values():
+        escritor(path, datos)
+    return {formato: path for formato, (_, path) in ficheros.items()}
+
+
+def main(filas: int):
+    from app.agent import get_token_budget
+
+    budget = get_token_budget()
+    ctx = multiprocessing.get_context("spawn")
+    resultados = {}
+    with tempfile.TemporaryDirectory() as directorio:
+        ficheros = generar_ficheros(directorio, filas)
+        for formato, path in ficheros.items():
+            resultados[formato] = {"bytes": os.path.getsize(path)}
+            for variante in ("legacy", "nuevo"):
+                with ctx.Pool(1, maxtasksperchild=1) as pool:
+                    segundos, base, pico, texto = pool.apply(_medir_en_proceso, (formato, variante, path))
+                resultados[formato][variante] = {
+                    "segundos": round(segundos, 3),
+                    "rss_pico_mb": round(pico / 1024, 1),
+                    "rss_incremento_mb": round((pico - base) / 1024, 1),
+                    "caracteres": len(texto),
+                    "tokens": budget.contar(texto),
+                }
+            legacy, nuevo = resultados[formato]["legacy"], resultados[formato]["nuevo"]
+            resultados[formato]["ahorro_tokens"] = round(1 - nuevo["tokens"] / max(legacy["tokens"], 1), 3)
+
+    print(json.dumps({"filas": filas, "resultados": resultados}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, default=100000)
+    args = parser.parse_args()
+    main(args.filas)
@@ -0,0 +1,97 @@
+# Compara el recuento de tokens anterior (encoding_for_model + encode del prompt completo
+# en cada petición, recorte a ciegas por caracteres) con TokenBudget sobre documentos
+# de ~100k tokens.
+#
+#   python -m benchmarks.bench_tokens --tokens 100000 --repeticiones 5
+import argparse
+import json
+import time
+
+import tiktoken
+
+from app.agent import MODEL_NAME, MAX_TOTAL_TOKENS, MAX_OUTPUT_TOKENS, TOKEN_SAFETY_MARGIN
+from app.prompts import get_prompt_registry
+from app.token_budget import TokenBudget
+from benchmarks.synthetic import generar_albaran_texto
+
+
+def contar_legacy(plantilla: str, texto: str) -> int:
+    try:
+        encoding = tiktoken.encoding_for_model(MODEL_NAME)
+    except Exception:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return len(encoding.encode(plantilla.replace("{documento_extraido}", texto)))
+
+
+def recortar_legacy(plantilla: str, texto: str, max_prompt: int) -> str:
+    prompt_tokens = contar_legacy(plantilla, texto)
+    if prompt_tokens > max_prompt:
+        exceso = prompt_tokens - max_prompt
+        texto = texto[:-exceso * 4]
+    return texto
+
+
+def recortar(budget: TokenBudget, texto: str, max_tokens: int) -> str:
+    # Recorte exacto en frontera de token, como referencia para el recorte por caracteres
+    tokens = budget.encoding.encode_ordinary(texto)
+    if len(tokens) <= max_tokens:
+        return texto
+    return budget.encoding.decode(tokens[:max_tokens])
+
+
+def medir(fn, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        salida = fn()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), salida
+
+
+def generar_documento(budget: TokenBudget, objetivo: int) -> str:
+    lineas = 200
+    while True:
+        texto = generar_albaran_texto(lineas, seed=7)
+        tokens = budget.contar(texto)
+        if tokens >= objetivo:
+            return recortar(budget, texto, objetivo)
+        lineas = int(lineas * objetivo / max(tokens, 1)) + 50
+
+
+def main(objetivo: int, repeticiones: int, chunk_tokens: int):
+    budget = TokenBudget(MODEL_NAME, MAX_TOTAL_TOKENS, MAX_OUTPUT_TOKENS, TOKEN_SAFETY_MARGIN)
+    texto = generar_documento(budget, objetivo)
+    plantilla = get_prompt_registry().get("documento")
+    with open(plantilla.path, encoding="utf-8") as f:
+        prompt_base = f.read()
+    budget.tokens_plantilla(plantilla.fijo)
+
+    t_legacy, _ = medir(lambda: contar_legacy(prompt_base, texto), repeticiones)
+    t_budget, _ = medir(lambda: budget.trocear(texto, plantilla.fijo), repeticiones)
+    t_trocear, (chunks, _) = medir(lambda: budget.trocear(texto, plantilla.fijo, chunk_tokens), repeticiones)
+
+    # Precisión del recorte cuando el documento no cabe: límite artificial a la mitad
+    max_prompt = budget.tokens_plantilla(plantilla.fijo) + objetivo // 2
+    recortado_legacy = recortar_legacy(prompt_base, texto, max_prompt)
+    recortado_budget = recortar(budget, texto, objetivo // 2)
+
+    print(json.dumps({
+        "tokens_documento": budget.contar(texto),
+        "contar_legacy_s": round(t_legacy, 4),
+        "contar_budget_s": round(t_budget, 4),
+        "speedup": round(t_legacy / t_budget, 2),
+        "trocear_s": round(t_trocear, 4),
+        "trozos": len(chunks),
+        "recorte_objetivo_tokens": objetivo // 2,
+        "recorte_legacy_tokens": budget.contar(recortado_legacy),
+        "recorte_budget_tokens": budget.contar(recortado_budget),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=100000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--chunk-tokens", type=int, default=6000)
+    args = parser.parse_args()
+    main(args.tokens, args.repeticiones, args.chunk_tokens)
@@ -0,0 +1,84 @@
+# Compara la anonimización en serie con la anonimización por trozos en paralelo sobre
+# textos de varios MB (albarán paginado como un volcado de OCR y una exportación de
+# Excel ya parseada). Comprueba que la salida y las estadísticas son idénticas.
+#
+#   ANON_SHARD_WORKERS=4 python -m benchmarks.bench_trozos --mb 4 --repeticiones 3
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.corpus import escribir_csv
+from benchmarks.synthetic import generar_albaran_texto, generar_filas
+
+
+def texto_ocr(mb: float) -> str:
+    texto = generar_albaran_texto(2000, seed=5)
+    return (texto + "\n") * max(1, int(mb * 1e6 / len(texto)))
+
+
+def texto_excel(mb: float) -> str:
+    from app.parsers.tablas import extraer_texto_csv
+
+    with tempfile.TemporaryDirectory() as directorio:
+        path = os.path.join(directorio, "export.csv")
+        escribir_csv(path, generar_filas(int(mb * 1e6 / 45), seed=9))
+        return extraer_texto_csv(path)
+
+
+def medir(fn, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        salida = fn()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), salida
+
+
+def main(mb: float, repeticiones: int):
+    from app.security import sharding
+    from app.security.data_anonymizer import DataAnonymizer
+
+    anonymizer = DataAnonymizer()
+    provider_config, provider_matchers, _ = anonymizer._estado
+    resultados = {}
+    for nombre, texto in (("ocr", texto_ocr(mb)), ("excel", texto_excel(mb))):
+        def serie():
+            texto_serie, pasadas = anonymizer._anonymize_passes(texto, None, True, provider_config, provider_matchers)
+            return texto_serie, anonymizer._merge_stats([pasadas])
+
+        def trozos():
+            return anonymizer.anonymize(texto)
+
+        # Arranque del pool fuera de la medición
+        anonymizer.anonymize(texto)
+        t_serie, (salida_serie, stats_serie) = medir(serie, repeticiones)
+        t_trozos, (salida_trozos, stats_trozos) = medir(trozos, repeticiones)
+
+        assert salida_serie == salida_trozos, f"{nombre}: la salida por trozos difiere de la salida en serie"
+        assert list(stats_serie.by_type.items()) == list(stats_trozos.by_type.items()), f"{nombre}: estadísticas distintas"
+
+        resultados[nombre] = {
+            "caracteres": len(texto),
+            "trozos": len(sharding.trocear(texto)),
+            "reemplazos": stats_trozos.total_replacements,
+            "serie_s": round(t_serie, 3),
+            "trozos_s": round(t_trozos, 3),
+            "speedup": round(t_serie / t_trozos, 2),
+        }
+
+    sharding.shutdown_shard_executor()
+    print(json.dumps({
+        "workers": sharding.ANON_SHARD_WORKERS,
+        "min_caracteres": sharding.ANON_SHARD_MIN_CHARS,
+        "resultados": resultados,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=float, default=4)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+    main(args.mb, args.repeticiones)
@@ -0,0 +1,77 @@
+# Compara dos ficheros de resultados (benchmarks.micro o benchmarks.load) y marca las
+# métricas que empeoran más que el umbral. Sale con código 1 si hay regresiones.
+#
+#   python -m benchmarks.comparar resultados/base.json resultados/nuevo.json --umbral 0.10
+import argparse
+import json
+import sys
+from typing import Dict, List, Tuple
+
+# Métrica -> True si un valor mayor es mejor
+METRICAS = {
+    "p50_s": False,
+    "p95_s": False,
+    "p99_s": False,
+    "throughput_rps": True,
+    "rss_pico_mb": False,
+    "errores": False,
+}
+
+
+def _cargar(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def comparar(base: Dict, nuevo: Dict, umbral: float) -> Tuple[List[Dict], List[Dict]]:
+    filas, regresiones = [], []
+    for nombre, actual in nuevo["resultados"].items():
+        anterior = base["resultados"].get(nombre)
+        if not isinstance(actual, dict) or not isinstance(anterior, dict):
+            continue
+        for metrica, mayor_mejor in METRICAS.items():
+            if metrica not in actual or metrica not in anterior:
+                continue
+            a, b = anterior[metrica], actual[metrica]
+            cambio = (b - a) / a if a else (0.0 if b == a else float("inf"))
+            empeora = -cambio if mayor_mejor else cambio
+            fila = {"benchmark": nombre, "metrica": metrica, "base": a, "nuevo": b,
+                    "cambio": round(cambio, 4), "regresion": empeora > umbral}
+            filas.append(fila)
+            if fila["regresion"]:
+                regresiones.append(fila)
+    return filas, regresiones
+
+
+def main(base_path: str, nuevo_path: str, umbral: float, como_json: bool) -> int:
+    base, nuevo = _cargar(base_path), _cargar(nuevo_path)
+    if base.get("tipo") != nuevo.get("tipo"):
+        print(f"Resultados de tipos distintos: {base.get('tipo')} / {nuevo.get('tipo')}", file=sys.stderr)
+        return 2
+    if base.get("parametros") != nuevo.get("parametros"):
+        print("Aviso: las ejecuciones usaron parámetros distintos", file=sys.stderr)
+
+    filas, regresiones = comparar(base, nuevo, umbral)
+    if como_json:
+        print(json.dumps({
+            "base": base["metadatos"], "nuevo": nuevo["metadatos"], "umbral": umbral,
+            "comparacion": filas, "regresiones": len(regresiones),
+        }, indent=2, ensure_ascii=False))
+    else:
+        print(f"base {base['metadatos'].get('commit')}  ->  nuevo {nuevo['metadatos'].get('commit')}  (umbral {umbral:.0%})")
+        for fila in filas:
+            marca = "REGRESIÓN" if fila["regresion"] else ""
+            print(f"{fila['benchmark']:<32} {fila['metrica']:<15} {fila['base']:>12} {fila['nuevo']:>12} "
+                  f"{fila['cambio']:>+9.1%}  {marca}")
+        print(f"{len(regresiones)} regresiones")
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base")
+    parser.add_argument("nuevo")
+    parser.add_argument("--umbral", type=float, default=0.10, help="empeoramiento relativo tolerado")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    sys.exit(main(args.base, args.nuevo, args.umbral, args.json))
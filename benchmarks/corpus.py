@@ -0,0 +1,184 @@
+# Corpus de albaranes sintéticos en todos los formatos que acepta el servicio:
+# PDF con capa de texto, PDF escaneado (solo imagen), XLSX, CSV, XML, PNG y TXT.
+# Deja un corpus.json con la lista de ficheros para el resto de benchmarks.
+#
+#   python -m benchmarks.corpus --salida /tmp/corpus --documentos 3 --lineas 120
+import argparse
+import json
+import os
+import random
+from typing import Dict, Iterable, List
+
+from benchmarks.synthetic import generar_albaran_texto, generar_filas
+
+COLUMNAS = ["codigo", "descripcion", "lote", "caducidad", "unidades"]
+FORMATOS = ["pdf", "pdf_escaneado", "xlsx", "csv", "xml", "png", "txt"]
+MANIFIESTO = "corpus.json"
+
+# Página A4 en puntos para el PDF con capa de texto y en píxeles (200 DPI) para los escaneados
+A4_PUNTOS = (595, 842)
+A4_PIXELES = (1654, 2339)
+LINEAS_POR_PAGINA_PDF = 70
+LINEAS_POR_PAGINA_IMAGEN = 55
+
+
+def escribir_xml(path: str, filas: Iterable[Dict]):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<edi:DespatchAdvice xmlns:edi="urn:oasis:names:specification:ubl:schema:xsd:DespatchAdvice-2">\n')
+        f.write("  <edi:Header><edi:Supplier>Albet Comercial</edi:Supplier><edi:Number>ALB12345</edi:Number></edi:Header>\n")
+        f.write("  <edi:Detail>\n")
+        for i, fila in enumerate(filas):
+            f.write(f'    <edi:DespatchLine id="{i + 1}">')
+            f.write("".join(f"<edi:{c}>{fila[c]}</edi:{c}>" for c in COLUMNAS))
+            f.write("</edi:DespatchLine>\n")
+        f.write("  </edi:Detail>\n</edi:DespatchAdvice>\n")
+
+
+def escribir_csv(path: str, filas: Iterable[Dict]):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(";".join(COLUMNAS) + "\n")
+        for fila in filas:
+            f.write(";".join(f"{fila[c]:<12}" if c == "descripcion" else str(fila[c]) for c in COLUMNAS) + "\n")
+
+
+def escribir_xlsx(path: str, filas: Iterable[Dict]):
+    from openpyxl import Workbook
+
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet()
+    hoja.append(COLUMNAS)
+    for fila in filas:
+        hoja.append([fila[c] for c in COLUMNAS])
+    libro.save(path)
+
+
+def _paginas(texto: str, lineas_por_pagina: int) -> List[List[str]]:
+    lineas = texto.split("\n")
+    return [lineas[i:i + lineas_por_pagina] for i in range(0, len(lineas), lineas_por_pagina)] or [[""]]
+
+
+def _cadena_pdf(linea: str) -> bytes:
+    linea = linea.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return b"(" + linea.encode("cp1252", errors="replace") + b")"
+
+
+def escribir_pdf_texto(path: str, texto: str):
+    # PDF mínimo escrito a mano (Helvetica, WinAnsi): sin dependencias y con una capa
+    # de texto que PyPDF2 extrae igual que la de un PDF generado por un ERP
+    paginas = _paginas(texto, LINEAS_POR_PAGINA_PDF)
+    objetos: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # Pages: se rellena cuando se conocen los números de página
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    kids = []
+    for lineas in paginas:
+        contenido = b"BT /F1 8 Tf 10 TL 30 %d Td " % (A4_PUNTOS[1] - 40)
+        contenido += b"".join(_cadena_pdf(linea) + b" Tj T* " for linea in lineas) + b"ET"
+        objetos.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(contenido), contenido))
+        objetos.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (A4_PUNTOS[0], A4_PUNTOS[1], len(objetos))
+        )
+        kids.append(b"%d 0 R" % len(objetos))
+    objetos[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    salida = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for numero, objeto in enumerate(objetos, start=1):
+        offsets.append(len(salida))
+        salida += b"%d 0 obj\n%s\nendobj\n" % (numero, objeto)
+    xref = len(salida)
+    salida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    salida += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    salida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(salida)
+
+
+def renderizar_paginas(texto: str, seed: int = 0):
+    # Páginas "escaneadas": texto negro sobre blanco con una leve inclinación y ruido,
+    # para que el OCR pase por el preprocesado como con un escáner real
+    from PIL import Image, ImageDraw, ImageFont
+
+    rng = random.Random(seed)
+    fuente = ImageFont.load_default(size=22)
+    imagenes = []
+    for lineas in _paginas(texto, LINEAS_POR_PAGINA_IMAGEN):
+        imagen = Image.new("L", A4_PIXELES, 255)
+        dibujo = ImageDraw.Draw(imagen)
+        for i, linea in enumerate(lineas):
+            dibujo.text((90, 110 + i * 38), linea, fill=0, font=fuente)
+        for _ in range(400):
+            dibujo.point((rng.randrange(A4_PIXELES[0]), rng.randrange(A4_PIXELES[1])), fill=rng.randint(120, 200))
+        imagenes.append(imagen.rotate(rng.uniform(-1.5, 1.5), fillcolor=255))
+    return imagenes
+
+
+def escribir_pdf_escaneado(path: str, texto: str, seed: int = 0):
+    imagenes = renderizar_paginas(texto, seed)
+    imagenes[0].save(path, "PDF", resolution=200, save_all=True, append_images=imagenes[1:])
+
+
+def escribir_png(path: str, texto: str, seed: int = 0):
+    # Una imagen es siempre una sola página (foto del albarán)
+    renderizar_paginas(texto, seed)[0].save(path, "PNG", optimize=True)
+
+
+def escribir_documento(formato: str, path: str, lineas: int, seed: int):
+    if formato in ("xml", "csv", "xlsx"):
+        escritor = {"xml": escribir_xml, "csv": escribir_csv, "xlsx": escribir_xlsx}[formato]
+        escritor(path, generar_filas(lineas, seed=seed))
+        return
+    texto = generar_albaran_texto(lineas, seed=seed)
+    if formato == "pdf":
+        escribir_pdf_texto(path, texto)
+    elif formato == "pdf_escaneado":
+        escribir_pdf_escaneado(path, texto, seed)
+    elif formato == "png":
+        escribir_png(path, generar_albaran_texto(min(lineas, LINEAS_POR_PAGINA_IMAGEN - 10), seed=seed), seed)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(texto)
+
+
+def generar_corpus(directorio: str, documentos: int = 3, lineas: int = 120,
+                   formatos: List[str] = None, seed: int = 0) -> List[Dict]:
+    os.makedirs(directorio, exist_ok=True)
+    ficheros = []
+    for formato in formatos or FORMATOS:
+        extension = "pdf" if formato == "pdf_escaneado" else formato
+        for i in range(documentos):
+            nombre = f"albaran_{formato}_{i}.{extension}"
+            path = os.path.join(directorio, nombre)
+            escribir_documento(formato, path, lineas, seed + i)
+            ficheros.append({
+                "nombre": nombre,
+                "formato": formato,
+                "path": os.path.abspath(path),
+                "bytes": os.path.getsize(path),
+                "ocr": formato in ("pdf_escaneado", "png"),
+            })
+    manifiesto = {"documentos": documentos, "lineas": lineas, "seed": seed, "ficheros": ficheros}
+    with open(os.path.join(directorio, MANIFIESTO), "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, indent=2)
+    return ficheros
+
+
+def cargar_corpus(directorio: str) -> List[Dict]:
+    with open(os.path.join(directorio, MANIFIESTO), encoding="utf-8") as f:
+        return json.load(f)["ficheros"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--salida", default="benchmarks/corpus")
+    parser.add_argument("--documentos", type=int, default=3)
+    parser.add_argument("--lineas", type=int, default=120)
+    parser.add_argument("--formatos", nargs="*", choices=FORMATOS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    ficheros = generar_corpus(args.salida, args.documentos, args.lineas, args.formatos, args.seed)
+    for fichero in ficheros:
+        print(f"{fichero['nombre']:<32} {fichero['bytes']:>10} bytes")
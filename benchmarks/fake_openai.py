@@ -0,0 +1,127 @@
+# Servidor local compatible con /v1/chat/completions para medir el servicio sin red.
+#
+#   FAKE_OPENAI_LATENCY=2.0 uvicorn benchmarks.fake_openai:app --port 8099
+#   OPENAI_API_BASE=http://127.0.0.1:8099/v1 OPENAI_API_KEY=test uvicorn app.main:app --port 5000
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FAKE_OPENAI_LATENCY = float(os.getenv("FAKE_OPENAI_LATENCY", "1.0"))
+# Items de la respuesta fija; con stream=true la latencia se reparte entre los trozos
+FAKE_OPENAI_ITEMS = int(os.getenv("FAKE_OPENAI_ITEMS", "1"))
+FAKE_OPENAI_STREAM_CHUNK = 8
+# Límites por minuto de la cuenta simulada (0 = sin límite). Por encima responde 429 con
+# Retry-After y las cabeceras x-ratelimit-* como OpenAI; cuenta prompt (~4 caracteres por
+# token) más max_tokens
+FAKE_OPENAI_RPM = int(os.getenv("FAKE_OPENAI_RPM", "0"))
+FAKE_OPENAI_TPM = int(os.getenv("FAKE_OPENAI_TPM", "0"))
+
+RESPUESTA_FIJA = "```json\n[" + ", ".join(
+    '{"codigo": "2111%02d", "lote": "L001", "caducidad": "", "unidades": 6}' % (53 + i)
+    for i in range(FAKE_OPENAI_ITEMS)
+) + "]\n```"
+
+app = FastAPI(title="Fake OpenAI")
+
+stats = {"peticiones": 0, "en_curso": 0, "max_en_curso": 0, "rechazadas_429": 0}
+# Unidades disponibles y último relleno de cada límite (cubo que se rellena de forma continua)
+_cubos = {"requests": [FAKE_OPENAI_RPM, FAKE_OPENAI_RPM, time.monotonic()],
+          "tokens": [FAKE_OPENAI_TPM, FAKE_OPENAI_TPM, time.monotonic()]}
+
+
+def _limite_superado(body) -> Optional[JSONResponse]:
+    coste = {
+        "requests": 1,
+        "tokens": sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4 + body.get("max_tokens", 0),
+    }
+    ahora = time.monotonic()
+    for cubo in _cubos.values():
+        limite, disponible, ultimo = cubo
+        if limite:
+            cubo[1], cubo[2] = min(limite, disponible + (ahora - ultimo) * limite / 60), ahora
+    for tipo, (limite, disponible, _) in _cubos.items():
+        if limite and disponible < min(coste[tipo], limite):
+            stats["rechazadas_429"] += 1
+            espera = (min(coste[tipo], limite) - disponible) * 60 / limite
+            return JSONResponse(status_code=429, headers={
+                "retry-after-ms": str(int(espera * 1000)),
+                "retry-after": str(max(1, round(espera))),
+                "x-ratelimit-limit-requests": str(FAKE_OPENAI_RPM),
+                "x-ratelimit-limit-tokens": str(FAKE_OPENAI_TPM),
+            }, content={"error": {
+                "message": f"Rate limit reached for {tipo} per min. Please try again in {espera:.3f}s.",
+                "type": tipo, "param": None, "code": "rate_limit_exceeded",
+            }})
+    for tipo, cubo in _cubos.items():
+        if cubo[0]:
+            cubo[1] -= min(coste[tipo], cubo[0])
+    return None
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    rechazo = _limite_superado(body)
+    if rechazo is not None:
+        return rechazo
+    if body.get("stream"):
+        return StreamingResponse(_stream(body), media_type="text/event-stream")
+    stats["peticiones"] += 1
+    stats["en_curso"] += 1
+    stats["max_en_curso"] = max(stats["max_en_curso"], stats["en_curso"])
+    try:
+        await asyncio.sleep(FAKE_OPENAI_LATENCY)
+    finally:
+        stats["en_curso"] -= 1
+
+    prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": RESPUESTA_FIJA},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": len(RESPUESTA_FIJA) // 4,
+            "total_tokens": prompt_chars // 4 + len(RESPUESTA_FIJA) // 4,
+        },
+    }
+
+
+async def _stream(body):
+    stats["peticiones"] += 1
+    stats["en_curso"] += 1
+    stats["max_en_curso"] = max(stats["max_en_curso"], stats["en_curso"])
+    id_ = f"chatcmpl-{uuid.uuid4().hex}"
+    trozos = [RESPUESTA_FIJA[i:i + FAKE_OPENAI_STREAM_CHUNK] for i in range(0, len(RESPUESTA_FIJA), FAKE_OPENAI_STREAM_CHUNK)]
+    try:
+        for trozo in trozos + [None]:
+            await asyncio.sleep(FAKE_OPENAI_LATENCY / (len(trozos) + 1))
+            delta = {"content": trozo} if trozo is not None else {}
+            chunk = {
+                "id": id_,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-4o"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None if trozo is not None else "stop"}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+    finally:
+        stats["en_curso"] -= 1
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
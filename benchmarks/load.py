@@ -0,0 +1,212 @@
+# Prueba de carga de /extraer, /extraer-archivo y /extraer-dades-venda contra el servidor
+# OpenAI falso (benchmarks.fake_openai). Cada endpoint se mide por separado: throughput,
+# p50/p95/p99, errores y pico de RSS del servicio (proceso y workers del pool).
+#
+# Con --lanzar arranca el servidor falso y la aplicación en puertos locales:
+#   python -m benchmarks.load --lanzar --latencia 0.5 --peticiones 200 --concurrencia 50 --salida resultados/carga.json
+# Contra un servicio ya arrancado (--pid para medir su RSS):
+#   python -m benchmarks.load --url http://127.0.0.1:5000 --pid 1234 --endpoints extraer
+#
+# Por defecto cada petición lleva un documento distinto (todo fallos de caché);
+# --variantes 1 repite el mismo documento y mide el camino de caché y coalescencia.
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from benchmarks.corpus import FORMATOS, escribir_documento
+from benchmarks.resultados import guardar, pico_rss_arbol_kb, resumen_tiempos
+from benchmarks.synthetic import generar_albaran_texto
+
+ENDPOINTS = ["extraer", "extraer-archivo", "extraer-dades-venda"]
+CONTENT_TYPES = {
+    "pdf": "application/pdf", "pdf_escaneado": "application/pdf", "png": "image/png", "csv": "text/csv",
+    "xml": "application/xml", "txt": "text/plain",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def preparar_documentos(endpoint: str, variantes: int, formato: str, lineas: int, directorio: str) -> List:
+    if endpoint == "extraer":
+        return [generar_albaran_texto(lineas, seed=i) for i in range(variantes)]
+    extension = "pdf" if formato == "pdf_escaneado" else formato
+    documentos = []
+    for i in range(variantes):
+        path = os.path.join(directorio, f"{endpoint}_{i}.{extension}")
+        escribir_documento(formato, path, lineas, seed=i)
+        with open(path, "rb") as f:
+            documentos.append((os.path.basename(path), f.read()))
+    return documentos
+
+
+async def _peticion(session: aiohttp.ClientSession, url: str, endpoint: str, documento, formato: str):
+    if endpoint == "extraer":
+        return await session.post(f"{url}/extraer", json={"texto": documento})
+    nombre, contenido = documento
+    datos = aiohttp.FormData()
+    datos.add_field("file", contenido, filename=nombre, content_type=CONTENT_TYPES[formato])
+    return await session.post(f"{url}/{endpoint}", data=datos)
+
+
+async def medir_endpoint(url: str, endpoint: str, documentos: List, formato: str,
+                         peticiones: int, concurrencia: int, timeout: float) -> Dict:
+    cola: asyncio.Queue = asyncio.Queue()
+    for i in range(peticiones):
+        cola.put_nowait(i)
+    latencias: List[float] = []
+    estados: Counter = Counter()
+
+    async def _worker(session):
+        while True:
+            try:
+                i = cola.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            inicio = time.perf_counter()
+            try:
+                async with await _peticion(session, url, endpoint, documentos[i % len(documentos)], formato) as resp:
+                    await resp.read()
+                    estados[str(resp.status)] += 1
+            except Exception as e:
+                estados[type(e).__name__] += 1
+            latencias.append(time.perf_counter() - inicio)
+
+    connector = aiohttp.TCPConnector(limit=concurrencia)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        inicio = time.perf_counter()
+        await asyncio.gather(*[_worker(session) for _ in range(concurrencia)])
+        duracion = time.perf_counter() - inicio
+
+    resultado = {
+        "peticiones": peticiones,
+        "errores": sum(n for estado, n in estados.items() if estado != "200"),
+        "estados": dict(estados),
+        "duracion_s": round(duracion, 3),
+        "throughput_rps": round(peticiones / duracion, 2),
+    }
+    resultado.update(resumen_tiempos(latencias))
+    return resultado
+
+
+async def _json(url: str) -> Optional[Dict]:
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
+            async with session.get(url) as resp:
+                return await resp.json()
+    except Exception:
+        return None
+
+
+def _esperar(url: str, proceso: subprocess.Popen, limite: float = 30.0):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El proceso para {url} terminó al arrancar (código {proceso.returncode})")
+        if asyncio.run(_json(url)) is not None:
+            return
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {limite:.0f}s")
+
+
+def lanzar(puerto_app: int, puerto_llm: int, latencia: float, entorno: List[str], log: str):
+    # Ambos procesos con el mismo intérprete; el log de la app queda en `log` para revisarlo
+    env_llm = dict(os.environ, FAKE_OPENAI_LATENCY=str(latencia))
+    env_app = dict(os.environ, OPENAI_API_BASE=f"http://127.0.0.1:{puerto_llm}/v1",
+                   OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "test"))
+    env_app.update(variable.split("=", 1) for variable in entorno)
+    salida = open(log, "w")
+    llm = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.fake_openai:app", "--port", str(puerto_llm), "--log-level", "warning"],
+        env=env_llm, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    servicio = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(puerto_app), "--log-level", "warning"],
+        env=env_app, stdout=salida, stderr=subprocess.STDOUT,
+    )
+    procesos = [llm, servicio]
+    try:
+        _esperar(f"http://127.0.0.1:{puerto_llm}/stats", llm)
+        _esperar(f"http://127.0.0.1:{puerto_app}/", servicio)
+    except Exception:
+        parar(procesos)
+        raise
+    return procesos
+
+
+def parar(procesos: List[subprocess.Popen]):
+    for proceso in procesos:
+        proceso.terminate()
+    for proceso in procesos:
+        try:
+            proceso.wait(10)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+
+
+def main(args):
+    procesos = []
+    url, llm_url, pid = args.url, args.llm_url, args.pid
+    if args.lanzar:
+        procesos = lanzar(args.puerto, args.puerto_llm, args.latencia, args.env, args.log)
+        url, llm_url = f"http://127.0.0.1:{args.puerto}", f"http://127.0.0.1:{args.puerto_llm}"
+        pid = procesos[1].pid
+
+    resultados = {}
+    try:
+        with tempfile.TemporaryDirectory() as directorio:
+            for endpoint in args.endpoints:
+                variantes = args.variantes or args.peticiones
+                documentos = preparar_documentos(endpoint, variantes, args.formato, args.lineas, directorio)
+                if args.calentamiento:
+                    # Arranque del pool de parseo, tokenizer, etc. fuera de la medición
+                    asyncio.run(medir_endpoint(url, endpoint, documentos[:1], args.formato, args.calentamiento,
+                                               1, args.timeout))
+                print(f"{endpoint}: {args.peticiones} peticiones, concurrencia {args.concurrencia}", file=sys.stderr)
+                resultados[endpoint] = asyncio.run(medir_endpoint(
+                    url, endpoint, documentos, args.formato, args.peticiones, args.concurrencia, args.timeout
+                ))
+        if pid:
+            resultados["servidor"] = {"rss_pico_mb": round(pico_rss_arbol_kb(pid) / 1024, 1)}
+        llm = asyncio.run(_json(f"{llm_url}/stats")) if llm_url else None
+        if llm is not None:
+            resultados["llm"] = llm
+    finally:
+        parar(procesos)
+
+    parametros = {
+        "url": url, "endpoints": args.endpoints, "peticiones": args.peticiones, "concurrencia": args.concurrencia,
+        "variantes": args.variantes or args.peticiones, "formato": args.formato, "lineas": args.lineas,
+        "latencia_llm_s": args.latencia if args.lanzar else None, "entorno": args.env,
+    }
+    guardar("carga", parametros, resultados, args.salida)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--llm-url", default=None, help="servidor falso, para incluir sus /stats")
+    parser.add_argument("--pid", type=int, default=None, help="pid del servicio para medir su RSS")
+    parser.add_argument("--lanzar", action="store_true", help="arranca el servidor falso y la aplicación")
+    parser.add_argument("--puerto", type=int, default=5077)
+    parser.add_argument("--puerto-llm", type=int, default=8077)
+    parser.add_argument("--latencia", type=float, default=0.5, help="latencia del LLM falso con --lanzar")
+    parser.add_argument("--env", nargs="*", default=[], help="variables VAR=valor para la aplicación con --lanzar")
+    parser.add_argument("--log", default=os.path.join(tempfile.gettempdir(), "benchmark_app.log"))
+    parser.add_argument("--endpoints", nargs="*", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--peticiones", type=int, default=200)
+    parser.add_argument("--concurrencia", type=int, default=50)
+    parser.add_argument("--variantes", type=int, default=0, help="documentos distintos (0 = uno por petición)")
+    parser.add_argument("--formato", choices=FORMATOS, default="pdf",
+                        help="formato de los ficheros de /extraer-archivo y /extraer-dades-venda")
+    parser.add_argument("--lineas", type=int, default=40)
+    parser.add_argument("--calentamiento", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--salida", default=None)
+    main(parser.parse_args())
@@ -0,0 +1,160 @@
+# Micro-benchmarks de las piezas del pipeline sobre el corpus sintético: cada parser
+# (por formato), cada pasada del anonimizador, el recuento/troceo de tokens y la
+# normalización. Salida JSON comparable con benchmarks.comparar.
+#
+#   python -m benchmarks.micro --repeticiones 20 --salida resultados/micro.json
+#   python -m benchmarks.micro --corpus /tmp/corpus --solo parser anonimizador
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from benchmarks.corpus import cargar_corpus, generar_corpus
+from benchmarks.resultados import guardar, pico_rss_kb, resumen_tiempos
+from benchmarks.synthetic import generar_albaran_texto
+
+GRUPOS = ["parser", "anonimizador", "tokens", "normalizador"]
+
+
+def medir(fn: Callable, repeticiones: int, calentamiento: int = 1) -> List[float]:
+    for _ in range(calentamiento):
+        fn()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+def _entrada(tiempos: List[float], bytes_entrada: int, **extra) -> Dict:
+    entrada = resumen_tiempos(tiempos)
+    entrada["bytes"] = bytes_entrada
+    if entrada["p50_s"]:
+        entrada["mb_s"] = round(bytes_entrada / entrada["p50_s"] / 1e6, 2)
+    entrada.update(extra)
+    return entrada
+
+
+def bench_parsers(ficheros: List[Dict], repeticiones: int) -> Dict:
+    from app.document_parser import detectar_tipo_y_extraer
+
+    hay_tesseract = shutil.which("tesseract") is not None
+    resultados = {}
+    por_formato: Dict[str, List[Dict]] = {}
+    for fichero in ficheros:
+        por_formato.setdefault(fichero["formato"], []).append(fichero)
+
+    for formato, lista in por_formato.items():
+        nombre = f"parser/{formato}"
+        if lista[0]["ocr"] and not hay_tesseract:
+            resultados[nombre] = {"omitido": "tesseract no instalado"}
+            continue
+        # El OCR tarda segundos por página: menos repeticiones para que el total sea razonable
+        n = max(1, repeticiones // 10) if lista[0]["ocr"] else repeticiones
+        tiempos, caracteres = [], 0
+        for fichero in lista:
+            caracteres += len(detectar_tipo_y_extraer(fichero["path"]))
+            tiempos.extend(medir(lambda: detectar_tipo_y_extraer(fichero["path"]), n, calentamiento=0))
+        resultados[nombre] = _entrada(
+            tiempos, sum(f["bytes"] for f in lista) // len(lista), caracteres=caracteres // len(lista)
+        )
+    return resultados
+
+
+def bench_anonimizador(texto: str, repeticiones: int, proveedor: str) -> Dict:
+    from app.security.data_anonymizer import AnonymizationStats, DataAnonymizer
+
+    anonymizer = DataAnonymizer()
+    provider_config, provider_matchers, _ = anonymizer._estado
+    bytes_texto = len(texto.encode("utf-8"))
+    # Cada pasada sobre la salida de la anterior, como en anonymize()
+    tras_regex = anonymizer._apply_regex_patterns(texto, AnonymizationStats())
+    tras_proveedor = anonymizer._apply_provider_config(
+        tras_regex, proveedor, AnonymizationStats(), provider_config, provider_matchers
+    )
+    pasadas = {
+        "regex": lambda: anonymizer._apply_regex_patterns(texto, AnonymizationStats()),
+        "proveedor": lambda: anonymizer._apply_provider_config(
+            tras_regex, proveedor, AnonymizationStats(), provider_config, provider_matchers
+        ),
+        "heuristica": lambda: anonymizer._apply_heuristic_detection(tras_proveedor, AnonymizationStats()),
+        "completo": lambda: anonymizer.anonymize(texto, proveedor),
+    }
+    _, stats = anonymizer.anonymize(texto, proveedor)
+    resultados = {
+        f"anonimizador/{nombre}": _entrada(medir(fn, repeticiones), bytes_texto)
+        for nombre, fn in pasadas.items()
+    }
+    resultados["anonimizador/completo"]["reemplazos"] = stats.total_replacements
+    return resultados
+
+
+def bench_tokens(texto: str, repeticiones: int, chunk_tokens: int) -> Dict:
+    from app.agent import get_token_budget
+    from app.prompts import get_prompt_registry
+
+    budget = get_token_budget()
+    fijo = get_prompt_registry().get("documento").fijo
+    budget.tokens_plantilla(fijo)
+    bytes_texto = len(texto.encode("utf-8"))
+    return {
+        "tokens/contar": _entrada(medir(lambda: budget.contar(texto), repeticiones), bytes_texto,
+                                  tokens=budget.contar(texto)),
+        "tokens/trocear": _entrada(medir(lambda: budget.trocear(texto, fijo, chunk_tokens), repeticiones), bytes_texto,
+                                   trozos=len(budget.trocear(texto, fijo, chunk_tokens)[0])),
+    }
+
+
+def bench_normalizador(texto: str, repeticiones: int) -> Dict:
+    from app.normalizer import normalizar_texto
+
+    return {
+        "normalizador/normalizar": _entrada(medir(lambda: normalizar_texto(texto), repeticiones),
+                                            len(texto.encode("utf-8"))),
+    }
+
+
+def main(corpus: str, documentos: int, lineas: int, repeticiones: int, lineas_texto: int,
+         proveedor: str, chunk_tokens: int, solo: List[str], salida: str):
+    grupos = solo or GRUPOS
+    texto = generar_albaran_texto(lineas_texto, seed=42)
+    resultados = {}
+    with tempfile.TemporaryDirectory() as temporal:
+        if "parser" in grupos:
+            if corpus and os.path.exists(corpus):
+                ficheros = cargar_corpus(corpus)
+            else:
+                ficheros = generar_corpus(corpus or temporal, documentos, lineas)
+            resultados.update(bench_parsers(ficheros, repeticiones))
+        if "anonimizador" in grupos:
+            resultados.update(bench_anonimizador(texto, repeticiones, proveedor))
+        if "tokens" in grupos:
+            resultados.update(bench_tokens(texto, repeticiones, chunk_tokens))
+        if "normalizador" in grupos:
+            resultados.update(bench_normalizador(texto, repeticiones))
+
+    resultados["proceso"] = {"rss_pico_mb": round(pico_rss_kb() / 1024, 1)}
+    parametros = {
+        "corpus": corpus, "documentos": documentos, "lineas": lineas, "repeticiones": repeticiones,
+        "lineas_texto": lineas_texto, "proveedor": proveedor, "chunk_tokens": chunk_tokens, "grupos": grupos,
+    }
+    guardar("micro", parametros, resultados, salida)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=None, help="directorio de benchmarks.corpus (se genera si no existe)")
+    parser.add_argument("--documentos", type=int, default=2)
+    parser.add_argument("--lineas", type=int, default=120)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--lineas-texto", type=int, default=2000, help="tamaño del texto de anonimizador/tokens")
+    parser.add_argument("--proveedor", default=None)
+    parser.add_argument("--chunk-tokens", type=int, default=6000)
+    parser.add_argument("--solo", nargs="*", choices=GRUPOS)
+    parser.add_argument("--salida", default=None)
+    args = parser.parse_args()
+    main(args.corpus, args.documentos, args.lineas, args.repeticiones, args.lineas_texto,
+         args.proveedor, args.chunk_tokens, args.solo, args.salida)
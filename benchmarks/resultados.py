@@ -0,0 +1,97 @@
+# Utilidades comunes de los benchmarks: percentiles, pico de RSS y el formato JSON
+# de resultados que compara benchmarks.comparar entre ejecuciones
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+VERSION_FORMATO = 1
+
+
+def percentil(ordenados: List[float], p: float) -> float:
+    # Interpolación lineal entre rangos, como numpy.percentile por defecto
+    if not ordenados:
+        return 0.0
+    k = (len(ordenados) - 1) * p / 100
+    inferior = int(k)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (k - inferior)
+
+
+def resumen_tiempos(segundos: List[float]) -> Dict[str, float]:
+    ordenados = sorted(segundos)
+    return {
+        "n": len(ordenados),
+        "min_s": round(ordenados[0], 6) if ordenados else 0.0,
+        "p50_s": round(percentil(ordenados, 50), 6),
+        "p95_s": round(percentil(ordenados, 95), 6),
+        "p99_s": round(percentil(ordenados, 99), 6),
+        "max_s": round(ordenados[-1], 6) if ordenados else 0.0,
+        "media_s": round(sum(ordenados) / len(ordenados), 6) if ordenados else 0.0,
+    }
+
+
+def pico_rss_kb(pid: Optional[int] = None) -> int:
+    # VmHWM se reinicia con cada proceso; ru_maxrss hereda el pico del padre tras fork+exec
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for linea in f:
+                if linea.startswith("VmHWM:"):
+                    return int(linea.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if pid is None else 0
+
+
+def pico_rss_arbol_kb(pid: int) -> int:
+    # Proceso y descendientes (workers del pool de parseo): suma de los picos de cada uno
+    total = pico_rss_kb(pid)
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            hijos = [int(h) for h in f.read().split()]
+    except OSError:
+        hijos = []
+    return total + sum(pico_rss_arbol_kb(hijo) for hijo in hijos)
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def metadatos() -> Dict:
+    return {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def guardar(tipo: str, parametros: Dict, resultados: Dict, salida: Optional[str] = None) -> Dict:
+    # Siempre se imprime; con --salida además se guarda para compararlo con otra ejecución
+    informe = {
+        "formato": VERSION_FORMATO,
+        "tipo": tipo,
+        "metadatos": metadatos(),
+        "parametros": parametros,
+        "resultados": resultados,
+    }
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if salida:
+        os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+        with open(salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+        print(f"Resultados guardados en {salida}", file=sys.stderr)
+    print(texto)
+    return informe
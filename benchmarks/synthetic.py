@@ -0,0 +1,64 @@
+# Generador de albaranes/facturas sintéticos con datos sensibles realistas
+import random
+
+EMPRESAS = ["Distribuciones Garcia SL", "Ferreteria Montseny SA", "Suministros Industriales Vall", "Albet Comercial"]
+CALLES = ["Calle Mayor", "Avenida Diagonal", "Plaza Catalunya", "Paseo de Gracia", "Pol. Ind. Can Roca"]
+CIUDADES = ["Barcelona", "Girona", "Sabadell", "Terrassa", "Madrid"]
+PRODUCTOS = ["Tornillo M6", "Tuerca M6", "Arandela 8mm", "Taco nylon", "Brida 200mm", "Cable 2,5mm"]
+
+
+def _cif(rng):
+    return rng.choice("ABCDEFGH") + "".join(rng.choice("0123456789") for _ in range(8))
+
+
+def _telefono(rng):
+    return rng.choice("6789") + "".join(rng.choice("0123456789") for _ in range(8))
+
+
+def _iban(rng):
+    d = "".join(rng.choice("0123456789") for _ in range(22))
+    return f"ES{d[:2]} {d[2:6]} {d[6:10]} {d[10:12]} {d[12:22]}"
+
+
+def generar_cabecera(rng) -> str:
+    empresa = rng.choice(EMPRESAS)
+    return "\n".join([
+        empresa.upper(),
+        f"{rng.choice(CALLES)} {rng.randint(1, 200)}, {rng.randint(8000, 8999):05d} {rng.choice(CIUDADES)}",
+        f"CIF: {_cif(rng)}  Tel: {_telefono(rng)}  Email: pedidos@{empresa.split()[0].lower()}.com",
+        f"IBAN: {_iban(rng)}",
+        f"ALBARAN ALB{rng.randint(10000, 99999)}   Pedido PED-{rng.randint(1000, 9999)}   Fecha {rng.randint(1, 28):02d}/0{rng.randint(1, 9)}/2024",
+        "",
+        "Codigo    Descripcion              Lote        Caducidad    Unidades    Precio",
+    ])
+
+
+def generar_linea(rng) -> str:
+    return (
+        f"{rng.randint(100000, 999999)}    {rng.choice(PRODUCTOS):<24} L{rng.randint(100, 9999):<10} "
+        f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2026   {rng.randint(1, 500):<10}  "
+        f"{rng.randint(1, 999)},{rng.randint(0, 99):02d} €"
+    )
+
+
+def generar_albaran_texto(n_lineas: int = 50, seed: int = 0, lineas_por_pagina: int = 40) -> str:
+    rng = random.Random(seed)
+    partes = []
+    for inicio in range(0, max(n_lineas, 1), lineas_por_pagina):
+        partes.append(generar_cabecera(rng))
+        for _ in range(min(lineas_por_pagina, n_lineas - inicio)):
+            partes.append(generar_linea(rng))
+        partes.append(f"\nPágina {inicio // lineas_por_pagina + 1}\n")
+    return "\n".join(partes)
+
+
+def generar_filas(n_lineas: int = 50, seed: int = 0):
+    rng = random.Random(seed)
+    for _ in range(n_lineas):
+        yield {
+            "codigo": str(rng.randint(100000, 999999)),
+            "descripcion": rng.choice(PRODUCTOS),
+            "lote": f"L{rng.randint(100, 9999)}",
+            "caducidad": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2026",
+            "unidades": rng.randint(1, 500),
+        }
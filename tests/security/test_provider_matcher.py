@@ -0,0 +1,111 @@
+import re
+
+from app.security.provider_matcher import (
+    BOUNDED, CIF, UNBOUNDED, ProviderMatcher, ProviderMatcherIndex, build_trie_regex, provider_entries,
+)
+
+
+def _aplicar(config, texto):
+    campos = []
+    return ProviderMatcher(provider_entries(config)).apply(texto, campos.append), campos
+
+
+def test_trie_regex_casa_los_mismos_literales():
+    palabras = ["ab", "abc", "abd", "b", "a.c"]
+    regex = re.compile(build_trie_regex(palabras))
+    for palabra in palabras:
+        assert regex.fullmatch(palabra)
+    assert not regex.fullmatch("abx")
+    # El literal más largo gana al prefijo
+    assert regex.match("abcd").group() == "abc"
+
+
+def test_tipos_de_literal():
+    entries = provider_entries({
+        "nombres_empresa": ["Ferreteria Lopez", "  "],
+        "codigos_especiales": ["B12345678", "REF-X"],
+        "no_lista": "ignorado",
+    })
+    assert [(literal, tipo) for literal, tipo, _, _ in entries] == [
+        ("Ferreteria Lopez", BOUNDED), ("B12345678", CIF), ("REF-X", UNBOUNDED),
+    ]
+
+
+def test_sustituye_literales_y_respeta_placeholders():
+    config = {
+        "nombres_empresa": ["Ferreteria Lopez"],
+        "direcciones": ["Calle Mayor 3"],
+        "codigos_especiales": ["B12345678", "REF"],
+    }
+    texto = "FERRETERIA LOPEZ, calle mayor 3. CIF: B12345678 [TELEFONO] PREFIJO"
+
+    resultado, campos = _aplicar(config, texto)
+
+    assert resultado == "[NOMBRES_EMPRESA_PROVEEDOR], [DIRECCIONES_PROVEEDOR]. [CIF] [TELEFONO] P[CODIGOS_ESPECIALES_PROVEEDOR]IJO"
+    assert campos == ["nombres_empresa", "direcciones", "codigos_especiales", "codigos_especiales"]
+
+
+def test_literal_acotado_no_casa_dentro_de_palabra():
+    resultado, campos = _aplicar({"nombres_empresa": ["Lopez"]}, "Lopezano y Lopez")
+    assert resultado == "Lopezano y [NOMBRES_EMPRESA_PROVEEDOR]"
+    assert campos == ["nombres_empresa"]
+
+
+def test_literal_en_varios_campos_gana_el_primero():
+    resultado, campos = _aplicar({"nombres_empresa": ["Acme"], "marcas": ["acme"]}, "Acme")
+    assert resultado == "[NOMBRES_EMPRESA_PROVEEDOR]"
+    assert campos == ["nombres_empresa"]
+
+
+def test_plegado_de_mayusculas_distinto_de_lower():
+    # 'ſ' (s larga) y el signo Kelvin casan sin distinguir mayúsculas pero lower() no los pliega
+    resultado, campos = _aplicar({"nombres_empresa": ["Sanchez SL", "Kappa"]}, "\u017fanchez SL y \u212aappa")
+    assert resultado == "[NOMBRES_EMPRESA_PROVEEDOR] y [NOMBRES_EMPRESA_PROVEEDOR]"
+    assert campos == ["nombres_empresa", "nombres_empresa"]
+
+
+def test_prefijo_comun_gana_el_literal_mas_largo():
+    # Con la alternancia del trie gana el más largo aunque el corto vaya antes en la config
+    resultado, _ = _aplicar({"codigos_especiales": ["REF", "REFX"]}, "REFX")
+    assert resultado == "[CODIGOS_ESPECIALES_PROVEEDOR]"
+    assert _aplicar({"codigos_especiales": ["REF"]}, "REFX")[0] == "[CODIGOS_ESPECIALES_PROVEEDOR]X"
+
+
+def test_en_la_misma_posicion_gana_el_primer_campo_de_la_config():
+    # Como en la versión secuencial: "Nom1" de nombres_empresa se aplica antes que "Nom1-"
+    config = {"nombres_empresa": ["Nom1"], "codigos_especiales": ["Nom1-"]}
+    assert _aplicar(config, "Nom1-123") == ("[NOMBRES_EMPRESA_PROVEEDOR]-123", ["nombres_empresa"])
+    config = {"codigos_especiales": ["Nom1-"], "nombres_empresa": ["Nom1"]}
+    assert _aplicar(config, "Nom1-123") == ("[CIF]123", ["codigos_especiales"])
+
+
+def test_campos_del_mismo_tipo_con_prefijos_no_comparten_rama():
+    config = {"nombres_empresa": ["Nom1"], "direcciones": ["Nom1 Calle", "Mayor"]}
+    assert _aplicar(config, "Nom1 Calle Mayor")[0] == "[NOMBRES_EMPRESA_PROVEEDOR] Calle [DIRECCIONES_PROVEEDOR]"
+    config = {"nombres_empresa": ["Nom1 Calle"], "direcciones": ["Nom1", "Mayor"]}
+    assert _aplicar(config, "Nom1 Calle Mayor")[0] == "[NOMBRES_EMPRESA_PROVEEDOR] [DIRECCIONES_PROVEEDOR]"
+
+
+def test_sin_literales_devuelve_el_texto():
+    matcher = ProviderMatcher([])
+    assert matcher.size == 0
+    assert matcher.apply("texto", lambda campo: None) == "texto"
+
+
+def test_indice_por_proveedor_y_global():
+    config = {
+        "_defaults": {"nombres_empresa": ["Oculto"]},
+        "acme": {"nombres_empresa": ["Acme"]},
+        "lopez": {"nombres_empresa": ["Lopez"]},
+    }
+    indice = ProviderMatcherIndex(lambda: config)
+    texto = "Acme Lopez Oculto"
+
+    assert indice.get("acme").apply(texto, lambda c: None) == "[NOMBRES_EMPRESA_PROVEEDOR] Lopez Oculto"
+    assert indice.get().apply(texto, lambda c: None) == "[NOMBRES_EMPRESA_PROVEEDOR] [NOMBRES_EMPRESA_PROVEEDOR] Oculto"
+    assert indice.get("desconocido").size == 0
+
+    config["acme"] = {"nombres_empresa": ["Acme Nueva"]}
+    assert indice.get("acme") is indice.get("acme")
+    indice.invalidate("acme")
+    assert indice.get("acme").apply("Acme Nueva", lambda c: None) == "[NOMBRES_EMPRESA_PROVEEDOR]"
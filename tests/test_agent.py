@@ -0,0 +1,31 @@
+import asyncio
+
+from app import agent
+from app.agent import ExtractionResult, extraer_en_streaming
+
+
+def test_streaming_no_deja_tareas_al_desconectarse(monkeypatch):
+    async def _preparar(texto, proveedor, anonymize, tipo, chunk_tokens, result, normalize=None):
+        result.tokens_peticiones = [10, 10]
+        return [[{"role": "user", "content": texto}]] * 2
+
+    async def _trozo(trozo, mensajes, semaforo, cola, result):
+        if trozo == 0:
+            await cola.put((0, {"codigo": "1"}))
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(agent, "_preparar_peticiones", _preparar)
+    monkeypatch.setattr(agent, "_stream_trozo", _trozo)
+
+    async def _cliente():
+        items = extraer_en_streaming("texto", tipo="documento", result=ExtractionResult())
+        assert await items.__anext__() == {"codigo": "1"}
+        # El generador queda esperando en la cola y el cliente se va
+        siguiente = asyncio.create_task(items.__anext__())
+        await asyncio.sleep(0.01)
+        siguiente.cancel()
+        await asyncio.gather(siguiente, return_exceptions=True)
+        await asyncio.sleep(0)
+        return asyncio.all_tasks() - {asyncio.current_task()}
+
+    assert asyncio.run(_cliente()) == set()
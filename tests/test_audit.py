@@ -0,0 +1,65 @@
+import gzip
+import multiprocessing
+import os
+import time
+
+from app import audit
+from app.audit import _FicheroRotativo
+
+
+def _lineas(directorio):
+    total = []
+    for nombre in sorted(os.listdir(directorio)):
+        ruta = os.path.join(directorio, nombre)
+        if nombre.endswith(".gz"):
+            with gzip.open(ruta, "rt", encoding="utf-8") as f:
+                total.extend(f.read().splitlines())
+        elif nombre.endswith(".jsonl"):
+            with open(ruta, encoding="utf-8") as f:
+                total.extend(f.read().splitlines())
+    return total
+
+
+def _worker(path, worker, lotes):
+    fichero = _FicheroRotativo(path)
+    for lote in range(lotes):
+        fichero.escribir([f"{worker}-{lote}-{i}\n" for i in range(5)])
+    fichero.cerrar()
+
+
+def test_workers_que_comparten_fichero_no_pierden_lineas(tmp_path, monkeypatch):
+    monkeypatch.setattr(audit, "AUDIT_MAX_BYTES", 2000)
+    monkeypatch.setattr(audit, "AUDIT_BACKUPS", 1000)
+    path = str(tmp_path / "audit.jsonl")
+
+    contexto = multiprocessing.get_context("fork")
+    procesos = [contexto.Process(target=_worker, args=(path, w, 200)) for w in range(4)]
+    for p in procesos:
+        p.start()
+    for p in procesos:
+        p.join(30)
+        assert p.exitcode == 0
+
+    lineas = _lineas(tmp_path)
+    assert sorted(lineas) == sorted(f"{w}-{l}-{i}" for w in range(4) for l in range(200) for i in range(5))
+    assert any(nombre.endswith(".gz") for nombre in os.listdir(tmp_path))
+
+
+def test_rota_por_la_antiguedad_del_fichero_y_no_del_handle(tmp_path, monkeypatch):
+    monkeypatch.setattr(audit, "AUDIT_ROTATE_SECONDS", 0.2)
+    path = str(tmp_path / "audit.jsonl")
+
+    primero = _FicheroRotativo(path)
+    assert not primero.escribir(["a\n"])
+    time.sleep(0.3)
+    # Un worker que abre ahora el fichero ya lo encuentra viejo
+    segundo = _FicheroRotativo(path)
+    assert segundo.escribir(["b\n"])
+    # El primero ve que el fichero se rotó y escribe en el nuevo, que aún es joven
+    assert not primero.escribir(["c\n"])
+    primero.cerrar()
+    segundo.cerrar()
+
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == "c\n"
+    assert sorted(_lineas(tmp_path)) == ["a", "b", "c"]
@@ -0,0 +1,48 @@
+from app import agent
+from app.chunking import FusionResultados, dividir_en_chunks, fusionar_resultados
+from app.token_budget import get_encoding
+
+ENCODING = get_encoding("gpt-4o")
+
+
+def test_por_defecto_solo_se_trocea_si_no_cabe():
+    assert agent.CHUNK_TOKENS == {"documento": 0, "dades_venda": 0}
+
+
+def test_trozos_por_lineas_sin_solape():
+    lineas = [f"{i:06d} Cable 2,5mm L{i} 17/09/2026 {i % 40} 324,20 €" for i in range(200)]
+    texto = "\n".join(lineas)
+
+    chunks = dividir_en_chunks(texto, 300, ENCODING)
+
+    assert len(chunks) > 1
+    assert all(len(ENCODING.encode(chunk)) <= 300 for chunk in chunks)
+    assert "\n".join(chunks).split("\n") == lineas
+
+
+def test_linea_repetida_de_verdad_en_dos_trozos_se_conserva():
+    # El mismo producto en la primera y en la última página de un albarán largo
+    repetida = "995954 Cable 2,5mm L1511 17/09/2026 251 324,20 €"
+    lineas = [repetida] + [f"{i:06d} Tubo corrugado 20mm L{i} {i % 40}" for i in range(150)] + [repetida]
+    chunks = dividir_en_chunks("\n".join(lineas), 300, ENCODING)
+    assert repetida in chunks[0] and repetida in chunks[-1] and len(chunks) > 1
+
+    # Lo que devolvería el modelo para cada trozo: una fila por línea del trozo
+    item_repetido = {"codigo": "995954", "lote": "L1511", "unidades": 251}
+    respuestas = [
+        [item_repetido if linea == repetida else {"codigo": linea.split()[0]} for linea in chunk.split("\n")]
+        for chunk in chunks
+    ]
+
+    items = fusionar_resultados(respuestas)
+
+    assert items.count(item_repetido) == 2
+    assert len(items) == len(lineas)
+
+
+def test_fusion_en_streaming_conserva_el_orden_de_llegada():
+    fusion = FusionResultados()
+    assert fusion.add(1, {"codigo": "2"})
+    assert fusion.add(0, {"codigo": "1"})
+    assert fusion.add(0, {"codigo": "1"})
+    assert fusion.items == [{"codigo": "2"}, {"codigo": "1"}, {"codigo": "1"}]
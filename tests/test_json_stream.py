@@ -0,0 +1,54 @@
+import json
+
+from app.json_stream import JSONArrayStreamParser
+
+ITEMS = [
+    {"codigo": "100", "descripcion": "Tornillo {M6} \"inox\"", "unidades": 6},
+    {"codigo": "200", "descripcion": "Llave [12]\\\\ mm", "lote": None, "extra": {"a": [1, 2]}},
+    {"codigo": "300", "descripcion": "Caña ñ €", "unidades": 0},
+]
+RESPUESTA = "```json\n" + json.dumps(ITEMS, ensure_ascii=False, indent=2) + "\n```"
+
+
+def _alimentar(texto: str, tamano: int):
+    parser = JSONArrayStreamParser()
+    objetos = []
+    for i in range(0, len(texto), tamano):
+        objetos.extend(parser.feed(texto[i:i + tamano]))
+    return parser, objetos
+
+
+def test_cualquier_particion_da_los_mismos_objetos():
+    for tamano in (1, 2, 3, 7, 64, len(RESPUESTA)):
+        parser, objetos = _alimentar(RESPUESTA, tamano)
+        assert objetos == ITEMS
+        assert parser.completo
+        assert parser.descartados == 0
+
+
+def test_cada_objeto_sale_en_cuanto_se_cierra():
+    parser = JSONArrayStreamParser()
+    assert parser.feed('[{"codigo": "1"}, {"codigo": ') == [{"codigo": "1"}]
+    assert parser.feed('"2"') == []
+    assert parser.feed("}") == [{"codigo": "2"}]
+    assert not parser.completo
+    assert parser.feed("]") == []
+    assert parser.completo
+
+
+def test_elementos_invalidos_o_que_no_son_objetos_se_descartan():
+    parser, objetos = _alimentar('[{"a": 1}, [1, 2], {"b": tru}, 5, {"c": 3}]', 1)
+    assert objetos == [{"a": 1}, {"c": 3}]
+    assert parser.descartados == 2
+
+
+def test_texto_despues_del_array_se_ignora():
+    parser, objetos = _alimentar('Aquí tienes: [{"a": 1}] y además [{"b": 2}]', 4)
+    assert objetos == [{"a": 1}]
+    assert parser.completo
+
+
+def test_respuesta_sin_array():
+    parser, objetos = _alimentar("No hay productos en el documento.", 5)
+    assert objetos == []
+    assert not parser.completo
@@ -0,0 +1,225 @@
+import asyncio
+
+import openai
+import pytest
+
+from app import llm_scheduler
+from app.llm_scheduler import (
+    PRIORIDAD_INTERACTIVA, PRIORIDAD_LOTE, LLMSaturado, LLMScheduler, TokenBucket, _reintentable, _retry_after,
+    prioridad_actual, prioridad_llm,
+)
+
+
+@pytest.fixture(autouse=True)
+def _backoff_corto(monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "LLM_RETRY_BASE_SECONDS", 0.001)
+
+
+def _limite(headers=None, code=None):
+    return openai.error.RateLimitError("Rate limit", http_status=429, headers=headers or {}, code=code)
+
+
+def test_token_bucket():
+    cubo = TokenBucket(60)  # una unidad por segundo
+    ahora = cubo._ultimo
+    assert cubo.espera(60, ahora) == 0
+    cubo.consumir(60)
+    assert cubo.espera(1, ahora) == pytest.approx(1.0)
+    assert cubo.espera(1, ahora + 1) == pytest.approx(0.0)
+    # Una llamada mayor que el cubo sale cuando está lleno
+    assert cubo.espera(1000, ahora + 1) == pytest.approx(59.0)
+    cubo.devolver(30)
+    assert cubo.espera(31, ahora + 1) == pytest.approx(0.0)
+    cubo.vaciar(ahora + 1)
+    assert cubo.espera(1, ahora + 1) == pytest.approx(1.0)
+    assert TokenBucket(0).espera(10 ** 9, ahora) == 0
+
+
+def test_retry_after():
+    assert _retry_after(_limite({"retry-after-ms": "1500", "retry-after": "9"})) == 1.5
+    assert _retry_after(_limite({"retry-after": "3"})) == 3.0
+    assert _retry_after(_limite({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+    assert _retry_after(_limite({"retry-after": "pronto"})) is None
+    assert _retry_after(ValueError()) is None
+
+
+def test_reintentable():
+    assert _reintentable(_limite())
+    assert not _reintentable(_limite(code="insufficient_quota"))
+    assert _reintentable(openai.error.ServiceUnavailableError("caído"))
+    assert _reintentable(openai.error.Timeout("lento"))
+    assert _reintentable(openai.error.APIError("error", http_status=502))
+    assert not _reintentable(openai.error.APIError("error", http_status=400))
+    assert not _reintentable(openai.error.InvalidRequestError("mal", param=None))
+
+
+def test_interactivas_adelantan_a_los_lotes():
+    async def _prueba():
+        scheduler = LLMScheduler(max_concurrency=1, rpm=0, tpm=0)
+        orden = []
+        bloqueo = asyncio.Event()
+
+        async def _llamada(nombre):
+            orden.append(nombre)
+            if nombre == "primera":
+                await bloqueo.wait()
+
+        async def _lanzar(nombre, prioridad):
+            await scheduler.ejecutar(lambda: _llamada(nombre), 10, prioridad)
+
+        tareas = [asyncio.create_task(_lanzar("primera", PRIORIDAD_LOTE))]
+        await asyncio.sleep(0)
+        for i in range(2):
+            tareas.append(asyncio.create_task(_lanzar(f"lote{i}", PRIORIDAD_LOTE)))
+            tareas.append(asyncio.create_task(_lanzar(f"interactiva{i}", PRIORIDAD_INTERACTIVA)))
+        await asyncio.sleep(0.01)
+        assert scheduler.pendientes(PRIORIDAD_LOTE) == 2 and scheduler.pendientes(PRIORIDAD_INTERACTIVA) == 2
+        bloqueo.set()
+        await asyncio.gather(*tareas)
+        return orden, scheduler
+
+    orden, scheduler = asyncio.run(_prueba())
+    assert orden == ["primera", "interactiva0", "interactiva1", "lote0", "lote1"]
+    assert scheduler.en_curso == 0
+
+
+def test_prioridad_desde_el_contexto():
+    async def _prueba():
+        scheduler = LLMScheduler(max_concurrency=1)
+        vistas = []
+
+        async def _llamada():
+            vistas.append(prioridad_actual())
+
+        with prioridad_llm(PRIORIDAD_LOTE):
+            await scheduler.ejecutar(_llamada, 1)
+        await scheduler.ejecutar(_llamada, 1)
+        return vistas
+
+    assert asyncio.run(_prueba()) == [PRIORIDAD_LOTE, PRIORIDAD_INTERACTIVA]
+
+
+def test_limite_por_minuto_espacia_las_llamadas():
+    async def _prueba():
+        # 600/min = una cada 0.1 s una vez gastado el cubo
+        scheduler = LLMScheduler(max_concurrency=10, rpm=600, tpm=0)
+        scheduler._rpm.disponible = 1
+        loop = asyncio.get_running_loop()
+        inicio = loop.time()
+        instantes = []
+
+        async def _llamada():
+            instantes.append(loop.time() - inicio)
+
+        await asyncio.gather(*(scheduler.ejecutar(_llamada, 1) for _ in range(4)))
+        return instantes
+
+    instantes = asyncio.run(_prueba())
+    assert instantes[0] < 0.05
+    assert instantes[-1] == pytest.approx(0.3, abs=0.08)
+
+
+def test_429_pausa_reintenta_y_aprende_los_limites():
+    async def _prueba():
+        scheduler = LLMScheduler(max_concurrency=2, rpm=0, tpm=0, max_retries=3)
+        intentos = []
+
+        async def _llamada():
+            intentos.append(1)
+            if len(intentos) == 1:
+                raise _limite({"retry-after-ms": "20", "x-ratelimit-limit-requests": "600",
+                               "x-ratelimit-limit-tokens": "0"})
+            return "ok"
+
+        return await scheduler.ejecutar(_llamada, 10), intentos, scheduler.stats()
+
+    resultado, intentos, stats = asyncio.run(_prueba())
+    assert resultado == "ok"
+    assert len(intentos) == 2
+    # Un límite 0 en la cabecera no se toma como límite
+    assert stats["rpm"] == 600 and stats["tpm"] == 0
+    assert stats["reintentos"] == 1 and stats["en_curso"] == 0
+
+
+def test_429_persistente_acaba_en_llm_saturado():
+    async def _prueba():
+        scheduler = LLMScheduler(max_concurrency=1, max_retries=2)
+
+        async def _llamada():
+            raise _limite({"retry-after-ms": "5"})
+
+        with pytest.raises(LLMSaturado) as error:
+            await scheduler.ejecutar(_llamada, 10)
+        return error.value, scheduler
+
+    error, scheduler = asyncio.run(_prueba())
+    assert error.retry_after == pytest.approx(0.005)
+    assert scheduler.reintentos == 2 and scheduler.saturadas == 1 and scheduler.en_curso == 0
+
+
+def test_error_no_reintentable_se_propaga_y_libera():
+    async def _prueba():
+        scheduler = LLMScheduler(max_concurrency=1)
+        intentos = []
+
+        async def _llamada():
+            intentos.append(1)
+            raise openai.error.InvalidRequestError("prompt demasiado largo", param=None)
+
+        with pytest.raises(openai.error.InvalidRequestError):
+            await scheduler.ejecutar(_llamada, 10)
+        return intentos, scheduler
+
+    intentos, scheduler = asyncio.run(_prueba())
+    assert len(intentos) == 1 and scheduler.en_curso == 0
+
+
+def test_espera_maxima_en_cola_solo_para_interactivas():
+    async def _prueba():
+        scheduler = LLMScheduler(max_concurrency=1, queue_timeout=0.02)
+        bloqueo = asyncio.Event()
+
+        async def _ocupar():
+            await bloqueo.wait()
+
+        ocupada = asyncio.create_task(scheduler.ejecutar(_ocupar, 1))
+        await asyncio.sleep(0)
+        with pytest.raises(LLMSaturado):
+            await scheduler.ejecutar(lambda: asyncio.sleep(0), 1, PRIORIDAD_INTERACTIVA)
+        lote = asyncio.create_task(scheduler.ejecutar(lambda: asyncio.sleep(0, "lote"), 1, PRIORIDAD_LOTE))
+        await asyncio.sleep(0.05)
+        assert not lote.done()
+        bloqueo.set()
+        await ocupada
+        return await lote, scheduler
+
+    resultado, scheduler = asyncio.run(_prueba())
+    assert resultado == "lote"
+    assert scheduler.saturadas == 1 and scheduler.pendientes() == 0
+
+
+def test_cancelacion_libera_el_hueco():
+    async def _prueba():
+        scheduler = LLMScheduler(max_concurrency=1)
+
+        tarea = asyncio.create_task(scheduler.ejecutar(lambda: asyncio.sleep(3600), 1))
+        await asyncio.sleep(0.01)
+        assert scheduler.en_curso == 1
+        tarea.cancel()
+        await asyncio.gather(tarea, return_exceptions=True)
+        en_curso = scheduler.en_curso
+        return en_curso, await scheduler.ejecutar(lambda: asyncio.sleep(0, "siguiente"), 1)
+
+    assert asyncio.run(_prueba()) == (0, "siguiente")
+
+
+def test_abrir_mantiene_el_hueco_hasta_liberar():
+    async def _prueba():
+        scheduler = LLMScheduler(max_concurrency=1)
+        resultado, liberar = await scheduler.abrir(lambda: asyncio.sleep(0, "stream"), 1)
+        ocupado = scheduler.en_curso
+        liberar()
+        liberar()
+        return resultado, ocupado, scheduler.en_curso
+
+    assert asyncio.run(_prueba()) == ("stream", 1, 0)
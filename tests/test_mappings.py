@@ -0,0 +1,79 @@
+import io
+import json
+import os
+import time
+
+from openpyxl import Workbook
+
+from app.mappings import MappingEngine
+from app.uploads import UploadedDocument
+
+XML = b"""<albaran>
+  <cabecera><item>no es fila</item></cabecera>
+  <lineas>
+    <item lote="L1"><codigo>100</codigo><unidades>1.000</unidades></item>
+    <item lote="L2"><codigo>200</codigo><unidades>6</unidades></item>
+    <item lote="L3"><unidades>7</unidades></item>
+  </lineas>
+</albaran>"""
+
+
+def _motor(tmp_path, mapeos, reload_interval=0.0):
+    path = tmp_path / "mappings.json"
+    path.write_text(json.dumps({"acme": {"documento": mapeos}}), encoding="utf-8")
+    return MappingEngine(str(path), reload_interval=reload_interval), path
+
+
+def _mapeo_xml(filas):
+    return {
+        "nombre": f"xml {filas}", "formato": "xml", "filas": filas,
+        "campos": {"codigo": "codigo", "lote": "@lote", "unidades": "unidades"},
+        "tipos": {"unidades": "int"},
+    }
+
+
+def _doc(filename, data):
+    return UploadedDocument(filename, os.path.splitext(filename)[1], "", len(data), data=data)
+
+
+def test_xml_en_streaming(tmp_path):
+    motor, _ = _motor(tmp_path, [_mapeo_xml("lineas/item")])
+    assert motor.extraer(_doc("a.xml", XML), "documento", "acme") == [
+        {"codigo": "100", "lote": "L1", "unidades": 1000},
+        {"codigo": "200", "lote": "L2", "unidades": 6},
+    ]
+
+
+def test_xml_con_predicado_usa_el_arbol_completo(tmp_path):
+    motor, _ = _motor(tmp_path, [_mapeo_xml("lineas/item[@lote='L2']")])
+    assert motor.extraer(_doc("a.xml", XML), "documento", "acme") == [{"codigo": "200", "lote": "L2", "unidades": 6}]
+
+
+def test_xml_gana_el_primer_mapeo_con_items(tmp_path):
+    motor, _ = _motor(tmp_path, [_mapeo_xml("otras/item"), _mapeo_xml(".//item")])
+    # La fila de la cabecera no tiene código: el mapeo la descarta
+    assert [item["codigo"] for item in motor.extraer(_doc("a.xml", XML), "documento", "acme")] == ["100", "200"]
+
+
+def test_formato_por_contenido_y_no_por_extension(tmp_path):
+    libro = Workbook()
+    libro.active.append(["Código", "Unidades"])
+    libro.active.append(["100", 3])
+    datos = io.BytesIO()
+    libro.save(datos)
+    mapeo = {"formato": "tabla", "campos": {"codigo": "Código", "unidades": "Unidades"}, "tipos": {"unidades": "int"}}
+    motor, _ = _motor(tmp_path, [mapeo])
+
+    # Un Excel exportado con extensión .csv
+    assert motor.extraer(_doc("export.csv", datos.getvalue()), "documento", "acme") == [{"codigo": "100", "unidades": 3}]
+    assert motor.extraer(_doc("notas.txt", XML), "documento", "acme") is None
+
+
+def test_recarga_al_cambiar_el_fichero(tmp_path):
+    motor, path = _motor(tmp_path, [_mapeo_xml("otras/item")], reload_interval=0.001)
+    assert motor.extraer(_doc("a.xml", XML), "documento", "acme") is None
+
+    path.write_text(json.dumps({"acme": {"documento": [_mapeo_xml("lineas/item")]}}), encoding="utf-8")
+    os.utime(path, ns=(0, 1))
+    time.sleep(0.01)
+    assert len(motor.extraer(_doc("a.xml", XML), "documento", "acme")) == 2
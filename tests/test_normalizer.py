@@ -0,0 +1,62 @@
+import random
+
+from app.normalizer import SEPARADOR_PAGINA, NormalizationStats, normalizar_texto
+
+
+def _pagina(numero: int, total: int, filas) -> str:
+    return "\n".join([
+        "SUMINISTROS ELÉCTRICOS DEL VALLÈS S.L.",
+        "CIF B12345678 - Tel. 93 123 45 67",
+        f"Albarán de entrega - Página {numero} de {total}",
+        "",
+        *filas,
+        "",
+        "Gracias por su confianza",
+    ])
+
+
+def _fila(rng: random.Random) -> str:
+    return (f"{rng.randint(100000, 999999)} Cable 2,5mm L{rng.randint(1000, 9999)} 17/09/2026 "
+            f"{rng.randint(1, 400)} {rng.randint(1, 999)},{rng.randint(10, 99)} €")
+
+
+def test_filas_casi_iguales_en_el_borde_de_pagina_se_conservan():
+    rng = random.Random(7)
+    paginas = [[_fila(rng) for _ in range(10)] for _ in range(4)]
+    texto = SEPARADOR_PAGINA.join(_pagina(i + 1, 4, filas) for i, filas in enumerate(paginas))
+
+    resultado = normalizar_texto(texto).split("\n")
+
+    for filas in paginas:
+        for fila in filas:
+            assert fila in resultado
+
+
+def test_cabeceras_y_pies_repetidos_se_quitan_salvo_la_primera_vez():
+    rng = random.Random(3)
+    texto = SEPARADOR_PAGINA.join(_pagina(i + 1, 3, [_fila(rng)]) for i in range(3))
+    stats = NormalizationStats()
+
+    resultado = normalizar_texto(texto, stats).split("\n")
+
+    assert resultado.count("SUMINISTROS ELÉCTRICOS DEL VALLÈS S.L.") == 1
+    assert resultado.count("CIF B12345678 - Tel. 93 123 45 67") == 1
+    assert resultado.count("Gracias por su confianza") == 1
+    # Solo cambia el número de página: también es cabecera
+    assert sum(l.startswith("Albarán de entrega") for l in resultado) == 1
+    assert stats.lineas_repetidas == 8
+
+
+def test_filas_de_datos_identicas_no_se_toman_por_cabecera():
+    fila = "995954\tCable 2,5mm\t251\t324,20 €"
+    texto = SEPARADOR_PAGINA.join(f"Cabecera\n{fila}\nPie" for _ in range(3))
+
+    assert normalizar_texto(texto).split("\n").count(fila) == 3
+
+
+def test_boilerplate_y_espacios():
+    texto = "Línea   con    espacios\n\n\n\n- 2 -\n-----------\nPágina 2 de 5\nFin"
+    stats = NormalizationStats()
+
+    assert normalizar_texto(texto, stats) == "Línea  con  espacios\n\nFin"
+    assert stats.lineas_boilerplate == 3
@@ -0,0 +1,48 @@
+from PIL import Image
+
+from app import ocr
+from app.ocr import OCREngine, OCRPasada, detectar_idioma
+
+
+def test_texto_en_espanol_no_suma_catalan():
+    texto = "Albarán de entrega de la mercancía. Fecha de la entrega: que el cliente del pedido"
+    assert detectar_idioma(texto) == "spa"
+
+
+def test_idiomas_detectados():
+    assert detectar_idioma("Albarà de lliurament de la mercaderia. Data: els unitats amb preu") == "cat"
+    assert detectar_idioma("Albarán / Albarà. Fecha / Data. Cantidad / Quantitat") == "spa+cat"
+    assert detectar_idioma("Delivery note: date of the order and price for the units") == "eng"
+    assert detectar_idioma("1234 5678") == ocr.OCR_IDIOMA_INICIAL
+
+
+def _motor(monkeypatch, confianza: float, texto: str):
+    idiomas = []
+
+    def _pasada(self, imagen, idioma, dpi, pagina):
+        idiomas.append(idioma)
+        pagina.pasadas.append(OCRPasada(dpi, idioma, 0.0, confianza, 30.0))
+        return texto
+
+    monkeypatch.setattr(OCREngine, "_pasada", _pasada)
+    monkeypatch.setattr(ocr, "preprocesar", lambda imagen: (imagen, 0.0))
+    return OCREngine(), idiomas
+
+
+def test_pagina_con_idioma_conocido_no_lo_detecta(monkeypatch):
+    motor, idiomas = _motor(monkeypatch, confianza=40, texto="Albarà de lliurament amb preu i quantitat")
+
+    pagina = motor.reconocer_pagina(lambda dpi: Image.new("L", (10, 10)), 2, "cat")
+
+    # Poca confianza: se repite a más DPI, pero con el idioma recibido y sin pasada de detección
+    assert idiomas == ["cat", "cat"]
+    assert pagina.idioma == "cat"
+
+
+def test_pagina_sin_idioma_lo_detecta_una_vez(monkeypatch):
+    motor, idiomas = _motor(monkeypatch, confianza=40, texto="Albarà de lliurament amb preu i quantitat")
+
+    pagina = motor.reconocer_pagina(lambda dpi: Image.new("L", (10, 10)))
+
+    assert idiomas == [ocr.OCR_IDIOMA_INICIAL, "cat", "cat"]
+    assert pagina.idioma == "cat"
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from app.llm_scheduler import PRIORIDAD_INTERACTIVA, PRIORIDAD_LOTE, prioridad_actual, prioridad_llm
+from app.singleflight import SingleFlight
+
+
+def _ejecutar(corutina):
+    return asyncio.run(corutina)
+
+
+def test_peticiones_iguales_comparten_una_ejecucion():
+    async def _prueba():
+        vuelos = SingleFlight("prueba")
+        llamadas = []
+
+        async def _fabrica():
+            llamadas.append(1)
+            await asyncio.sleep(0.01)
+            return {"items": [1]}
+
+        resultados = await asyncio.gather(*(vuelos.ejecutar("a", _fabrica) for _ in range(5)))
+        otra = await vuelos.ejecutar("b", _fabrica)
+        return vuelos, llamadas, resultados, otra
+
+    vuelos, llamadas, resultados, otra = _ejecutar(_prueba())
+    assert len(llamadas) == 2
+    assert all(r is resultados[0] for r in resultados)
+    assert otra == {"items": [1]}
+    assert vuelos.stats() == {"en_curso": 0, "ejecuciones": 2, "coalescidas": 4, "canceladas": 0}
+
+
+def test_al_terminar_la_clave_vuelve_a_ejecutarse():
+    async def _prueba():
+        vuelos = SingleFlight("prueba")
+        llamadas = []
+
+        async def _fabrica():
+            llamadas.append(1)
+            return len(llamadas)
+
+        return [await vuelos.ejecutar("a", _fabrica) for _ in range(3)]
+
+    assert _ejecutar(_prueba()) == [1, 2, 3]
+
+
+def test_el_error_llega_a_todos_los_que_esperan():
+    async def _prueba():
+        vuelos = SingleFlight("prueba")
+
+        async def _fabrica():
+            await asyncio.sleep(0.01)
+            raise ValueError("documento ilegible")
+
+        return vuelos, await asyncio.gather(*(vuelos.ejecutar("a", _fabrica) for _ in range(3)), return_exceptions=True)
+
+    vuelos, resultados = _ejecutar(_prueba())
+    assert [str(r) for r in resultados] == ["documento ilegible"] * 3
+    assert vuelos.stats()["en_curso"] == 0
+
+
+def test_un_cliente_que_se_va_no_cancela_a_los_demas():
+    async def _prueba():
+        vuelos = SingleFlight("prueba", cancelar_huerfanas=True)
+
+        async def _fabrica():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        primero = asyncio.create_task(vuelos.ejecutar("a", _fabrica))
+        segundo = asyncio.create_task(vuelos.ejecutar("a", _fabrica))
+        await asyncio.sleep(0.01)
+        primero.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await primero
+        return vuelos, await segundo
+
+    vuelos, resultado = _ejecutar(_prueba())
+    assert resultado == "ok"
+    assert vuelos.canceladas == 0
+
+
+@pytest.mark.parametrize("cancelar_huerfanas, cancelada", [(True, True), (False, False)])
+def test_ejecucion_sin_clientes(cancelar_huerfanas, cancelada):
+    async def _prueba():
+        vuelos = SingleFlight("prueba", cancelar_huerfanas=cancelar_huerfanas)
+        terminada = asyncio.Event()
+
+        async def _fabrica():
+            await asyncio.sleep(0.02)
+            terminada.set()
+            return "ok"
+
+        cliente = asyncio.create_task(vuelos.ejecutar("a", _fabrica))
+        await asyncio.sleep(0.005)
+        cliente.cancel()
+        await asyncio.gather(cliente, return_exceptions=True)
+        await asyncio.sleep(0.05)
+        return vuelos, terminada.is_set()
+
+    vuelos, terminada = _ejecutar(_prueba())
+    assert terminada is not cancelada
+    assert vuelos.canceladas == int(cancelada)
+    assert vuelos.stats()["en_curso"] == 0
+
+
+def test_una_peticion_interactiva_no_hereda_la_prioridad_de_un_lote():
+    async def _prueba():
+        vuelos = SingleFlight("prueba")
+        prioridades = []
+
+        async def _fabrica():
+            prioridades.append(prioridad_actual())
+            await asyncio.sleep(0.02)
+            return prioridad_actual()
+
+        async def _lote():
+            with prioridad_llm(PRIORIDAD_LOTE):
+                return await vuelos.ejecutar("a", _fabrica)
+
+        lote = asyncio.create_task(_lote())
+        await asyncio.sleep(0.005)
+        interactiva = await vuelos.ejecutar("a", _fabrica)
+        return vuelos, prioridades, await lote, interactiva
+
+    vuelos, prioridades, lote, interactiva = _ejecutar(_prueba())
+    # Cada una corre con su prioridad: la interactiva no espera en la cola de los lotes
+    assert (lote, interactiva) == (PRIORIDAD_LOTE, PRIORIDAD_INTERACTIVA)
+    assert sorted(prioridades) == [PRIORIDAD_INTERACTIVA, PRIORIDAD_LOTE]
+    assert vuelos.coalescidas == 0